@@ -18,7 +18,57 @@ def get_my_env_var(var_name: str) -> str:
         raise MissingEnvironmentVariable(f"{var_name} does not exist") from e
 
 
+def get_my_env_var_or_default(var_name: str, default: str) -> str:
+    return os.environ.get(var_name) or default
+
+
 BATCH_SIZE: int = 5000
+STATS_FLUSH_INTERVAL: float = float(get_my_env_var_or_default('STATS_FLUSH_INTERVAL', "5"))
+METRICS_FLUSH_INTERVAL: float = float(get_my_env_var_or_default('METRICS_FLUSH_INTERVAL', "30"))
+# Журнал сообщений (LOG_TABLE): сколько строк сообщения сохраняется, размер пачки, период записи (сек) и сжатие
+AUDIT_SAMPLE_ROWS: int = int(get_my_env_var_or_default('AUDIT_SAMPLE_ROWS', "100"))
+AUDIT_BATCH_SIZE: int = int(get_my_env_var_or_default('AUDIT_BATCH_SIZE', "1000"))
+AUDIT_FLUSH_INTERVAL: float = float(get_my_env_var_or_default('AUDIT_FLUSH_INTERVAL', "5"))
+AUDIT_COMPRESSION: str = get_my_env_var_or_default('AUDIT_COMPRESSION', "none")
+# Размер пачки подстраивается под каждую таблицу: BATCH_SIZE - начальное количество строк
+BATCH_MIN_ROWS: int = int(get_my_env_var_or_default('BATCH_MIN_ROWS', "500"))
+BATCH_MAX_ROWS: int = int(get_my_env_var_or_default('BATCH_MAX_ROWS', "50000"))
+BATCH_MAX_BYTES: int = int(get_my_env_var_or_default('BATCH_MAX_BYTES', str(64 * 1024 * 1024)))
+BATCH_MAX_LATENCY: float = float(get_my_env_var_or_default('BATCH_MAX_LATENCY', "10"))
+BATCH_TARGET_SECONDS: float = float(get_my_env_var_or_default('BATCH_TARGET_SECONDS', "2"))
+# "server" - старые версии сделок отменяются запросом INSERT ... SELECT в ClickHouse, "client" - через скрипт
+UPDATE_STATUS_MODE: str = get_my_env_var_or_default('UPDATE_STATUS_MODE', "server")
+# Сколько пачек может ждать записи в ClickHouse в фоне (0 - запись в потоке консьюмера)
+WRITER_QUEUE_SIZE: int = int(get_my_env_var_or_default('WRITER_QUEUE_SIZE', "2"))
+UPDATE_STATUS_CHUNK_SIZE: int = int(get_my_env_var_or_default('UPDATE_STATUS_CHUNK_SIZE', "1000"))
+# От стольких ключей сделок они загружаются во временную таблицу (0 - никогда)
+UPDATE_STATUS_KEYS_TABLE_MIN: int = int(get_my_env_var_or_default('UPDATE_STATUS_KEYS_TABLE_MIN', "5000"))
+SCHEMA_CACHE_TTL: float = float(get_my_env_var_or_default('SCHEMA_CACHE_TTL', "300"))
+# Сообщения от стольких строк конвертируются по колонкам (0 - всегда построчно)
+COLUMNAR_MIN_ROWS: int = int(get_my_env_var_or_default('COLUMNAR_MIN_ROWS', "1000"))
+JSON_BACKEND: str = get_my_env_var_or_default('JSON_BACKEND', "auto")
+JSON_STREAM_MIN_BYTES: int = int(get_my_env_var_or_default('JSON_STREAM_MIN_BYTES', "67108864"))
+JSON_STREAM_CHUNK_ROWS: int = int(get_my_env_var_or_default('JSON_STREAM_CHUNK_ROWS', "10000"))
+ROUTE_PREFIX_BYTES: int = int(get_my_env_var_or_default('ROUTE_PREFIX_BYTES', "65536"))
+# Поля заголовка сообщения, которые продюсер может передать в AMQP headers
+ROUTE_HEADERS: tuple = ("report", "key_id", "is_truncate")
+CONSUMER_MODE: str = get_my_env_var_or_default('CONSUMER_MODE', "consume")  # consume (push) или get (pull)
+WORKER_PROCESSES: int = int(get_my_env_var_or_default('WORKER_PROCESSES', str(os.cpu_count() or 1)))
+# Сколько раз подряд supervisor перезапускает упавший процесс, прежде чем отказаться от его очередей
+WORKER_MAX_RESTARTS: int = int(get_my_env_var_or_default('WORKER_MAX_RESTARTS', "5"))
+MAX_CONCURRENT_QUEUES: int = int(get_my_env_var_or_default('MAX_CONCURRENT_QUEUES', "10"))
+STATS_REPORT_INTERVAL: float = float(get_my_env_var_or_default('STATS_REPORT_INTERVAL', "60"))
+RABBITMQ_CONNECTIONS: int = int(get_my_env_var_or_default('RABBITMQ_CONNECTIONS', "10"))
+# Окно prefetch подбирается под пачки таблицы: не меньше PREFETCH_COUNT и не больше PREFETCH_MAX_COUNT сообщений
+PREFETCH_COUNT: int = int(get_my_env_var_or_default('PREFETCH_COUNT', "100"))
+PREFETCH_MAX_COUNT: int = min(int(get_my_env_var_or_default('PREFETCH_MAX_COUNT', "10000")), 65535)
+MESSAGE_SIZE_SMOOTHING: float = 0.1
+CONSUMER_INACTIVITY_TIMEOUT: float = float(get_my_env_var_or_default('CONSUMER_INACTIVITY_TIMEOUT', "1"))
+POLL_MIN_DELAY: float = float(get_my_env_var_or_default('POLL_MIN_DELAY', "1"))
+POLL_MAX_DELAY: float = float(get_my_env_var_or_default('POLL_MAX_DELAY', "60"))
+TURN_MAX_ROWS: int = int(get_my_env_var_or_default('TURN_MAX_ROWS', "50000"))
+TURN_MAX_SECONDS: float = float(get_my_env_var_or_default('TURN_MAX_SECONDS', "30"))
+QUEUE_DEPTH_PROBE_INTERVAL: float = float(get_my_env_var_or_default('QUEUE_DEPTH_PROBE_INTERVAL', "5"))
 DATE_FTM: str = "%d/%B/%Y %H:%M:%S"
 LOG_FORMAT: str = "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
 LOG_DIR_NAME: str = f"{get_my_env_var('XL_IDP_ROOT_RABBITMQ')}/logging"
@@ -34,11 +84,20 @@ with open(f"{get_my_env_var('XL_IDP_ROOT_RABBITMQ')}/config/tables_config.json",
     TABLE_NAMES: dict = json.load(file)
 
 
+# У каждого процесса supervisor свои файлы логов, иначе процессы ротируют один и тот же файл
+LOG_NAME_SUFFIX: str = ""
+
+
+def set_log_name_suffix(suffix: str) -> None:
+    global LOG_NAME_SUFFIX
+    LOG_NAME_SUFFIX = suffix
+
+
 def get_file_handler(name: str) -> logging.FileHandler:
     if not os.path.exists(LOG_DIR_NAME):
         os.mkdir(LOG_DIR_NAME)
     file_handler = RotatingFileHandler(
-        filename=f"{LOG_DIR_NAME}/{name}.log",
+        filename=f"{LOG_DIR_NAME}/{name}{LOG_NAME_SUFFIX}.log",
         mode='a',
         maxBytes=20 * pow(1024, 2),
         backupCount=3
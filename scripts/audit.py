@@ -0,0 +1,135 @@
+import logging
+import threading
+import time as time_
+from clickhouse_connect.driver import Client
+from typing import Callable, List, Optional
+from scripts.__init__ import LOG_TABLE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL
+
+AUDIT_COLUMNS: List[str] = ["database", "table", "queue", "key_id", "datetime", "is_success", "message"]
+
+
+class AuditLog:
+    def __init__(
+        self,
+        get_client: Callable[[], Client],
+        get_logger: Callable[[], logging.Logger],
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL
+    ):
+        self.get_client: Callable[[], Client] = get_client
+        self.client: Optional[Client] = None
+        # Логгер запрашивается при каждой записи: журнал общий для всех обработчиков, а логгер меняется каждый день
+        self.get_logger: Callable[[], logging.Logger] = get_logger
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.records: List[list] = []
+        self.condition: threading.Condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.is_flush_requested: bool = False
+        self.is_closed: bool = False
+
+    def add(self, record: list, is_urgent: bool = False) -> None:
+        """
+        Adds the record to the audit log.
+
+        The records are written by a background thread every flush_interval seconds,
+        as soon as batch_size records are collected, or right away if the record is urgent.
+
+        :param record: The values of AUDIT_COLUMNS.
+        :param is_urgent: Whether the record must be written without waiting for the batch.
+        :return: None
+        """
+        with self.condition:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                self.thread.start()
+            self.records.append(record)
+            if is_urgent or len(self.records) >= self.batch_size:
+                self.is_flush_requested = True
+                self.condition.notify()
+
+    def flush(self) -> None:
+        """
+        Asks the background thread to write the collected records without waiting for the batch.
+
+        :return: None
+        """
+        with self.condition:
+            if self.records:
+                self.is_flush_requested = True
+                self.condition.notify()
+
+    def _run(self) -> None:
+        """
+        Writes the collected records until the audit log is closed.
+
+        If the records cannot be written, they are kept for the next attempt,
+        but no more than ten batches, the oldest ones are dropped.
+
+        :return: None
+        """
+        while True:
+            with self.condition:
+                deadline: float = time_.monotonic() + self.flush_interval
+                while not self.is_flush_requested and not self.is_closed and time_.monotonic() < deadline:
+                    self.condition.wait(timeout=max(deadline - time_.monotonic(), 0.0))
+                records, self.records = self.records, []
+                self.is_flush_requested = False
+                is_closed: bool = self.is_closed
+            if records:
+                self._write(records)
+            if is_closed:
+                return
+
+    def _write(self, records: List[list]) -> None:
+        """
+        Inserts the records into the log table.
+
+        :param records: The records to be inserted.
+        :return: None
+        """
+        try:
+            if self.client is None:
+                self.client = self.get_client()
+            self.client.insert(table=LOG_TABLE, database="DataCore", data=records, column_names=AUDIT_COLUMNS)
+        except Exception as ex:
+            self.get_logger().error(
+                f"Couldn't write {len(records)} records to the audit log: {ex}. Type error is {type(ex)}"
+            )
+            self.client = None
+            with self.condition:
+                self.records = (records + self.records)[-self.batch_size * 10:]
+
+    def close(self) -> None:
+        """
+        Writes the records left and stops the background thread.
+
+        :return: None
+        """
+        with self.condition:
+            self.is_closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+AUDIT_LOG: Optional[AuditLog] = None
+AUDIT_LOG_LOCK: threading.Lock = threading.Lock()
+
+
+def get_audit_log(get_client: Callable[[], Client], get_logger: Callable[[], logging.Logger]) -> AuditLog:
+    """
+    Returns the audit log shared by all the workers of the process.
+
+    :param get_client: Creates the ClickHouse client of the audit log.
+    :param get_logger: Returns the current logger of the errors of the audit log.
+    :return: The audit log.
+    """
+    global AUDIT_LOG
+    with AUDIT_LOG_LOCK:
+        if AUDIT_LOG is None:
+            AUDIT_LOG = AuditLog(get_client, get_logger)
+        return AUDIT_LOG
@@ -0,0 +1,71 @@
+import threading
+from typing import Dict, Tuple
+from scripts.__init__ import (
+    BATCH_SIZE, BATCH_MIN_ROWS, BATCH_MAX_ROWS, BATCH_MAX_BYTES, BATCH_MAX_LATENCY, BATCH_TARGET_SECONDS
+)
+
+
+class BatchPolicy:
+    def __init__(
+        self,
+        target_rows: int = BATCH_SIZE,
+        min_rows: int = BATCH_MIN_ROWS,
+        max_rows: int = BATCH_MAX_ROWS,
+        max_bytes: int = BATCH_MAX_BYTES,
+        max_latency: float = BATCH_MAX_LATENCY,
+        target_seconds: float = BATCH_TARGET_SECONDS
+    ):
+        self.target_rows: int = target_rows
+        self.min_rows: int = min_rows
+        self.max_rows: int = max_rows
+        self.max_bytes: int = max_bytes
+        self.max_latency: float = max_latency
+        self.target_seconds: float = target_seconds
+
+    def is_full(self, rows: int, size_bytes: int, age: float) -> bool:
+        """
+        Checks whether the batch must be flushed.
+
+        :param rows: The count of rows in the batch.
+        :param size_bytes: The approximate size of the batch in bytes.
+        :param age: The seconds passed since the first row was added to the batch.
+        :return: True if the batch has reached the target count of rows, the size or the age limit.
+        """
+        return rows >= self.target_rows or size_bytes >= self.max_bytes or age >= self.max_latency
+
+    def update(self, rows: int, seconds: float) -> None:
+        """
+        Tunes the target count of rows from the time the batch took to be written.
+
+        The target moves halfway to the count of rows that would be written in
+        target_seconds at the observed speed, within min_rows and max_rows.
+        Small batches, e.g. the last one of a queue, say little about the speed and are ignored.
+
+        :param rows: The count of rows written.
+        :param seconds: The seconds the batch took to be written.
+        :return: None
+        """
+        if rows < self.min_rows or seconds <= 0:
+            return
+        rows_in_target: float = self.target_seconds * rows / seconds
+        target_rows: float = (self.target_rows + rows_in_target) / 2
+        self.target_rows = int(min(max(target_rows, self.min_rows), self.max_rows))
+
+
+BATCH_POLICIES: Dict[Tuple[str, str], BatchPolicy] = {}
+BATCH_POLICIES_LOCK: threading.Lock = threading.Lock()
+
+
+def get_batch_policy(database: str, table: str) -> BatchPolicy:
+    """
+    Returns the batch policy of the table, shared by all the workers of the process.
+
+    :param database: The name of the database.
+    :param table: The name of the table.
+    :return: The batch policy.
+    """
+    policy: BatchPolicy = BATCH_POLICIES.get((database, table))
+    if policy is None:
+        with BATCH_POLICIES_LOCK:
+            policy = BATCH_POLICIES.setdefault((database, table), BatchPolicy())
+    return policy
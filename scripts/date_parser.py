@@ -0,0 +1,106 @@
+import re
+import pytz
+import contextlib
+from datetime import datetime, date
+from typing import Dict, Optional, Tuple, Union
+
+DATE_FORMATS: tuple = (
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%d.%m.%YT%H:%M:%SZ",
+    "%d.%m.%YT%H:%M:%S",
+    "%d.%m.%YT%H:%M:%S%z",
+    "%d.%m.%Y %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%d.%m.%Y",
+    "%Y-%m-%d"
+)
+# Формы дат, которые разбираются без strptime. Всё остальное идёт по DATE_FORMATS
+ISO_DATE: re.Pattern = re.compile(r'\d{4}-\d{2}-\d{2}')
+ISO_DATETIME: re.Pattern = re.compile(r'\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}:\d{2}Z?| \d{2}:\d{2}:\d{2})')
+DOTTED_DATE: re.Pattern = re.compile(r'\d{2}\.\d{2}\.\d{4}')
+DOTTED_DATETIME: re.Pattern = re.compile(r'\d{2}\.\d{2}\.\d{4}(?:T\d{2}:\d{2}:\d{2}Z?| \d{2}:\d{2}:\d{2})')
+
+
+class DateParser:
+    def __init__(self, date_formats: tuple = DATE_FORMATS, cache_size: int = 100000):
+        self.date_formats: tuple = date_formats
+        self.cache_size: int = cache_size
+        self.cache: Dict[Tuple[str, bool], Optional[Union[date, datetime]]] = {}
+        self.last_formats: Dict[str, str] = {}
+
+    @staticmethod
+    def _parse_shape(date_: str) -> Optional[datetime]:
+        """
+        Parses the date string by its shape without strptime.
+
+        Only the shapes of DATE_FORMATS with zero-padded numbers are recognized:
+        yyyy-mm-dd and dd.mm.yyyy, optionally followed by "Thh:mm:ss", "Thh:mm:ssZ" or " hh:mm:ss".
+
+        :param date_: The date string to be parsed.
+        :return: A naive datetime, or None if the shape is not recognized.
+        :raises ValueError: If the shape is recognized but the date does not exist.
+        """
+        if ISO_DATE.fullmatch(date_) or ISO_DATETIME.fullmatch(date_):
+            return datetime.fromisoformat(date_[:-1] if date_[-1] == "Z" else date_)
+        if DOTTED_DATE.fullmatch(date_) or DOTTED_DATETIME.fullmatch(date_):
+            day, month, year = int(date_[:2]), int(date_[3:5]), int(date_[6:10])
+            if len(date_) == 10:
+                return datetime(year, month, day)
+            return datetime(year, month, day, int(date_[11:13]), int(date_[14:16]), int(date_[17:19]))
+        return None
+
+    def _parse_formats(self, date_: str, column: str, is_datetime: bool) -> Optional[Union[date, datetime]]:
+        """
+        Parses the date string with strptime, trying the format last matched in the column first.
+
+        :param date_: The date string to be parsed.
+        :param column: The name of the column.
+        :param is_datetime: A boolean indicating whether the date string represents a datetime or a date.
+        :return: A date or an UTC datetime, or None if none of the formats match.
+        """
+        last_format: Optional[str] = self.last_formats.get(column)
+        date_formats: tuple = self.date_formats
+        if last_format is not None:
+            date_formats = (last_format,) + tuple(f for f in self.date_formats if f != last_format)
+        for date_format in date_formats:
+            with contextlib.suppress(ValueError):
+                date_file: datetime = datetime.strptime(date_, date_format)
+                parsed: Union[date, datetime] = pytz.utc.localize(date_file) if is_datetime else date_file.date()
+                self.last_formats[column] = date_format
+                return parsed
+        return None
+
+    def parse(self, date_: str, column: str, is_datetime: bool = False) -> Optional[Union[date, datetime]]:
+        """
+        Parses the date string as one of DATE_FORMATS.
+
+        The common shapes are parsed directly, the rest with strptime. The results are
+        memoized, as the same dates repeat across the rows of a message.
+
+        :param date_: The date string to be parsed.
+        :param column: The name of the column.
+        :param is_datetime: A boolean indicating whether the date string represents a datetime or a date.
+        :return: A date or an UTC datetime, or None if the string cannot be parsed.
+        """
+        if type(date_) is not str:
+            return self._parse_formats(date_, column, is_datetime)
+        key: Tuple[str, bool] = (date_, is_datetime)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        parsed: Optional[Union[date, datetime]] = None
+        try:
+            date_file: Optional[datetime] = self._parse_shape(date_)
+        except ValueError:
+            date_file = None
+        if date_file is not None:
+            parsed = pytz.utc.localize(date_file) if is_datetime else date_file.date()
+        else:
+            parsed = self._parse_formats(date_, column, is_datetime)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[key] = parsed
+        return parsed
@@ -0,0 +1,224 @@
+import io
+import re
+import json
+import codecs
+from typing import Any, Iterator, Optional, Tuple, Union
+from scripts.__init__ import JSON_BACKEND, JSON_STREAM_MIN_BYTES, ROUTE_PREFIX_BYTES
+
+try:
+    import orjson
+except ImportError:  # Необязательная зависимость, без неё используется json
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # Необязательная зависимость, без неё сообщения разбираются целиком
+    ijson = None
+
+BOM: bytes = codecs.BOM_UTF8
+WHITESPACE: re.Pattern = re.compile(r'[ \t\n\r]*')
+STRING: re.Pattern = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+# Строки целиком или скобки; одиночная кавычка - строка, которая не закончилась в префиксе
+CONTAINER_TOKEN: re.Pattern = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|["\[\]{}]')
+SCALAR: re.Pattern = re.compile(r'[^,:\[\]{}\s"]+')
+
+
+class JsonDecoder:
+    def __init__(self, backend: str = JSON_BACKEND, stream_min_bytes: int = JSON_STREAM_MIN_BYTES):
+        self.backend: str = "orjson" if backend in ("auto", "orjson") and orjson is not None else "json"
+        self.stream_min_bytes: int = stream_min_bytes if ijson is not None else 0
+
+    def loads(self, body: Union[bytes, bytearray, str]) -> Any:
+        """
+        Parses the JSON message.
+
+        With orjson the bytes are parsed as they are, the BOM is skipped through a memoryview
+        without copying the body. The documents orjson rejects (NaN, integers wider than 64 bits)
+        are parsed by json, so the result does not depend on the backend.
+
+        :param body: The message, the bytes may start with the UTF-8 BOM.
+        :return: The parsed message.
+        """
+        if self.backend == "orjson":
+            message: Union[memoryview, str] = body if isinstance(body, str) else memoryview(body)
+            if isinstance(message, memoryview) and message[:3] == BOM:
+                message = message[3:]
+            try:
+                return orjson.loads(message)
+            except orjson.JSONDecodeError:
+                pass
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode('utf-8-sig')
+        return json.loads(body)
+
+    def is_streamable(self, body: Union[bytes, bytearray, str, dict]) -> bool:
+        """
+        Checks whether the message is big enough to be parsed row by row.
+
+        :param body: The message.
+        :return: True if ijson is installed and the message is at least stream_min_bytes long.
+        """
+        return bool(self.stream_min_bytes) and isinstance(body, (bytes, bytearray)) \
+            and len(body) >= self.stream_min_bytes
+
+    @staticmethod
+    def _skip_value(text: str, position: int) -> int:
+        """
+        Finds the end of the JSON value without building it.
+
+        :param text: The text.
+        :param position: The position of the first character of the value.
+        :return: The position after the value.
+        """
+        if text[position] in "[{":
+            depth: int = 0
+            for token in CONTAINER_TOKEN.finditer(text, position):
+                char: str = token.group()
+                if char in "[{":
+                    depth += 1
+                elif char in "]}":
+                    depth -= 1
+                    if not depth:
+                        return token.end()
+                elif char == '"':
+                    break
+            raise ValueError("The value does not end in the text")
+        match: Optional[re.Match] = (STRING if text[position] == '"' else SCALAR).match(text, position)
+        if match is None:
+            raise ValueError("The value does not end in the text")
+        return match.end()
+
+    @staticmethod
+    def scan_prefix(
+        body: Union[bytes, bytearray, str],
+        keys: Tuple[str, ...] = ("header",),
+        max_bytes: int = ROUTE_PREFIX_BYTES
+    ) -> dict:
+        """
+        Parses the top-level items of the message that fit in its first max_bytes.
+
+        The items are parsed one by one and the scan stops as soon as all the keys are found,
+        or at the first item that does not fit in the prefix. The values of the other keys
+        are skipped without being built, so the rows are not parsed here even if they come
+        before the header, and the scan costs no more than max_bytes.
+
+        :param body: The message.
+        :param keys: The top-level keys to be found.
+        :param max_bytes: The count of bytes of the message to be scanned.
+        :return: The items of the keys found.
+        """
+        items: dict = {}
+        if isinstance(body, str):
+            text: str = body[:max_bytes]
+        else:
+            try:
+                # Неполный последний символ префикса отбрасывается, а не считается ошибкой
+                text = codecs.getincrementaldecoder('utf-8-sig')().decode(bytes(body[:max_bytes]))
+            except UnicodeDecodeError:
+                return items
+        decoder: json.JSONDecoder = json.JSONDecoder()
+        position: int = WHITESPACE.match(text).end()
+        try:
+            if text[position] != "{":
+                return items
+            while len(items) < len(keys):
+                position = WHITESPACE.match(text, position + 1).end()
+                key, position = decoder.raw_decode(text, position)
+                position = WHITESPACE.match(text, position).end()
+                if text[position] != ":":
+                    return items
+                position = WHITESPACE.match(text, position + 1).end()
+                if key in keys:
+                    items[key], position = decoder.raw_decode(text, position)
+                else:
+                    position = JsonDecoder._skip_value(text, position)
+                position = WHITESPACE.match(text, position).end()
+                if text[position] != ",":
+                    return items
+        except (ValueError, IndexError):
+            pass
+        return items
+
+    @staticmethod
+    def scan_suffix(
+        body: Union[bytes, bytearray, str],
+        key: str = "header",
+        max_bytes: int = ROUTE_PREFIX_BYTES
+    ) -> dict:
+        """
+        Parses the last top-level item of the message if it has the key and fits in its last max_bytes.
+
+        The item is looked for from the end: the key must be followed by a value that ends right
+        before the closing brace of the message, so a key of the same name in the rows is not taken.
+
+        :param body: The message.
+        :param key: The top-level key to be found.
+        :param max_bytes: The count of bytes of the message to be scanned.
+        :return: The item of the key, or an empty dict if the message does not end with it.
+        """
+        if isinstance(body, str):
+            text: str = body[-max_bytes:]
+        else:
+            tail: bytes = bytes(body[-max_bytes:])
+            start: int = 0
+            while start < len(tail) and tail[start] & 0xC0 == 0x80:  # начало символа отрезано
+                start += 1
+            try:
+                text = tail[start:].decode('utf-8')
+            except UnicodeDecodeError:
+                return {}
+        end: int = len(text.rstrip(" \t\n\r")) - 1
+        if end < 0 or text[end] != "}":
+            return {}
+        decoder: json.JSONDecoder = json.JSONDecoder()
+        name: str = json.dumps(key)
+        position: int = text.rfind(name)
+        while position > 0:
+            before: str = text[:position].rstrip(" \t\n\r")
+            colon: int = WHITESPACE.match(text, position + len(name)).end()
+            if before and before[-1] in ",{" and text[colon:colon + 1] == ":":
+                try:
+                    value, value_end = decoder.raw_decode(text, WHITESPACE.match(text, colon + 1).end())
+                except ValueError:
+                    pass
+                else:
+                    if WHITESPACE.match(text, value_end).end() == end:
+                        return {key: value}
+            position = text.rfind(name, 0, position)
+        return {}
+
+    @staticmethod
+    def _open(body: Union[bytes, bytearray]) -> io.BytesIO:
+        """
+        Opens the message as a file positioned after the BOM, if any.
+
+        :param body: The message.
+        :return: The file with the message.
+        """
+        stream: io.BytesIO = io.BytesIO(body)
+        if body[:3] == BOM:
+            stream.seek(3)
+        return stream
+
+    def load_header(self, body: Union[bytes, bytearray]) -> dict:
+        """
+        Parses only the header of the message.
+
+        The rows are not built, so the header costs little even if it follows the data.
+
+        :param body: The message.
+        :return: The header, or an empty dict if there is none.
+        """
+        return next(ijson.items(self._open(body), 'header', use_float=True), None) or {}
+
+    def iter_rows(self, body: Union[bytes, bytearray]) -> Iterator[dict]:
+        """
+        Parses the rows of the message one by one.
+
+        :param body: The message.
+        :return: The iterator over the rows of the data array.
+        """
+        return ijson.items(self._open(body), 'data.item', use_float=True)
+
+
+JSON_DECODER: JsonDecoder = JsonDecoder()
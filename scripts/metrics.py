@@ -0,0 +1,152 @@
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from scripts.__init__ import METRICS_FLUSH_INTERVAL
+
+if TYPE_CHECKING:
+    from scripts.stats import StatsStore
+
+# Порядок счётчиков совпадает с колонками таблицы metrics
+METRIC_NAMES: Tuple[str, ...] = (
+    "count_message", "count_rows", "size_bytes", "parse_seconds", "insert_seconds", "count_errors"
+)
+
+
+class MetricsShard:
+    def __init__(self):
+        self.thread: threading.Thread = threading.current_thread()
+        self.lock: threading.Lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], List[float]] = {}
+
+
+class MetricsRegistry:
+    def __init__(self, stats_store: "StatsStore", flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.stats_store: "StatsStore" = stats_store
+        self.flush_interval: float = flush_interval
+        self.local: threading.local = threading.local()
+        self.shards: List[MetricsShard] = []
+        self.shards_lock: threading.Lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.is_closed: threading.Event = threading.Event()
+
+    def _get_shard(self) -> MetricsShard:
+        """
+        Returns the counters of the current thread, creating them on the first call.
+
+        :return: The shard of the current thread.
+        """
+        shard: Optional[MetricsShard] = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = MetricsShard()
+            with self.shards_lock:
+                self.shards.append(shard)
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+                    self.thread.start()
+        return shard
+
+    def add(
+        self,
+        queue_name: Optional[str],
+        table_name: Optional[str],
+        count_message: int = 0,
+        count_rows: int = 0,
+        size_bytes: int = 0,
+        parse_seconds: float = 0.0,
+        insert_seconds: float = 0.0,
+        count_errors: int = 0
+    ) -> None:
+        """
+        Adds the values to the counters of the queue and the table.
+
+        Every thread has its own counters, so the lock is only contended while they are collected.
+
+        :param queue_name: The name of the queue.
+        :param table_name: The name of the table.
+        :param count_message: The count of messages received.
+        :param count_rows: The count of rows received.
+        :param size_bytes: The size of the messages in bytes.
+        :param parse_seconds: The seconds spent on parsing and converting the messages.
+        :param insert_seconds: The seconds spent on writing the rows to ClickHouse.
+        :param count_errors: The count of errors.
+        :return: None
+        """
+        shard: MetricsShard = self._get_shard()
+        key: Tuple[str, str] = (queue_name or "", table_name or "")
+        with shard.lock:
+            counters: Optional[List[float]] = shard.counters.get(key)
+            if counters is None:
+                counters = shard.counters[key] = [0] * len(METRIC_NAMES)
+            counters[0] += count_message
+            counters[1] += count_rows
+            counters[2] += size_bytes
+            counters[3] += parse_seconds
+            counters[4] += insert_seconds
+            counters[5] += count_errors
+
+    def collect(self) -> Dict[Tuple[str, str], List[float]]:
+        """
+        Takes the counters of all the threads and sums them up. The counters start over from zero.
+
+        :return: The values of METRIC_NAMES by queue and table.
+        """
+        metrics: Dict[Tuple[str, str], List[float]] = {}
+        with self.shards_lock:
+            shards: List[MetricsShard] = list(self.shards)
+            self.shards = [shard for shard in shards if shard.thread.is_alive()]
+        for shard in shards:
+            with shard.lock:
+                counters, shard.counters = shard.counters, {}
+            for key, values in counters.items():
+                total: Optional[List[float]] = metrics.get(key)
+                if total is None:
+                    metrics[key] = values
+                else:
+                    metrics[key] = [a + b for a, b in zip(total, values)]
+        return metrics
+
+    def flush(self) -> None:
+        """
+        Writes the counters collected since the previous flush to the stats store.
+
+        :return: None
+        """
+        if metrics := self.collect():
+            self.stats_store.add_metrics(metrics)
+
+    def _run(self) -> None:
+        """
+        Flushes the counters every flush_interval seconds until the registry is closed.
+
+        :return: None
+        """
+        while not self.is_closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """
+        Stops the background thread and flushes the counters left.
+
+        :return: None
+        """
+        self.is_closed.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+
+METRICS_REGISTRY: Optional[MetricsRegistry] = None
+METRICS_REGISTRY_LOCK: threading.Lock = threading.Lock()
+
+
+def get_metrics_registry(stats_store: "StatsStore") -> MetricsRegistry:
+    """
+    Returns the metrics registry shared by all the workers of the process.
+
+    :param stats_store: The stats store the counters are flushed to.
+    :return: The metrics registry.
+    """
+    global METRICS_REGISTRY
+    with METRICS_REGISTRY_LOCK:
+        if METRICS_REGISTRY is None:
+            METRICS_REGISTRY = MetricsRegistry(stats_store)
+        return METRICS_REGISTRY
@@ -1,16 +1,172 @@
 import pika
-from typing import Tuple
-from scripts.__init__ import get_my_env_var
+import asyncio
+import threading
+import contextlib
+from pika.channel import Channel
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.adapters.blocking_connection import BlockingChannel
+from scripts.__init__ import get_my_env_var, PREFETCH_COUNT, CONSUMER_INACTIVITY_TIMEOUT, RABBITMQ_CONNECTIONS
+from typing import Tuple, Iterator, Optional, Dict, List, Callable, Any, AsyncIterator
+
+
+def get_connection_parameters(user: str, password: str, host: str, port: int) -> pika.ConnectionParameters:
+    """
+    Builds the parameters of a connection to the RabbitMQ server.
+
+    :param user: The name of the RabbitMQ user.
+    :param password: The password of the RabbitMQ user.
+    :param host: The host of the RabbitMQ server.
+    :param port: The port of the RabbitMQ server.
+    :return: The connection parameters.
+    """
+    credentials: pika.PlainCredentials = pika.PlainCredentials(user, password)
+    return pika.ConnectionParameters(
+        host=host,
+        port=port,
+        credentials=credentials,
+        heartbeat=600,
+        connection_attempts=5,
+        blocked_connection_timeout=300,
+        retry_delay=3
+    )
+
+
+class RabbitMQConnectionPool:
+    def __init__(self, size: int = RABBITMQ_CONNECTIONS):
+        self.user: str = get_my_env_var('RABBITMQ_USER')
+        self.password: str = get_my_env_var('RABBITMQ_PASSWORD')
+        self.host: str = get_my_env_var('RABBITMQ_HOST')
+        self.port: int = int(get_my_env_var('RABBITMQ_PORT'))
+        self.size: int = size
+        self.free: List[int] = list(range(size))
+        self.connections: Dict[int, pika.BlockingConnection] = {}
+        self.channels: Dict[Tuple[int, str], BlockingChannel] = {}
+        self.condition: threading.Condition = threading.Condition()
+
+    def _acquire(self, queue_name: str) -> int:
+        """
+        Waits for a free connection, preferring the one that already has a channel for the queue.
+
+        :param queue_name: The name of the queue.
+        :return: The index of the connection.
+        """
+        with self.condition:
+            while not self.free:
+                self.condition.wait()
+            index: int = next((i for i in self.free if (i, queue_name) in self.channels), self.free[0])
+            self.free.remove(index)
+            return index
+
+    def _release(self, index: int) -> None:
+        with self.condition:
+            self.free.append(index)
+            self.condition.notify()
+
+    def _get_connection(self, index: int) -> pika.BlockingConnection:
+        """
+        Returns an open connection, re-establishing it if it has been lost.
+
+        Pending heartbeats of an idle connection are processed first, so a connection
+        closed by the broker is detected here and not in the middle of a turn.
+        The channels of a lost connection are dropped and reopened on demand.
+
+        The connection is leased to the caller, so only the maps shared with the other
+        workers are read and changed under the lock, the network calls are made without it.
+
+        :param index: The index of the connection.
+        :return: An open connection.
+        """
+        with self.condition:
+            connection: Optional[pika.BlockingConnection] = self.connections.get(index)
+        with contextlib.suppress(pika.exceptions.AMQPError):
+            if connection is not None and connection.is_open:
+                connection.process_data_events(time_limit=0)
+                return connection
+        with self.condition:
+            for key in [key for key in self.channels if key[0] == index]:
+                del self.channels[key]
+        connection = pika.BlockingConnection(get_connection_parameters(self.user, self.password, self.host, self.port))
+        with self.condition:
+            self.connections[index] = connection
+        return connection
+
+    @contextlib.contextmanager
+    def lease(self, queue_name: str) -> Iterator[Tuple[pika.BlockingConnection, BlockingChannel]]:
+        """
+        Hands out a pooled connection and the channel of the queue on it for exclusive use.
+
+        A BlockingConnection is not thread-safe, so a connection is used by one worker
+        at a time, and at most `size` queues are processed at the same time. The channel
+        of the queue is reopened if it was closed by the broker (ChannelClosed), and the
+        connection is re-established if it was lost (ConnectionClosed).
+
+        :param queue_name: The name of the queue.
+        :return: A context manager yielding the connection and the channel.
+        """
+        index: int = self._acquire(queue_name)
+        try:
+            connection: pika.BlockingConnection = self._get_connection(index)
+            with self.condition:
+                channel: Optional[BlockingChannel] = self.channels.get((index, queue_name))
+            if channel is None or not channel.is_open:
+                channel = connection.channel()
+                with self.condition:
+                    self.channels[(index, queue_name)] = channel
+            yield connection, channel
+        finally:
+            self._release(index)
+
+    def close(self) -> None:
+        """
+        Closes all the pooled connections.
+
+        :return: None
+        """
+        with self.condition:
+            connections: List[pika.BlockingConnection] = list(self.connections.values())
+            self.connections = {}
+            self.channels = {}
+        for connection in connections:
+            with contextlib.suppress(pika.exceptions.AMQPError):
+                if connection.is_open:
+                    connection.close()
 
 
 class RabbitMQ:
-    def __init__(self):
+    def __init__(self, pool: Optional[RabbitMQConnectionPool] = None):
         self.user: str = get_my_env_var('RABBITMQ_USER')
         self.password: str = get_my_env_var('RABBITMQ_PASSWORD')
         self.host: str = get_my_env_var('RABBITMQ_HOST')
         self.port: int = int(get_my_env_var('RABBITMQ_PORT'))
         self.exchange_name: str = get_my_env_var('EXCHANGE_NAME')
-        self.connection, self.channel = self.connect()
+        self.pool: Optional[RabbitMQConnectionPool] = pool
+        self.connection: Optional[pika.BlockingConnection] = None
+        self.channel: Optional[BlockingChannel] = None
+        if pool is None:
+            self.connection, self.channel = self.connect()
+
+    @contextlib.contextmanager
+    def lease(self, queue_name: str) -> Iterator[None]:
+        """
+        Binds the instance to a connection and a channel for the processing of a queue.
+
+        With a pool the instance uses a pooled connection and the channel of the queue
+        on it for the duration of the block. Without a pool the own connection is checked
+        and re-established if it has been lost.
+
+        :param queue_name: The name of the queue.
+        :return: A context manager.
+        """
+        if self.pool is None:
+            self.ensure_connection()
+            yield
+            return
+        with self.pool.lease(queue_name) as (connection, channel):
+            self.connection, self.channel = connection, channel
+            try:
+                yield
+            finally:
+                self.connection, self.channel = None, None
 
     def connect(self) -> Tuple[pika.BlockingConnection, pika.adapters.blocking_connection.BlockingChannel]:
         """
@@ -19,15 +175,8 @@ class RabbitMQ:
         the connection and the channel objects.
         :return: A tuple containing the connection and the channel.
         """
-        credentials: pika.PlainCredentials = pika.PlainCredentials(self.user, self.password)
-        parameters: pika.ConnectionParameters = pika.ConnectionParameters(
-            host=self.host,
-            port=self.port,
-            credentials=credentials,
-            heartbeat=600,
-            connection_attempts=5,
-            blocked_connection_timeout=300,
-            retry_delay=3
+        parameters: pika.ConnectionParameters = get_connection_parameters(
+            self.user, self.password, self.host, self.port
         )
         connection: pika.BlockingConnection = pika.BlockingConnection(parameters)
         return connection, connection.channel()
@@ -36,13 +185,53 @@ class RabbitMQ:
         """
         Closes the connection to the RabbitMQ server if it is currently open.
         This ensures that resources are properly released and the connection
-        is not left hanging. If the connection is already closed, this method
-        does nothing.
+        is not left hanging. If the connection is already closed or belongs
+        to a pool, this method does nothing.
         :return:
         """
-        if self.connection and not self.connection.is_closed:
+        if self.pool is None and self.connection and not self.connection.is_closed:
             self.connection.close()
 
+    def is_connected(self) -> bool:
+        """
+        Checks whether both the connection and the channel are open.
+
+        :return: True if the connection and the channel are open, False otherwise.
+        """
+        return bool(self.connection and self.connection.is_open and self.channel and self.channel.is_open)
+
+    def reconnect(self) -> None:
+        """
+        Closes the current connection (if it is still open) and establishes a new one.
+        Pooled connections are recovered by the pool on the next lease.
+
+        :return: None
+        """
+        if self.pool is not None:
+            return
+        try:
+            self.close()
+        except pika.exceptions.AMQPError:
+            pass
+        self.connection, self.channel = self.connect()
+
+    def ensure_connection(self) -> None:
+        """
+        Makes sure a long-lived connection is still usable before it is reused.
+
+        Pending heartbeats and events are processed without blocking. If the connection
+        or the channel has been lost, a new connection is established.
+
+        :return: None
+        """
+        try:
+            if self.is_connected():
+                self.connection.process_data_events(time_limit=0)
+                return
+        except pika.exceptions.AMQPError:
+            pass
+        self.reconnect()
+
     def declare_and_bind_queue(self, queue_name: str, routing_key: str) -> None:
         """
         Declares a RabbitMQ queue and binds it to the exchange with the given
@@ -59,25 +248,73 @@ class RabbitMQ:
             routing_key=routing_key
         )
 
-    def consume(self, queue_name: str, callback: callable) -> None:
+    def consume(
+            self,
+            queue_name: str,
+            prefetch_count: int = PREFETCH_COUNT,
+            inactivity_timeout: float = CONSUMER_INACTIVITY_TIMEOUT
+    ) -> Iterator[Tuple[
+        Optional[pika.spec.Basic.Deliver], Optional[pika.spec.BasicProperties], Optional[bytes]
+    ]]:
         """
-        Subscribes to messages in a RabbitMQ queue and calls the provided callback function
-        whenever a message is received. The callback function should take three arguments:
-        the method frame, the header frame, and the body of the message.
+        Subscribes to messages in a RabbitMQ queue and yields them as the broker pushes them.
+
+        The broker delivers up to prefetch_count unacknowledged messages ahead of time
+        (basic_qos), so the consumer does not pay a round trip per message. Messages are
+        consumed with manual acks, the caller is responsible for basic_ack/basic_nack.
+        If no message arrives within inactivity_timeout seconds, a tuple of None values
+        is yielded, which means the queue is drained.
 
         :param queue_name: The name of the queue to subscribe to.
-        :param callback: The callback function to call when a message is received.
-        :return:
+        :param prefetch_count: The maximum number of unacknowledged messages delivered to the consumer.
+        :param inactivity_timeout: Seconds to wait for a message before yielding (None, None, None).
+        :return: An iterator of tuples containing the method frame, header frame, and body of the message.
         """
         if not self.channel:
             raise ConnectionError("Connection is not established.")
-        self.channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
-        self.channel.start_consuming()
+        self.channel.basic_qos(prefetch_count=prefetch_count)
+        yield from self.channel.consume(queue=queue_name, auto_ack=False, inactivity_timeout=inactivity_timeout)
 
-    def get(self, queue_name: str) -> Tuple[pika.spec.Basic.Deliver, pika.spec.BasicProperties, bytes]:
+    def cancel(self) -> int:
+        """
+        Cancels the consumer created by consume.
+
+        Messages that were delivered to the client but not yet yielded are returned
+        to the queue by the broker.
+
+        :return: The number of messages returned to the queue.
+        """
+        if not self.channel or self.channel.is_closed:
+            return 0
+        return self.channel.cancel()
+
+    def waiting_message_count(self) -> int:
+        """
+        Returns the number of messages already pushed by the broker and buffered on the client side.
+
+        :return: The number of buffered messages.
+        """
+        return self.channel.get_waiting_message_count()
+
+    def message_count(self, queue_name: str) -> int:
+        """
+        Returns the number of messages ready for delivery in a RabbitMQ queue.
+
+        :param queue_name: The name of the queue.
+        :return: The number of messages in the queue.
+        """
+        if not self.channel:
+            raise ConnectionError("Connection is not established.")
+        queue_info = self.channel.queue_declare(queue=queue_name, passive=True)
+        return queue_info.method.message_count
+
+    def get(self, queue_name: str) -> Tuple[pika.spec.Basic.GetOk, pika.spec.BasicProperties, bytes]:
         """
         Retrieves a message from a RabbitMQ queue.
 
+        The method frame (Basic.GetOk) carries message_count, the number of messages
+        left in the queue after this one.
+
         :param queue_name: The name of the queue from which to retrieve the message.
         :return: A tuple containing the method frame, header frame, and body of the message.
         """
@@ -106,3 +343,208 @@ class RabbitMQ:
             body=message
         )
         print(f"Sent message to queue {queue_name}: {message}")
+
+
+class AsyncRabbitMQ:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.user: str = get_my_env_var('RABBITMQ_USER')
+        self.password: str = get_my_env_var('RABBITMQ_PASSWORD')
+        self.host: str = get_my_env_var('RABBITMQ_HOST')
+        self.port: int = int(get_my_env_var('RABBITMQ_PORT'))
+        self.exchange_name: str = get_my_env_var('EXCHANGE_NAME')
+        self.loop: Optional[asyncio.AbstractEventLoop] = loop
+        self.connection: Optional[AsyncioConnection] = None
+        self.channels: Dict[str, Channel] = {}
+        self._pending: Dict[int, List[asyncio.Future]] = {}
+        self._consumers: Dict[int, asyncio.Queue] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _create_future(self, channel: Optional[Channel] = None) -> Tuple[asyncio.Future, Callable[..., None]]:
+        """
+        Creates a future and a pika callback that resolves it.
+
+        If a channel is given, the future fails when the channel is closed before
+        the broker answers (e.g. a passive declare of a missing queue).
+
+        :param channel: The channel the request is sent on.
+        :return: A tuple containing the future and the callback.
+        """
+        future: asyncio.Future = self.loop.create_future()
+
+        def callback(*args: Any) -> None:
+            if not future.done():
+                future.set_result(args[-1] if args else None)
+
+        if channel is not None:
+            pending: List[asyncio.Future] = self._pending.setdefault(channel.channel_number, [])
+            pending.append(future)
+            future.add_done_callback(lambda f: f in pending and pending.remove(f))
+        return future, callback
+
+    async def connect(self) -> None:
+        """
+        Establishes a connection to the RabbitMQ server on the running event loop.
+
+        :return: None
+        """
+        self.loop = self.loop or asyncio.get_running_loop()
+        future: asyncio.Future = self.loop.create_future()
+
+        def on_open_error(_connection: AsyncioConnection, error: BaseException) -> None:
+            if not future.done():
+                future.set_exception(ConnectionError(error))
+
+        self.connection = AsyncioConnection(
+            parameters=get_connection_parameters(self.user, self.password, self.host, self.port),
+            on_open_callback=lambda connection: future.done() or future.set_result(connection),
+            on_open_error_callback=on_open_error,
+            custom_ioloop=self.loop
+        )
+        self.channels = {}
+        await future
+
+    def is_connected(self) -> bool:
+        return bool(self.connection and self.connection.is_open)
+
+    async def get_channel(self, name: str = "default") -> Channel:
+        """
+        Returns the channel with the given name, opening it (and the connection) if needed.
+
+        All the channels are multiplexed over one connection, usually one channel per queue.
+
+        :param name: The name of the channel, usually the name of the queue.
+        :return: An open channel.
+        """
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            if not self.is_connected():
+                await self.connect()
+            channel: Optional[Channel] = self.channels.get(name)
+            if channel is not None and channel.is_open:
+                return channel
+            future, callback = self._create_future()
+            self.connection.channel(on_open_callback=callback)
+            channel = await future
+            channel.add_on_close_callback(self._on_channel_closed)
+            self.channels[name] = channel
+            return channel
+
+    def _on_channel_closed(self, channel: Channel, reason: BaseException) -> None:
+        """
+        Fails all the requests that are still waiting for an answer on a closed channel
+        and stops its consumer.
+
+        :param channel: The closed channel.
+        :param reason: The reason the channel was closed.
+        :return: None
+        """
+        for future in list(self._pending.pop(channel.channel_number, [])):
+            if not future.done():
+                future.set_exception(pika.exceptions.ChannelClosed(0, str(reason)))
+        if channel.channel_number in self._consumers:
+            self._consumers.pop(channel.channel_number).put_nowait(reason)
+
+    async def declare_and_bind_queue(self, queue_name: str, routing_key: str) -> None:
+        """
+        Declares a RabbitMQ queue and binds it to the exchange with the given routing key.
+
+        :param queue_name: The name of the queue to declare and bind.
+        :param routing_key: The routing key to use when binding the queue to the exchange.
+        :return: None
+        """
+        channel: Channel = await self.get_channel(queue_name)
+        future, callback = self._create_future(channel)
+        channel.queue_declare(queue=queue_name, durable=True, callback=callback)
+        await future
+        future, callback = self._create_future(channel)
+        channel.queue_bind(queue=queue_name, exchange=self.exchange_name, routing_key=routing_key, callback=callback)
+        await future
+
+    async def message_count(self, queue_name: str) -> int:
+        """
+        Returns the number of messages ready for delivery in a RabbitMQ queue.
+
+        :param queue_name: The name of the queue.
+        :return: The number of messages in the queue.
+        """
+        channel: Channel = await self.get_channel(queue_name)
+        future, callback = self._create_future(channel)
+        channel.queue_declare(queue=queue_name, passive=True, callback=callback)
+        method_frame: Any = await future
+        return method_frame.method.message_count
+
+    async def consume(
+        self,
+        queue_name: str,
+        prefetch_count: int = PREFETCH_COUNT
+    ) -> AsyncIterator[Tuple[Channel, pika.spec.Basic.Deliver, pika.spec.BasicProperties, bytes]]:
+        """
+        Subscribes to messages in a RabbitMQ queue and yields them as the broker pushes them.
+
+        Messages are consumed with manual acks on the channel of the queue, the caller
+        acknowledges them with ack/nack. The consumer is cancelled when the iteration stops.
+
+        :param queue_name: The name of the queue to subscribe to.
+        :param prefetch_count: The maximum number of unacknowledged messages delivered to the consumer.
+        :return: An async iterator of tuples containing the channel, the method frame,
+                 the header frame, and the body of the message.
+        """
+        channel: Channel = await self.get_channel(queue_name)
+        future, callback = self._create_future(channel)
+        channel.basic_qos(prefetch_count=prefetch_count, callback=callback)
+        await future
+
+        messages: asyncio.Queue = asyncio.Queue()
+        self._consumers[channel.channel_number] = messages
+        future, callback = self._create_future(channel)
+        consumer_tag: str = channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=lambda ch, method, properties, body: messages.put_nowait((ch, method, properties, body)),
+            auto_ack=False,
+            callback=callback
+        )
+        await future
+        try:
+            while True:
+                message: Any = await messages.get()
+                if isinstance(message, BaseException):
+                    raise pika.exceptions.ChannelClosed(0, str(message))
+                yield message
+        finally:
+            self._consumers.pop(channel.channel_number, None)
+            if channel.is_open:
+                channel.basic_cancel(consumer_tag)
+
+    @staticmethod
+    def ack(channel: Channel, delivery_tag: int, multiple: bool = False) -> None:
+        channel.basic_ack(delivery_tag=delivery_tag, multiple=multiple)
+
+    @staticmethod
+    def nack(channel: Channel, delivery_tag: int, multiple: bool = False, requeue: bool = True) -> None:
+        channel.basic_nack(delivery_tag=delivery_tag, multiple=multiple, requeue=requeue)
+
+    async def publish(self, queue_name: str, routing_key: str, message: bytes) -> None:
+        """
+        Publishes a message to a RabbitMQ queue.
+
+        :param queue_name: The name of the queue to which to publish the message.
+        :param routing_key: The routing key to use when publishing the message.
+        :param message: The message to publish to the queue.
+        :return: None
+        """
+        await self.declare_and_bind_queue(queue_name, routing_key)
+        channel: Channel = await self.get_channel(queue_name)
+        channel.basic_publish(exchange=self.exchange_name, routing_key=routing_key, body=message)
+
+    async def close(self) -> None:
+        """
+        Closes the connection to the RabbitMQ server if it is currently open.
+
+        :return: None
+        """
+        if not self.is_connected():
+            return
+        future: asyncio.Future = self.loop.create_future()
+        self.connection.add_on_close_callback(lambda *args: future.done() or future.set_result(None))
+        self.connection.close()
+        await future
@@ -1,6 +1,9 @@
+import math
 import fcntl
 import asyncio
-import sqlite3
+import functools
+import itertools
+import multiprocessing
 import requests
 import time as time_
 from pathlib import Path
@@ -8,64 +11,116 @@ from pika.spec import Basic
 from scripts.tables import *
 from scripts.__init__ import *
 from pika import BasicProperties
-from datetime import datetime, time
-from asyncio import AbstractEventLoop
+from datetime import datetime, date, time
 from scripts.send2telegram import send_email_notifiers
-from sqlite3 import Connection, Cursor
-from scripts.rabbit_mq import RabbitMQ
+from scripts.rabbit_mq import RabbitMQ, AsyncRabbitMQ, RabbitMQConnectionPool
+from scripts.scheduler import QueueScheduler
+from scripts.writer import BatchWriter
+from scripts.batching import BatchPolicy
+from scripts.audit import AuditLog, get_audit_log
+from scripts.stats import StatsStore, get_stats_store
+from scripts.metrics import MetricsRegistry, get_metrics_registry
+from scripts.decoder import JSON_DECODER
+from pika.exceptions import AMQPError
 from clickhouse_connect import get_client
 from clickhouse_connect.driver import Client
-from typing import Tuple, Union, Optional, Any
+from typing import Tuple, Union, Optional, Any, Iterator, Dict
 from pika.adapters.blocking_connection import BlockingChannel
 
 
 class Receive:
-    def __init__(self, log_file: str = LOG_FILE):
-        self.logger: logging.getLogger = get_logger(
-            str(os.path.basename(__file__).replace(".py", "_") + str(datetime.now(tz=TZ).date()))
-        )
+    def __init__(
+        self,
+        log_file: str = LOG_FILE,
+        rabbit_mq_pool: Optional[RabbitMQConnectionPool] = None,
+        is_worker: bool = True
+    ):
+        self.logger_date: date = datetime.now(tz=TZ).date()
+        self.logger: logging.getLogger = get_logger(self._get_logger_name(self.logger_date))
         self.log_file: str = log_file
         self._init_db()
-        self.rabbit_mq: RabbitMQ = RabbitMQ()
+        self.metrics: MetricsRegistry = get_metrics_registry(self.stats_store)
+        # Координатор очередей (async_main) сам сообщения не обрабатывает:
+        # соединения с RabbitMQ и ClickHouse и поток записи нужны только обработчикам очередей
+        self.rabbit_mq: Optional[RabbitMQ] = RabbitMQ(pool=rabbit_mq_pool) if is_worker else None
+        self.rabbit_mq_pool: Optional[RabbitMQConnectionPool] = rabbit_mq_pool
         self.client: Optional[Client] = None
-        self.connect_to_db()
+        if is_worker:
+            self.connect_to_db()
         self.count_message: int = 0
         self.is_greater_time: bool = False
         self.queue_name: Optional[str] = None
         self.table_name: Optional[str] = None
+        self.message_rows: int = 0
+        self.message_context: Optional[MessageContext] = None
         self.message_errors: list = []
         self.queue_name_errors: list = []
         self.key_deals_buffer: list = []
-        self.rows_buffer: list = []
-        self.log_message_buffer: list = []
+        self.is_key_deal_buffered: bool = False
+        self.rows_buffers: Dict[str, ColumnarBuffer] = {}
+        self.audit_log: AuditLog = get_audit_log(self.get_db_client, self.get_day_logger)
         self.delivery_tags: list = []
+        self.data_core: Optional[DataCoreClient] = None
+        self.writer: Optional[BatchWriter] = None
+        if is_worker and WRITER_QUEUE_SIZE:
+            self.writer = BatchWriter(self.get_db_client)
+        self.queue_depth: int = 0
+        self.queue_depth_probed_at: float = 0.0
+        self.is_queue_drained: bool = True
+        self.turn_messages: int = 0
+        self.turn_rows: int = 0
+        self.turn_max_rows: int = TURN_MAX_ROWS
+        self.turn_max_seconds: float = TURN_MAX_SECONDS
+        self.turn_started_at: float = time_.monotonic()
+        self.rows_per_message: Optional[float] = None
+        self.bytes_per_message: Optional[float] = None
+
+    @staticmethod
+    def _get_logger_name(day: date) -> str:
+        return str(os.path.basename(__file__).replace(".py", "_") + str(day))
+
+    def _refresh_logger(self) -> None:
+        """
+        Switches a long-lived worker to the logger of the current day.
+
+        The logger of the day is shared by all workers, so its handlers are
+        created only by the first worker that notices the change of date.
+
+        :return: None
+        """
+        today: date = datetime.now(tz=TZ).date()
+        if today == self.logger_date:
+            return
+        self.logger = self.get_day_logger(today)
+        self.logger_date = today
+
+    @staticmethod
+    def get_day_logger(day: Optional[date] = None) -> logging.getLogger:
+        """
+        Returns the logger of the day, the current one by default.
+
+        The logger of the day is shared by all workers, its handlers are created on the first call.
+
+        :param day: The day of the logger.
+        :return: The logger of the day.
+        """
+        name: str = Receive._get_logger_name(day or datetime.now(tz=TZ).date())
+        logger: logging.getLogger = logging.getLogger(name)
+        return logger if logger.hasHandlers() else get_logger(name)
 
     def _init_db(self) -> None:
         """
         Initialize the SQLite database.
 
-        This method creates a SQLite database file if it does not already exist.
-        It creates a table 'stats' with columns for queue name, timestamp,
-        count of messages, and processed table. The queue_name column is set as
-        the primary key. This setup is used to store statistics related to message
-        processing.
+        This method opens the stats store of the SQLite database file, which creates
+        the file if it does not already exist. The store has a table 'stats' with columns
+        for queue name, timestamp, count of messages, and processed table. The queue_name
+        column is set as the primary key. This setup is used to store statistics related
+        to message processing. The store and its connection are shared by all the workers.
 
         :return: None
         """
-        conn: Connection = sqlite3.connect(self.log_file)
-        try:
-            cursor: Cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stats (
-                    queue_name TEXT PRIMARY KEY,
-                    timestamp TEXT,
-                    count_message INTEGER,
-                    processed_table TEXT
-                )
-            ''')
-            conn.commit()
-        finally:
-            conn.close()
+        self.stats_store: StatsStore = get_stats_store(self.log_file)
 
     def connect_to_db(self) -> Optional[Client]:
         """
@@ -74,36 +129,60 @@ class Receive:
         :return: ClickHouse client.
         """
         try:
-            self.client: Client = get_client(
-                host=get_my_env_var('HOST'),
-                database=get_my_env_var('DATABASE'),
-                username=get_my_env_var('USERNAME_DB'),
-                password=get_my_env_var('PASSWORD')
-            )
+            self.client: Client = self.get_db_client()
         except Exception as ex_connect:
             self.logger.error(f"Error connection to db {ex_connect}. Type error is {type(ex_connect)}.")
             raise ConnectionError from ex_connect
 
+    @staticmethod
+    def get_db_client() -> Client:
+        """
+        Creates a new client of the ClickHouse database.
+
+        :return: ClickHouse client.
+        """
+        return get_client(
+            host=get_my_env_var('HOST'),
+            database=get_my_env_var('DATABASE'),
+            username=get_my_env_var('USERNAME_DB'),
+            password=get_my_env_var('PASSWORD')
+        )
+
+    def reconnect(self) -> None:
+        """
+        Re-establishes the connections to RabbitMQ and ClickHouse.
+
+        The buffered rows are dropped, as their messages are redelivered on the new
+        channel and their delivery tags are not valid anymore.
+
+        :return: None
+        """
+        if self.writer is not None:
+            self.writer.reset()  # подтверждения старого канала уже недействительны
+        self.reset_buffers()
+        self.rabbit_mq.reconnect()
+        self.connect_to_db()
+
+    def close(self) -> None:
+        """
+        Closes the connections to RabbitMQ and ClickHouse.
+
+        :return: None
+        """
+        if self.writer is not None:
+            with contextlib.suppress(Exception):
+                self.writer.close()
+        with contextlib.suppress(Exception):
+            self.rabbit_mq.close()
+        with contextlib.suppress(Exception):
+            self.client.close()
+
     def load_stats(self) -> Optional[dict]:
         """
         Load statistics from SQLite database.
         :return: Loaded statistics as a dict.
         """
-        conn: Connection = sqlite3.connect(self.log_file)
-        try:
-            cursor: Cursor = conn.cursor()
-            cursor.execute('SELECT * FROM stats')
-            rows: list = cursor.fetchall()
-            return {
-                row[0]: {
-                    "timestamp": row[1],
-                    "count_message": row[2],
-                    "processed_table": row[3]
-                }
-                for row in rows
-            }
-        finally:
-            conn.close()
+        return self.stats_store.load()
 
     def save_stats(self, stats: dict) -> None:
         """
@@ -111,46 +190,19 @@ class Receive:
         :param stats: Statistics for save.
         :return: None
         """
-        conn: Connection = sqlite3.connect(self.log_file)
-        try:
-            cursor: Cursor = conn.cursor()
-            for queue_name, data in stats.items():
-                cursor.execute('''
-                    INSERT OR REPLACE INTO stats (queue_name, timestamp, count_message, processed_table)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    queue_name,
-                    data["timestamp"],
-                    data["count_message"],
-                    data["processed_table"]
-                ))
-            conn.commit()
-        finally:
-            conn.close()
+        self.stats_store.save(stats)
 
     def update_stats(self) -> None:
         """
         Update statistics in SQLite database.
 
-        Load statistics from SQLite database. If self.queue_name not in statistics,
-        create new statistics for this queue. Update count messages and processed table for this queue.
-        Save statistics to SQLite database.
+        Adds the count of messages of self.queue_name to its statistics and updates
+        the processed table. The increment is written by the stats store with an UPSERT,
+        together with the increments of the other workers.
         :return: None
         """
-        stats: dict = self.load_stats()
         today: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if self.queue_name not in stats:
-            stats[self.queue_name] = {
-                "timestamp": today,
-                "count_message": 0,
-                "processed_table": None
-            }
-
-        stats[self.queue_name]["count_message"] += self.count_message
-        stats[self.queue_name]["processed_table"] = self.table_name
-        stats[self.queue_name]["timestamp"] = today
-
-        self.save_stats(stats)
+        self.stats_store.increment(self.queue_name, self.count_message, self.table_name, today)
 
     def _check_and_update_log(
             self,
@@ -177,6 +229,8 @@ class Receive:
         if current_time >= required_time and self.is_greater_time:
             self.logger.info("Created log file for writing count messages")
             self.update_stats()
+            self.metrics.flush()
+            self.stats_store.flush()
             self.count_message = 0
             self.table_name = None
             self.is_greater_time = False
@@ -275,12 +329,26 @@ class Receive:
         """
         self._check_and_update_log()
         self.count_message += 1
+        self.turn_messages += 1
         self.logger.info(
             f"Callback start for ch={ch}, method={method}, properties={properties}, body_message called. "
             f"Count messages is {self.count_message}"
         )
-        all_data, data, data_core, key_deals = self.handle_incoming_json(body, message_count)
+        started_at: float = time_.monotonic()
+        all_data, data, data_core, key_deals = self.handle_incoming_json(
+            body, message_count, getattr(properties, "headers", None)
+        )
+        self.metrics.add(
+            self.queue_name,
+            self.table_name,
+            count_message=1,
+            count_rows=self.message_rows,
+            size_bytes=len(body) if isinstance(body, (bytes, bytearray, str)) else 0,
+            parse_seconds=time_.monotonic() - started_at
+        )
+        self.turn_rows += self.message_rows
         if data_core:
+            self.data_core = data_core
             is_success_inserted: Optional[bool] = None if key_deals is None else True
             data_core.handle_rows(all_data, data, key_deals, message_count, is_success_inserted)
         else:
@@ -297,16 +365,18 @@ class Receive:
             data_core: Any,
             eng_table_name: str,
             key_deals: str,
-            message_count: int
+            message_count: int,
+            context: Optional[MessageContext] = None
     ) -> None:
         """
         Processes the given data, converting it to the required format and structure.
 
         This method reads the provided JSON data, modifies it according to the specifications
-        of the data core, and generates a file name based on the English table name and
-        the current timestamp. It logs the process and handles any exceptions that occur
-        during data conversion. If the data contains discrepancies in column names, it raises
-        an assertion error.
+        of the data core, and creates the context of the message (if it is not passed) with the
+        file name based on the English table name and the current timestamp. The constant columns
+        of the context are attached to the rows by the rows buffer. It logs the process and handles
+        any exceptions that occur during data conversion. If the data contains discrepancies
+        in column names, it raises an assertion error.
 
         :param all_data: A dictionary containing the entire dataset to be processed.
         :param data: A list of data rows to be processed.
@@ -314,31 +384,121 @@ class Receive:
         :param eng_table_name: A string representing the English name of the table.
         :param key_deals: A string identifier for key deals.
         :param message_count: The count of messages in the queue.
-        :return: A string representing the generated file name.
+        :param context: The context of the message, shared by all the parts of a streamed message.
+        :return: None
         :raises AssertionError: If there are errors in data conversion or column name discrepancies.
         """
-        file_name: str = f"{eng_table_name}_{datetime.now(tz=TZ)}.json"
         self.logger.info(f'Starting read json. Length of json: {len(data)}. Table: {eng_table_name}')
-        list_columns_db = list(set(data_core.get_table_columns()) - set(data_core.removed_columns_db))
         original_date_string: str = data_core.original_date_string
-        lowercase_data: bool = isinstance(data_core, FreightRates)
+        key_mapper: Optional[KeyMapper] = data_core.key_mapper
         try:
-            for i in range(len(data)):
-                if lowercase_data:
-                    data[i] = data_core.convert_to_lowercase(data[i])
-                data_core.add_new_columns(data[i], file_name, original_date_string)
-                data_core.change_columns(data=data[i])
-                if original_date_string:
-                    data[i][original_date_string] = data[i][original_date_string].strip() or None
+            if context is None:
+                context = MessageContext(eng_table_name)
+                context.columns = data_core.get_constant_columns(context)
+            self.message_context = context
+            if key_mapper is not None:
+                data[:] = key_mapper.map_rows(data)
+            if not (COLUMNAR_MIN_ROWS and len(data) >= COLUMNAR_MIN_ROWS and data_core.convert_rows(data)):
+                for i in range(len(data)):
+                    if original_date_string:
+                        data[i][original_date_string] = ''
+                    data_core.change_columns(data=data[i])
+                    if original_date_string:
+                        data[i][original_date_string] = data[i][original_date_string].strip() or None
         except Exception as ex:
             self.logger.error(f"Error converting data types. Table: {eng_table_name}. Exception: {ex}")
             data_core.insert_message(all_data, key_deals, message_count, is_success_inserted=False)
             raise AssertionError("Stop consuming because receive an error where converting data types") from ex
-        if data and data_core.check_difference_columns(
-                all_data, list_columns_db, list(data[0].keys()), key_deals, message_count
-        ):
+        if data_core.validate_layouts(all_data, data, context.columns, key_deals, message_count):
+            SCHEMA_CACHE.invalidate(data_core.database, eng_table_name)
             raise AssertionError("Stop consuming because columns is different")
 
+    @staticmethod
+    def route_message(msg: Union[bytes, str, dict], headers: Optional[dict] = None) -> Optional[dict]:
+        """
+        Extracts the header of the message without parsing its rows.
+
+        The report, key_id and is_truncate fields are taken from the AMQP headers if the producer
+        sets them, otherwise the header is scanned from the first ROUTE_PREFIX_BYTES of the body,
+        or from the last ones if the header is the last item of the message.
+        A body that fits in ROUTE_PREFIX_BYTES is scanned for the data as well, so it is parsed
+        only once. In a bigger body the data is looked for in the prefix only for the truncate
+        messages, as it is empty for them.
+
+        :param msg: The message, which can be bytes, string, or dictionary.
+        :param headers: The AMQP headers of the message.
+        :return: The header and the data, if it was found, or None if the header cannot be had
+                 without parsing the message.
+        """
+        if not isinstance(msg, (bytes, bytearray, str)):
+            return None
+        if headers and "report" in headers:
+            routed: dict = {"header": {key: headers[key] for key in ROUTE_HEADERS if key in headers}}
+        else:
+            keys: Tuple[str, ...] = ("header", "data") if len(msg) <= ROUTE_PREFIX_BYTES else ("header",)
+            routed = JSON_DECODER.scan_prefix(msg, keys=keys)
+            if "header" not in routed:
+                routed = JSON_DECODER.scan_suffix(msg)
+            if "header" not in routed or not isinstance(routed["header"], dict):
+                return None
+        if routed["header"].get("is_truncate") and "data" not in routed:
+            routed.update(JSON_DECODER.scan_prefix(msg, keys=("data",)))
+        return routed
+
+    @staticmethod
+    def _is_known_report(header: dict) -> bool:
+        """
+        Checks whether the report of the message has a table.
+
+        :param header: The header of the message.
+        :return: True if the report has a table, False otherwise.
+        """
+        return bool(CLASS_NAMES_AND_TABLES.get(TABLE_NAMES.get(header.get("report"))))
+
+    def process_streamed_data(
+            self,
+            all_data: dict,
+            rows: Iterator[dict],
+            data_core: Any,
+            eng_table_name: str,
+            key_deals: str,
+            message_count: int
+    ) -> None:
+        """
+        Processes the rows of a big message part by part as they are parsed.
+
+        Every part of JSON_STREAM_CHUNK_ROWS rows is converted and appended to the rows buffer,
+        and the buffer is flushed as soon as the batch policy of the table says it is full,
+        so no more than a batch and a part of the rows of the message are held in memory.
+        The previous versions of the deal are cancelled with the first batch of the message only,
+        and the message is acknowledged with the batch of its last rows (see flush_message_part).
+        The first rows are kept in all_data for the audit log.
+
+        :param all_data: The header of the message and the list for the first rows.
+        :param rows: The rows of the message.
+        :param data_core: An instance of a data core class that provides methods for data manipulation.
+        :param eng_table_name: A string representing the English name of the table.
+        :param key_deals: A string identifier for key deals.
+        :param message_count: The count of messages in the queue.
+        :return: None
+        """
+        all_data["data"] = []
+        self.message_rows = 0
+        context: MessageContext = MessageContext(eng_table_name)
+        context.columns = data_core.get_constant_columns(context)
+        while chunk := list(itertools.islice(rows, JSON_STREAM_CHUNK_ROWS)):
+            self.process_data(all_data, chunk, data_core, eng_table_name, key_deals, message_count, context)
+            if not all_data["data"]:
+                all_data["data"] = chunk[:AUDIT_SAMPLE_ROWS]
+            rows_buffer: ColumnarBuffer = data_core.rows_buffer
+            rows_buffer.append_rows(chunk, context.columns)
+            self.message_rows += len(chunk)
+            if data_core.batch_policy.is_full(len(rows_buffer), rows_buffer.size_bytes, rows_buffer.age()):
+                if not self.is_key_deal_buffered:
+                    self.key_deals_buffer.append(key_deals)
+                    self.is_key_deal_buffered = True
+                data_core.flush_message_part()
+
     @staticmethod
     def _parse_message(msg: Union[bytes, str, dict]) -> Tuple[dict, str, str, bool]:
         """
@@ -352,8 +512,7 @@ class Receive:
         :return: A tuple containing the entire data as a dictionary, the Russian table name as a string,
                  and the key deals identifier as a string.
         """
-        msg: str = msg.decode('utf-8-sig') if isinstance(msg, (bytes, bytearray)) else msg
-        all_data: dict = json.loads(msg) if isinstance(msg, str) else msg
+        all_data: dict = JSON_DECODER.loads(msg) if isinstance(msg, (bytes, bytearray, str)) else msg
         rus_table_name: str = all_data.get("header", {}).get("report")
         key_deals: str = all_data.get("header", {}).get("key_id")
         is_truncate: bool = all_data.get("header", {}).get("is_truncate")
@@ -362,13 +521,17 @@ class Receive:
     def handle_incoming_json(
             self,
             msg: Union[bytes, str, dict],
-            message_count: int = 0
+            message_count: int = 0,
+            headers: Optional[dict] = None
     ) -> Tuple[dict, list, Any, Optional[str]]:
         """
         Handles an incoming JSON message.
 
         This method takes a message in the form of bytes, string, or dictionary.
-        It decodes the message if it is in bytes format, and then parses it to
+        The header of the message is routed first (see route_message): the small messages
+        and the truncate-only messages are not parsed any further, and only the first
+        AUDIT_SAMPLE_ROWS rows of a big message of an unknown report are parsed for the audit log.
+        Otherwise it decodes the message if it is in bytes format, and then parses it to
         extract the entire data, Russian table name, and key deals identifier.
 
         It then uses the Russian table name to look up the corresponding English
@@ -382,29 +545,68 @@ class Receive:
 
         :param msg: The message to be processed, which can be bytes, string, or dictionary.
         :param message_count: The count of messages in the queue.
+        :param headers: The AMQP headers of the message.
         :return: A tuple containing the entire data as a dictionary, the Russian table name as a string,
                  the name of the JSON file as a string (or None if the English table name is not found),
                  the data core instance (or None if the English table name is not found), and the key deals
                  identifier as a string.
         """
+        rows: Optional[Iterator[dict]] = None
+        self.is_key_deal_buffered = False
+        routed: Optional[dict] = self.route_message(msg, headers)
+        if routed is not None and "data" in routed:
+            msg = {"header": routed["header"], "data": routed["data"]}
+        elif JSON_DECODER.is_streamable(msg):
+            # Большое сообщение: сначала заголовок, строки потом по частям.
+            # Заголовок не в начале и не в конце сообщения - редкий случай, ради него сообщение читается дважды
+            rows = JSON_DECODER.iter_rows(msg)
+            header: dict = JSON_DECODER.load_header(msg) if routed is None else routed["header"]
+            if self._is_known_report(header):
+                msg = {"header": header, "data": list(itertools.islice(rows, 1))}
+            else:
+                msg = {"header": header, "data": list(itertools.islice(rows, AUDIT_SAMPLE_ROWS))}
+                rows = None
         all_data, rus_table_name, key_deals, is_truncate = self._parse_message(msg)
         eng_table_name: str = TABLE_NAMES.get(rus_table_name)
         self.table_name = eng_table_name
         data: list = list(all_data.get("data", []))
+        self.message_rows = len(data)
         data_core: Any = CLASS_NAMES_AND_TABLES.get(eng_table_name)
         if data_core:
             data_core.table = eng_table_name
             data_core: Any = data_core(self)
+            self.switch_table(data_core)
             if is_truncate and not data:
                 self.logger.warning(f"Data needs to be truncated. Table is {eng_table_name}")
                 data_core.delete_old_deals(cond="key_id IS NOT NULL")
                 return all_data, data, data_core, None
+            if rows is not None:
+                rows = itertools.chain(data, rows)
+                self.process_streamed_data(all_data, rows, data_core, eng_table_name, key_deals, message_count)
+                return all_data, [], data_core, key_deals
             self.process_data(all_data, data, data_core, eng_table_name, key_deals, message_count)
         else:
             self.logger.error(f"Not found table name in dictionary. Russian table is {rus_table_name}")
             self.table_name = rus_table_name
         return all_data, data, data_core, key_deals
 
+    def switch_table(self, data_core: Any) -> None:
+        """
+        Makes the table of data_core the table the rows are buffered for.
+
+        The rows buffered for the previous table are inserted first, so a batch holds the rows
+        of one table, and the current message is acknowledged with the batch of its rows.
+
+        :param data_core: An instance of the data core class of the table of the current message.
+        :return: None
+        """
+        previous: Optional[DataCoreClient] = self.data_core
+        if previous is not None and previous.table != data_core.table:
+            rows_buffer: Optional[ColumnarBuffer] = self.rows_buffers.get(previous.table)
+            if (rows_buffer is not None and len(rows_buffer)) or self.key_deals_buffer:
+                previous.flush_message_part()
+        self.data_core = data_core
+
     def write_to_json(
             self,
             msg: dict,
@@ -439,86 +641,412 @@ class Receive:
 
         return file_name
 
-    def process_queue(self, queue_name: str) -> None:
+    def _reject_unacked(self, queue_name: str, key_deals: Optional[str]) -> None:
         """
-        Processes a queue.
+        Returns all unacknowledged messages to the queue after a processing error.
 
-        This method processes a queue by consuming messages from it and executing
-        the callback function on each message. It also handles errors by logging
-        them and re-queueing the message.
+        The buffers are reset, the queue is marked as failed and the statistics are sent.
+
+        :param queue_name: The name of the queue the messages were received from.
+        :param key_deals: The key deals identifier of the message that caused the error.
+        :return: None
+        """
+        self.message_errors.append(key_deals)
+        last_delivery_tag: Optional[int] = self.delivery_tags[-1] if self.delivery_tags else None
+        if self.writer is not None:
+            last_delivery_tag = last_delivery_tag or self.writer.last_delivery_tag
+            written_delivery_tag: Optional[int] = self.writer.reset()
+            if written_delivery_tag:
+                self.rabbit_mq.channel.basic_ack(delivery_tag=written_delivery_tag, multiple=True)
+            if last_delivery_tag == written_delivery_tag:
+                last_delivery_tag = None
+        if last_delivery_tag:
+            self.rabbit_mq.channel.basic_nack(delivery_tag=last_delivery_tag, multiple=True)
+        self.queue_name_errors.append(queue_name)
+        self.reset_buffers()
+        self.send_stats()
+
+    def reset_buffers(self) -> None:
+        """
+        Drops the buffered rows, deals and delivery tags and the context of the last message.
+
+        :return: None
+        """
+        self.key_deals_buffer = []
+        self.rows_buffers = {}
+        self.delivery_tags = []
+        self.message_context = None
+        self.is_key_deal_buffered = False
+
+    def ack_written(self, wait: bool = False) -> None:
+        """
+        Acknowledges the messages of the batches the writer has written.
+
+        The acks are sent from the consumer thread, as the channel is not thread-safe.
+
+        :param wait: Whether to wait until every submitted batch is written.
+        :return: None
+        :raises ConnectionError: If the writer failed to write a batch.
+        """
+        if self.writer is None:
+            return
+        delivery_tag: Optional[int] = self.writer.pop_written(wait)
+        if delivery_tag:
+            self.rabbit_mq.channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+        if self.writer.error is not None:
+            raise ConnectionError(self.writer.error) from self.writer.error
+
+    def _handle_delivery(
+            self,
+            queue_name: str,
+            method_frame: Union[Basic.Deliver, Basic.GetOk],
+            header_frame: BasicProperties,
+            body: bytes,
+            message_count: int
+    ) -> bool:
+        """
+        Handles a single message received from the queue.
+
+        The delivery tag is remembered so that the message is acknowledged together with
+        the batch it belongs to. If the message cannot be processed, all unacknowledged
+        messages are returned to the queue.
+
+        :param queue_name: The name of the queue the message was received from.
+        :param method_frame: The method frame of the message.
+        :param header_frame: The header frame of the message.
+        :param body: The body of the message.
+        :param message_count: The count of messages left in the queue.
+        :return: True if the message was processed, False if the queue must be stopped.
+        """
+        self.logger.info(f"Got message with queue_name: {queue_name}")
+        try:
+            self.delivery_tags.append(method_frame.delivery_tag)
+            self.callback(self.rabbit_mq.channel, method_frame, header_frame, body, message_count)
+            self._update_message_size(self.message_rows, len(body))
+            self.ack_written()
+        except Exception as e:
+            self.logger.error(f"Ошибка обработки: {e}")
+            self.metrics.add(queue_name, self.table_name, count_errors=1)
+            routed: Optional[dict] = self.route_message(body, getattr(header_frame, "headers", None))
+            key_deals: Optional[str] = routed["header"].get("key_id") if routed else self._parse_message(body)[2]
+            self._reject_unacked(queue_name, key_deals)
+            return False
+        return True
+
+    def _flush_buffers(self, queue_name: str) -> bool:
+        """
+        Flushes the rows and log messages left in the buffers and acknowledges their messages.
+
+        It is used when the consumer stays idle, so the last batch of the queue is
+        uploaded without waiting for the queue to report that it is empty.
+
+        :param queue_name: The name of the queue the messages were received from.
+        :return: True if the buffers were flushed, False if the queue must be stopped.
+        """
+        try:
+            if self.delivery_tags and self.data_core:
+                self.data_core.flush_rows()
+                self.data_core.flush_log_messages()
+            self.ack_written(wait=True)
+        except Exception as e:
+            self.logger.error(f"Ошибка обработки: {e}")
+            self.metrics.add(queue_name, self.table_name, count_errors=1)
+            self._reject_unacked(queue_name, self.key_deals_buffer[-1] if self.key_deals_buffer else None)
+            return False
+        return True
+
+    def _get_queue(self, queue_name: str) -> None:
+        """
+        Processes a queue by pulling messages one by one with basic_get.
+
+        Basic.GetOk already carries the number of messages left in the queue,
+        so no additional request to the broker is needed.
 
         :param queue_name: The name of the queue to be processed.
         :return:
         """
-        self.queue_name: str = queue_name
-        self.count_message: int = 0
-
         while True:
             method_frame, header_frame, body = self.rabbit_mq.get(queue_name)
 
             if not method_frame or method_frame.NAME == 'Basic.GetEmpty':
+                self.queue_depth = 0
                 self.send_stats()
                 break
 
-            self.logger.info(f"Got message with queue_name: {queue_name}")
-            queue_info = self.rabbit_mq.channel.queue_declare(queue=queue_name, passive=True)
-            message_count = queue_info.method.message_count  # Количество сообщений в очереди
-            try:
-                self.delivery_tags.append(method_frame.delivery_tag)
-                self.callback(self.rabbit_mq.channel, method_frame, header_frame, body, message_count)
-            except Exception as e:
-                self.logger.error(f"Ошибка обработки: {e}")
-                self.message_errors.append(self._parse_message(body)[2])
-                self.rabbit_mq.channel.basic_nack(delivery_tag=self.delivery_tags[-1], multiple=True)
-                self.queue_name_errors.append(queue_name)
-                self.key_deals_buffer: list = []
-                self.rows_buffer: list = []
-                self.log_message_buffer: list = []
-                self.delivery_tags: list = []
-                self.send_stats()
+            message_count: int = method_frame.message_count  # Количество сообщений в очереди
+            self.queue_depth = message_count
+            if not self._handle_delivery(queue_name, method_frame, header_frame, body, message_count):
+                break
+            if message_count and self._is_turn_over():
+                self.is_queue_drained = False
+                self._flush_buffers(queue_name)
                 break
 
-    async def async_main(self):
+    def _get_queue_depth(self, queue_name: str) -> int:
         """
-        Asynchronously processes multiple RabbitMQ queues in parallel.
+        Returns the number of messages in the queue, probing the broker at most
+        once per QUEUE_DEPTH_PROBE_INTERVAL seconds.
+
+        :param queue_name: The name of the queue.
+        :return: The cached number of messages in the queue.
+        """
+        now: float = time_.monotonic()
+        if now - self.queue_depth_probed_at >= QUEUE_DEPTH_PROBE_INTERVAL:
+            self.queue_depth = self.rabbit_mq.message_count(queue_name)
+            self.queue_depth_probed_at = now
+        return self.queue_depth
+
+    def _update_message_size(self, rows: int, size_bytes: int) -> None:
+        """
+        Updates the moving averages of the rows and the bytes of the messages of the queue.
+
+        :param rows: The count of rows of the message.
+        :param size_bytes: The size of the body of the message.
+        :return: None
+        """
+        if self.rows_per_message is None:
+            self.rows_per_message, self.bytes_per_message = float(rows), float(size_bytes)
+            return
+        self.rows_per_message += (rows - self.rows_per_message) * MESSAGE_SIZE_SMOOTHING
+        self.bytes_per_message += (size_bytes - self.bytes_per_message) * MESSAGE_SIZE_SMOOTHING
+
+    def _get_prefetch_count(self) -> int:
+        """
+        Returns the prefetch window that holds the batches the batch policy of the table builds.
+
+        The messages of a batch stay unacknowledged until it is written, and up to WRITER_QUEUE_SIZE
+        batches wait for the writer, so the window covers them all. Otherwise the broker would stop
+        delivering before the batch policy flushes. The count of messages of a batch is estimated
+        from the average rows and bytes of the messages of the queue, so the messages prefetched
+        take about as much memory as the batches. The window is at least PREFETCH_COUNT and at most
+        PREFETCH_MAX_COUNT messages.
+
+        :return: The prefetch count.
+        """
+        if self.data_core is None or self.rows_per_message is None:
+            return PREFETCH_COUNT
+        policy: BatchPolicy = self.data_core.batch_policy
+        messages_per_batch: float = min(
+            policy.target_rows / max(self.rows_per_message, 1.0),
+            policy.max_bytes / max(self.bytes_per_message, 1.0)
+        )
+        prefetch_count: int = math.ceil(messages_per_batch * (WRITER_QUEUE_SIZE + 1)) + 1
+        return min(max(prefetch_count, PREFETCH_COUNT), PREFETCH_MAX_COUNT)
+
+    def _consume_queue(self, queue_name: str, prefetch_count: Optional[int] = None) -> None:
+        """
+        Processes a queue with a push consumer (basic_consume) and manual acks.
+
+        The broker pushes up to prefetch_count messages ahead, so there is no round trip
+        per message. The window is sized from the batch policy of the table (see _get_prefetch_count),
+        so the batches are flushed by the policy and not by the window filling up.
+        An empty queue is detected with one depth probe, without subscribing.
+        The messages left for the consumer are the ones buffered on the client
+        plus the queue depth, which is probed periodically instead of for every message.
+        The queue is considered drained when no message arrives within the inactivity
+        timeout, then whatever is left in the buffers is flushed. When the turn budget
+        runs out, the buffers are flushed and the consumer is cancelled, so the messages
+        prefetched but not processed go back to the queue.
 
-        This method sets up a loop to continuously process messages from multiple
-        RabbitMQ queues. It uses an asyncio semaphore to limit the number of
-        concurrent tasks to 10. For each queue, it creates and binds the queue
-        once and then continually processes messages from it, unless the queue
-        is in the error list. The method sleeps for a specified delay between
-        processing cycles.
+        :param queue_name: The name of the queue to be processed.
+        :param prefetch_count: The maximum number of unacknowledged messages delivered to the consumer,
+                               by default it is sized from the batch policy.
+        :return:
+        """
+        prefetch_count = prefetch_count or self._get_prefetch_count()
+        self.queue_depth_probed_at = 0.0
+        if not self.delivery_tags and self._get_queue_depth(queue_name) == 0:
+            self.send_stats()
+            return
+        try:
+            for method_frame, header_frame, body in self.rabbit_mq.consume(queue_name, prefetch_count):
+                if method_frame is None:
+                    self.queue_depth = 0
+                    if self._flush_buffers(queue_name):
+                        self.send_stats()
+                    break
+
+                message_count: int = self._get_queue_depth(queue_name) + self.rabbit_mq.waiting_message_count()
+                if not self._handle_delivery(queue_name, method_frame, header_frame, body, message_count):
+                    break
+                if self._is_turn_over():
+                    self.is_queue_drained = False
+                    self._flush_buffers(queue_name)
+                    break
+        finally:
+            self.rabbit_mq.cancel()
+        if not self.is_queue_drained:
+            self.queue_depth = self.rabbit_mq.message_count(queue_name)
+
+    def _is_turn_over(self) -> bool:
+        """
+        Checks whether the queue has used up its budget of rows or time for the current turn.
+
+        :return: True if the turn is over, False otherwise.
+        """
+        return (
+            self.turn_rows >= self.turn_max_rows
+            or time_.monotonic() - self.turn_started_at >= self.turn_max_seconds
+        )
+
+    def process_queue(
+            self,
+            queue_name: str,
+            max_rows: int = TURN_MAX_ROWS,
+            max_seconds: float = TURN_MAX_SECONDS
+    ) -> int:
+        """
+        Processes a queue for one turn.
+
+        This method processes a queue by consuming messages from it and executing
+        the callback function on each message. Depending on CONSUMER_MODE messages
+        are either pushed by the broker (consume) or pulled one by one (get).
+        It also handles errors by logging them and re-queueing the message.
+
+        The turn ends when the queue is drained or when max_rows rows have been
+        processed or max_seconds have passed, so one large queue does not hold
+        a slot while the other queues wait. The statistics of the queue are
+        accumulated across turns until the queue is drained.
+
+        :param queue_name: The name of the queue to be processed.
+        :param max_rows: The budget of rows for the turn.
+        :param max_seconds: The budget of time for the turn.
+        :return: The count of messages processed during the turn.
+        """
+        self._refresh_logger()
+        self.queue_name: str = queue_name
+        if self.is_queue_drained:
+            self.count_message: int = 0
+        self.is_queue_drained = True
+        self.turn_messages = 0
+        self.turn_rows = 0
+        self.turn_max_rows = max_rows
+        self.turn_max_seconds = max_seconds
+        self.turn_started_at = time_.monotonic()
+
+        with self.rabbit_mq.lease(queue_name):
+            if CONSUMER_MODE == "get":
+                self._get_queue(queue_name)
+            else:
+                self._consume_queue(queue_name)
+            if self.writer is not None and self.writer.in_flight:
+                # Подтверждения привязаны к каналу, поэтому дожидаемся записи до конца хода
+                self._flush_buffers(queue_name)
+        return self.turn_messages
+
+    def run_worker(self, workers: dict, queue_name: str) -> Tuple[int, int]:
+        """
+        Processes a queue with a long-lived worker.
 
-        A separate limited_process coroutine is used to handle the processing
-        of each queue, allowing for parallel execution of up to 10 queues.
+        Each queue keeps its own Receive instance (ClickHouse client, logger and stats
+        database) across cycles, so a cycle only costs the message work. The RabbitMQ
+        connections are shared by the workers through the connection pool, each queue
+        gets its own channel. The worker is created on the first cycle. A lost connection
+        or channel is re-established before the queue is processed. If the connection
+        fails while the queue is being processed, the worker reconnects for the next
+        cycle, and if even that is impossible, it is dropped and created again on the
+        next cycle.
 
+        :param workers: The long-lived workers by queue name.
+        :param queue_name: The name of the queue to be processed.
+        :return: The count of messages processed during the turn and the count of messages left in the queue.
+        """
+        worker: Optional[Receive] = workers.get(queue_name)
+        try:
+            if worker is None:
+                worker = Receive(rabbit_mq_pool=self.rabbit_mq_pool)
+                worker.queue_name_errors = self.queue_name_errors
+                workers[queue_name] = worker
+            return worker.process_queue(queue_name), worker.queue_depth
+        except (AMQPError, ConnectionError) as ex:
+            self.logger.error(f"Connection error in worker for queue {queue_name}: {ex}. Type error is {type(ex)}")
+            if worker is None:
+                return 0, 0
+            try:
+                worker.reconnect()
+            except Exception as ex_reconnect:
+                self.logger.error(f"Couldn't reconnect worker for queue {queue_name}: {ex_reconnect}")
+                worker.close()
+                workers.pop(queue_name, None)
+            return 0, 0
+
+    @staticmethod
+    async def _report_stats(scheduler: QueueScheduler, stats_queue: multiprocessing.Queue) -> None:
+        """
+        Periodically sends the count of processed messages by queue to the supervisor.
+
+        :param scheduler: The scheduler of the queues.
+        :param stats_queue: The queue the supervisor collects the statistics from.
         :return: None
         """
-        loop: AbstractEventLoop = asyncio.get_running_loop()
-        delay: int = 60
-        semaphore: asyncio.Semaphore = asyncio.Semaphore(10)  # максимум 10 параллельных задач
+        while True:
+            await asyncio.sleep(STATS_REPORT_INTERVAL)
+            stats_queue.put((os.getpid(), scheduler.pop_counters()))
 
-        async def limited_process(queue_name_):
-            async with semaphore:
-                receive_instance: Receive = Receive()
-                receive_instance.queue_name_errors = self.queue_name_errors
-                await loop.run_in_executor(None, receive_instance.process_queue, queue_name_)
+    async def async_main(
+            self,
+            queue_names: Optional[list] = None,
+            max_concurrency: int = MAX_CONCURRENT_QUEUES,
+            stats_queue: Optional[multiprocessing.Queue] = None
+    ):
+        """
+        Asynchronously processes multiple RabbitMQ queues in parallel.
+
+        This method creates and binds the queues once and then hands them over to
+        the QueueScheduler, which processes up to max_concurrency queues at the same
+        time, turn by turn, unless the queue is in the error list. Every turn has a
+        budget of rows and time, and free slots go to the queues that waited the longest,
+        weighted by their backlog, so small queues keep flowing while a large one
+        is drained. Drained queues are polled adaptively, from POLL_MIN_DELAY to
+        POLL_MAX_DELAY seconds. Every queue is processed by its own long-lived
+        worker (see run_worker), the workers share RABBITMQ_CONNECTIONS connections.
+
+        Declaring the queues and probing the depth of the idle ones is done by
+        AsyncRabbitMQ on the event loop, over one connection with a channel per
+        queue, so an idle queue does not occupy a worker thread.
+
+        When the queues are sharded across processes (see Supervisor), the process
+        handles only its queue_names and reports its statistics to stats_queue.
+
+        The instance only coordinates the workers, so it is created with is_worker=False
+        and opens no connections of its own.
+
+        :param queue_names: The names of the queues to process, all the queues from the config by default.
+        :param max_concurrency: The maximum number of queues processed at the same time.
+        :param stats_queue: The queue the supervisor collects the statistics from.
+        :return: None
+        """
+        queue_names = list(QUEUES_AND_ROUTING_KEYS.keys()) if queue_names is None else queue_names
+        workers: dict = {}
+        rabbit_mq_async: AsyncRabbitMQ = AsyncRabbitMQ()
+        self.rabbit_mq_pool = RabbitMQConnectionPool(size=min(RABBITMQ_CONNECTIONS, max_concurrency))
 
         # 1. Создаём и привязываем очереди один раз
         ip_server: str = get_my_env_var('HOST_HOSTNAME')
-        for queue_name, routing_key in QUEUES_AND_ROUTING_KEYS.items():
+        for queue_name in queue_names:
             if SERVER_AND_SUFFIX_QUEUE.get(queue_name.split("_")[-1]) != ip_server:
                 raise "Queues don't match servers"
-            self.rabbit_mq.declare_and_bind_queue(queue_name, routing_key)
-        while True:
-            tasks: list = [
-                limited_process(queue_name)
-                for queue_name in QUEUES_AND_ROUTING_KEYS.keys()
-                if queue_name not in self.queue_name_errors
-            ]
-            if tasks:
-                await asyncio.gather(*tasks)
-            await asyncio.sleep(delay)
+            await rabbit_mq_async.declare_and_bind_queue(queue_name, QUEUES_AND_ROUTING_KEYS[queue_name])
+        scheduler: QueueScheduler = QueueScheduler(
+            queue_names=queue_names,
+            run_turn=functools.partial(self.run_worker, workers),
+            queue_name_errors=self.queue_name_errors,
+            max_concurrency=max_concurrency,
+            probe_depth=rabbit_mq_async.message_count
+        )
+        report_task: Optional[asyncio.Future] = None
+        if stats_queue is not None:
+            report_task = asyncio.ensure_future(self._report_stats(scheduler, stats_queue))
+        try:
+            await scheduler.run()
+        finally:
+            if report_task is not None:
+                report_task.cancel()
+            await rabbit_mq_async.close()
+            self.rabbit_mq_pool.close()
+            self.audit_log.close()
+            self.metrics.close()
+            self.stats_store.flush()
 
 
 CLASSES: list = [
@@ -564,5 +1092,10 @@ CLASSES: list = [
 CLASS_NAMES_AND_TABLES: dict = dict(zip(list(TABLE_NAMES.values()), CLASSES))
 
 if __name__ == '__main__':
-    # Для запуска асинхронного main
-    asyncio.run(Receive().async_main())
+    if WORKER_PROCESSES > 1:
+        # Очереди распределяются по нескольким процессам
+        from scripts.supervisor import Supervisor
+        Supervisor(list(QUEUES_AND_ROUTING_KEYS.keys())).run()
+    else:
+        # Для запуска асинхронного main
+        asyncio.run(Receive(is_worker=False).async_main())
@@ -0,0 +1,158 @@
+import math
+import asyncio
+import time as time_
+from asyncio import AbstractEventLoop
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from scripts.__init__ import POLL_MIN_DELAY, POLL_MAX_DELAY
+
+
+class QueueState:
+    def __init__(self, queue_name: str):
+        self.queue_name: str = queue_name
+        self.depth: int = 0
+        self.count_message: int = 0
+        self.ready_at: float = 0.0
+        self.delay: float = POLL_MIN_DELAY
+        self.is_running: bool = False
+
+    def priority(self, now: float) -> float:
+        """
+        Returns the priority of the queue for the next turn.
+
+        The priority grows with the time the queue has been waiting for a turn, which is
+        the age of its oldest message that was not served yet, and grows faster for deeper
+        backlogs. Every waiting queue eventually gets a turn, and a queue that has just
+        had its turn goes to the back.
+
+        :param now: The current monotonic time.
+        :return: The priority, the higher the sooner the queue gets a turn.
+        """
+        return (now - self.ready_at) * (1 + math.log10(1 + self.depth))
+
+    def update(self, count_message: int, depth: int, now: float) -> None:
+        """
+        Updates the state of the queue after its turn.
+
+        A queue with messages left (the turn budget ran out) is ready again right away.
+        A drained queue is polled again after POLL_MIN_DELAY seconds if it had messages,
+        and every idle poll doubles the delay up to POLL_MAX_DELAY seconds.
+
+        :param count_message: The count of messages processed during the turn.
+        :param depth: The count of messages left in the queue.
+        :param now: The current monotonic time.
+        :return: None
+        """
+        self.depth = depth
+        self.count_message += count_message
+        if depth:
+            self.delay = POLL_MIN_DELAY
+            self.ready_at = now
+        else:
+            self.delay = POLL_MIN_DELAY if count_message else min(self.delay * 2, POLL_MAX_DELAY)
+            self.ready_at = now + self.delay
+
+
+class QueueScheduler:
+    def __init__(
+        self,
+        queue_names: List[str],
+        run_turn: Callable[[str], Tuple[int, int]],
+        queue_name_errors: list,
+        max_concurrency: int = 10,
+        probe_depth: Optional[Callable[[str], Awaitable[int]]] = None
+    ):
+        self.states: Dict[str, QueueState] = {queue_name: QueueState(queue_name) for queue_name in queue_names}
+        self.run_turn: Callable[[str], Tuple[int, int]] = run_turn
+        self.queue_name_errors: list = queue_name_errors
+        self.max_concurrency: int = max_concurrency
+        self.probe_depth: Optional[Callable[[str], Awaitable[int]]] = probe_depth
+
+    def pop_counters(self) -> Dict[str, int]:
+        """
+        Returns the count of messages processed by every queue since the previous call and resets it.
+
+        :return: The count of processed messages by queue name.
+        """
+        counters: Dict[str, int] = {}
+        for state in self.states.values():
+            counters[state.queue_name], state.count_message = state.count_message, 0
+        return counters
+
+    def get_due_queues(self, now: float) -> List[QueueState]:
+        """
+        Returns the queues that are ready for a turn, the most urgent first.
+
+        :param now: The current monotonic time.
+        :return: A list of queue states sorted by priority.
+        """
+        due: List[QueueState] = [
+            state for state in self.states.values()
+            if not state.is_running and state.ready_at <= now and state.queue_name not in self.queue_name_errors
+        ]
+        return sorted(due, key=lambda state: state.priority(now), reverse=True)
+
+    async def _probe(self, queue_name: str) -> Optional[int]:
+        """
+        Returns the depth of the queue without occupying a worker thread.
+
+        :param queue_name: The name of the queue.
+        :return: The count of messages in the queue, or None if it is unknown.
+        """
+        try:
+            return await self.probe_depth(queue_name)
+        except Exception:
+            return None  # глубина неизвестна, очередь проверит сам worker
+
+    async def _turn(self, loop: AbstractEventLoop, state: QueueState) -> None:
+        """
+        Runs one turn of the queue in the thread pool and updates its state.
+
+        A queue that was empty last time is probed on the event loop first,
+        and the turn is skipped if it is still empty.
+
+        :param loop: The running event loop.
+        :param state: The state of the queue.
+        :return: None
+        """
+        try:
+            if self.probe_depth is not None and not state.depth and await self._probe(state.queue_name) == 0:
+                count_message, depth = 0, 0
+            else:
+                count_message, depth = await loop.run_in_executor(None, self.run_turn, state.queue_name)
+        finally:
+            state.is_running = False
+        state.update(count_message, depth, time_.monotonic())
+
+    async def run(self) -> None:
+        """
+        Schedules the turns of the queues until every queue is in the error list.
+
+        Up to max_concurrency queues are processed at the same time. Whenever a slot is
+        free, the due queue with the highest priority gets it, so small queues keep
+        flowing while a large one is drained turn by turn.
+
+        :return: None
+        """
+        loop: AbstractEventLoop = asyncio.get_running_loop()
+        running: Set[asyncio.Future] = set()
+        while True:
+            states: List[QueueState] = [
+                state for state in self.states.values() if state.queue_name not in self.queue_name_errors
+            ]
+            if not states and not running:
+                return
+            now: float = time_.monotonic()
+            for state in self.get_due_queues(now)[:self.max_concurrency - len(running)]:
+                state.is_running = True
+                running.add(asyncio.ensure_future(self._turn(loop, state)))
+
+            waiting: List[float] = [state.ready_at for state in states if not state.is_running]
+            timeout: Optional[float] = None
+            if len(running) < self.max_concurrency and waiting:
+                timeout = max(min(waiting) - now, 0.0)
+            if running:
+                done, running = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            else:
+                await asyncio.sleep(POLL_MIN_DELAY if timeout is None else timeout)
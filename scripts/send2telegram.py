@@ -1,5 +1,6 @@
 import sqlite3
 import requests
+import contextlib
 from scripts.__init__ import *
 from notifiers import get_notifier
 from sqlite3 import Connection, Cursor
@@ -45,13 +46,101 @@ def handle_message(logs: dict, message: str, total_lines: int) -> str:
     return message
 
 
+# Ограничение Telegram на длину текста сообщения, с запасом на заголовок и HTML-разметку
+TELEGRAM_TEXT_LIMIT: int = 3500
+
+
+def handle_metrics(rows: list) -> list:
+    """
+    Формирует сводку по производительности обработки: строки, объём, время разбора и вставки, ошибки.
+    :param rows: Строки таблицы metrics.
+    :return: Блоки сводки по очередям и таблицам.
+    """
+    messages: list = []
+    for queue, table, _, count, count_rows, size_bytes, parse_seconds, insert_seconds, count_errors in rows:
+        insert_speed: str = f"{count_rows / insert_seconds:.0f} строк/с" if insert_seconds else "-"
+        messages.append(
+            f"📥 Очередь: `{queue}`, таблица: `{table}`\n"
+            f"🔢 Сообщений: {count}, строк: {count_rows}, объём: {size_bytes / 1024 / 1024:.1f} МБ\n"
+            f"⏱ Разбор: {parse_seconds:.1f} с, вставка: {insert_seconds:.1f} с ({insert_speed})\n"
+            f"❗ Ошибок: {count_errors}\n"
+        )
+    return messages
+
+
+def split_message(blocks: list, limit: int = TELEGRAM_TEXT_LIMIT) -> list:
+    """
+    Собирает блоки в сообщения не длиннее limit символов. Слишком длинный блок обрезается.
+    :param blocks: Блоки текста.
+    :param limit: Максимальная длина сообщения.
+    :return: Сообщения.
+    """
+    messages: list = []
+    current: str = ""
+    for block in blocks:
+        block = block[:limit]
+        if current and len(current) + 1 + len(block) > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{block}" if current else block
+    if current:
+        messages.append(current)
+    return messages
+
+
+def send_telegram(title: str, message: str) -> requests.Response:
+    """
+    Отправляет сообщение в Telegram.
+    :param title: Заголовок сообщения.
+    :param message: Текст сообщения, он сворачивается в цитату.
+    :return: Ответ Telegram.
+    """
+    params: dict = {
+        "chat_id": f"{get_my_env_var('CHAT_ID')}/{get_my_env_var('TOPIC')}",
+        "text": f"{title}\n<blockquote expandable>{message}</blockquote>",
+        "parse_mode": "HTML",
+        "reply_to_message_id": get_my_env_var('MESSAGE_ID')
+    }
+    url: str = f"https://api.telegram.org/bot{get_my_env_var('TOKEN_TELEGRAM')}/sendMessage"
+    response = requests.get(url, params=params)
+    response.raise_for_status()
+    return response
+
+
+def delete_sent_metrics(conn: Connection, rows: list) -> None:
+    """
+    Вычитает отправленные метрики из таблицы metrics и удаляет опустевшие строки.
+
+    Пока сводка отправлялась, процессы могли добавить к метрикам новые значения,
+    поэтому строки не удаляются целиком.
+    :param conn: Соединение с файлом статистики.
+    :param rows: Отправленные строки таблицы metrics.
+    :return: None
+    """
+    with conn:
+        conn.executemany('''
+            UPDATE metrics SET
+                count_message = count_message - ?,
+                count_rows = count_rows - ?,
+                size_bytes = size_bytes - ?,
+                parse_seconds = parse_seconds - ?,
+                insert_seconds = insert_seconds - ?,
+                count_errors = count_errors - ?
+            WHERE queue_name = ? AND table_name = ?
+        ''', [(*row[3:], row[0], row[1]) for row in rows])
+        conn.execute(
+            'DELETE FROM metrics WHERE count_message = 0 AND count_rows = 0 AND size_bytes = 0 AND count_errors = 0'
+        )
+
+
 def send_message():
     logger: get_logger = get_logger(str(os.path.basename(__file__).replace(".py", "")))
     logger.info("Send message to telegram")
     message: str = "Не было сообщений"
+    metrics: list = []
 
     if os.path.exists(LOG_FILE):
-        conn: Connection = sqlite3.connect(LOG_FILE)
+        conn: Connection = sqlite3.connect(LOG_FILE, timeout=30)
         try:
             cursor: Cursor = conn.cursor()
             cursor.execute('SELECT * FROM stats')
@@ -70,20 +159,26 @@ def send_message():
                 # Очищаем таблицу после отправки сообщения
                 cursor.execute('DELETE FROM stats')
                 conn.commit()
+            with contextlib.suppress(sqlite3.OperationalError):  # Таблицы metrics нет в старых файлах статистики
+                cursor.execute('SELECT * FROM metrics ORDER BY queue_name, table_name')
+                metrics = cursor.fetchall()
         finally:
             conn.close()
 
-    params: dict = {
-        "chat_id": f"{get_my_env_var('CHAT_ID')}/{get_my_env_var('TOPIC')}",
-        "text": f"Статистика обработки сообщений за день с RabbitMQ на сервере {get_my_env_var('HOST_HOSTNAME')}:\n"
-                f"<blockquote expandable>{message}</blockquote>",
-        "parse_mode": "HTML",
-        "reply_to_message_id": get_my_env_var('MESSAGE_ID')
-    }
-    url: str = f"https://api.telegram.org/bot{get_my_env_var('TOKEN_TELEGRAM')}/sendMessage"
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    send_email_notifiers(params.get('text'))
+    title: str = f"Статистика обработки сообщений за день с RabbitMQ на сервере {get_my_env_var('HOST_HOSTNAME')}:"
+    response = send_telegram(title, message)
+    if metrics:
+        # Сводка может не поместиться в одно сообщение, метрики удаляются только после отправки всех частей
+        for part in split_message(handle_metrics(metrics)):
+            send_telegram("📉 Производительность:", part)
+        message += "\n\n📉 Производительность:\n" + "\n".join(handle_metrics(metrics))
+    send_email_notifiers(f"{title}\n<blockquote expandable>{message}</blockquote>")
+    if metrics:
+        conn = sqlite3.connect(LOG_FILE, timeout=30)
+        try:
+            delete_sent_metrics(conn, metrics)
+        finally:
+            conn.close()
     return response
 
 
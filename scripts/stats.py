@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+from sqlite3 import Connection
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from scripts.__init__ import STATS_FLUSH_INTERVAL
+
+
+class StatsStore:
+    def __init__(self, path: str, flush_interval: float = STATS_FLUSH_INTERVAL):
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.lock: threading.RLock = threading.RLock()
+        self.pending: Dict[str, Tuple[int, Optional[str], str]] = {}
+        self.timer: Optional[threading.Timer] = None
+        self.conn: Connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA busy_timeout=30000')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats (
+                queue_name TEXT PRIMARY KEY,
+                timestamp TEXT,
+                count_message INTEGER,
+                processed_table TEXT
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS metrics (
+                queue_name TEXT,
+                table_name TEXT,
+                timestamp TEXT,
+                count_message INTEGER,
+                count_rows INTEGER,
+                size_bytes INTEGER,
+                parse_seconds REAL,
+                insert_seconds REAL,
+                count_errors INTEGER,
+                PRIMARY KEY (queue_name, table_name)
+            )
+        ''')
+        self.conn.commit()
+
+    def increment(self, queue_name: str, count_message: int, processed_table: Optional[str], timestamp: str) -> None:
+        """
+        Adds the processed messages to the statistics of the queue.
+
+        The increments are collected in memory and written in one transaction
+        flush_interval seconds after the first of them.
+
+        :param queue_name: The name of the queue.
+        :param count_message: The count of messages processed.
+        :param processed_table: The name of the table the messages were processed into.
+        :param timestamp: The time of the update.
+        :return: None
+        """
+        with self.lock:
+            pending_count: int = self.pending[queue_name][0] if queue_name in self.pending else 0
+            self.pending[queue_name] = (pending_count + count_message, processed_table, timestamp)
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> None:
+        """
+        Writes the collected increments with one UPSERT per queue in a single transaction.
+
+        :return: None
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT INTO stats (queue_name, timestamp, count_message, processed_table)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(queue_name) DO UPDATE SET
+                        count_message = count_message + excluded.count_message,
+                        processed_table = excluded.processed_table,
+                        timestamp = excluded.timestamp
+                ''', [
+                    (queue_name, timestamp, count_message, processed_table)
+                    for queue_name, (count_message, processed_table, timestamp) in pending.items()
+                ])
+
+    def load(self) -> dict:
+        """
+        Loads the statistics of all the queues, including the increments not written yet.
+
+        :return: The statistics by queue name.
+        """
+        with self.lock:
+            self.flush()
+            rows: list = self.conn.execute('SELECT * FROM stats').fetchall()
+        return {
+            row[0]: {
+                "timestamp": row[1],
+                "count_message": row[2],
+                "processed_table": row[3]
+            }
+            for row in rows
+        }
+
+    def save(self, stats: dict) -> None:
+        """
+        Replaces the statistics of the given queues.
+
+        :param stats: The statistics by queue name.
+        :return: None
+        """
+        with self.lock:
+            self.flush()
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT OR REPLACE INTO stats (queue_name, timestamp, count_message, processed_table)
+                    VALUES (?, ?, ?, ?)
+                ''', [
+                    (queue_name, data["timestamp"], data["count_message"], data["processed_table"])
+                    for queue_name, data in stats.items()
+                ])
+
+    def add_metrics(self, metrics: Dict[Tuple[str, str], List[float]]) -> None:
+        """
+        Adds the counters of the metrics registry to the metrics of the queues and tables.
+
+        :param metrics: The values of METRIC_NAMES by queue and table.
+        :return: None
+        """
+        timestamp: str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT INTO metrics (
+                        queue_name, table_name, timestamp, count_message, count_rows,
+                        size_bytes, parse_seconds, insert_seconds, count_errors
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(queue_name, table_name) DO UPDATE SET
+                        timestamp = excluded.timestamp,
+                        count_message = count_message + excluded.count_message,
+                        count_rows = count_rows + excluded.count_rows,
+                        size_bytes = size_bytes + excluded.size_bytes,
+                        parse_seconds = parse_seconds + excluded.parse_seconds,
+                        insert_seconds = insert_seconds + excluded.insert_seconds,
+                        count_errors = count_errors + excluded.count_errors
+                ''', [
+                    (queue_name, table_name, timestamp, *values)
+                    for (queue_name, table_name), values in metrics.items()
+                ])
+
+    def close(self) -> None:
+        """
+        Writes the increments left and closes the connection.
+
+        :return: None
+        """
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+
+STATS_STORES: Dict[str, StatsStore] = {}
+STATS_STORES_LOCK: threading.Lock = threading.Lock()
+
+
+def get_stats_store(path: str) -> StatsStore:
+    """
+    Returns the stats store of the SQLite file, shared by all the workers of the process.
+
+    :param path: The path to the SQLite file.
+    :return: The stats store.
+    """
+    with STATS_STORES_LOCK:
+        if path not in STATS_STORES:
+            STATS_STORES[path] = StatsStore(path)
+        return STATS_STORES[path]
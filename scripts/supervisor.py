@@ -0,0 +1,181 @@
+import math
+import queue
+import asyncio
+import multiprocessing
+import time as time_
+from scripts.__init__ import *
+from typing import Dict, List
+from multiprocessing.process import BaseProcess
+
+
+def shard_queues(queue_names: List[str], processes: int) -> List[List[str]]:
+    """
+    Splits the queues into shards, one shard per worker process.
+
+    The queues are dealt round-robin, so the queues of the same server, which go one
+    after another in the config, end up in different processes.
+
+    :param queue_names: The names of the queues.
+    :param processes: The count of worker processes.
+    :return: A list of non-empty shards.
+    """
+    shards: List[List[str]] = [queue_names[index::processes] for index in range(max(processes, 1))]
+    return [shard for shard in shards if shard]
+
+
+def run_shard(
+    queue_names: List[str],
+    max_concurrency: int,
+    stats_queue: multiprocessing.Queue,
+    process_name: str = ""
+) -> None:
+    """
+    Processes the shard of the queues in a worker process.
+
+    Every process has its own connections to RabbitMQ and ClickHouse and its own log files,
+    nothing is shared with the supervisor except stats_queue.
+
+    :param queue_names: The names of the queues of the shard.
+    :param max_concurrency: The maximum number of queues processed at the same time.
+    :param stats_queue: The queue the supervisor collects the statistics from.
+    :param process_name: The name of the worker process, it is added to the names of the log files.
+    :return: None
+    """
+    if process_name:
+        set_log_name_suffix(f"_{process_name}")
+    from scripts.receive import Receive
+    asyncio.run(Receive(is_worker=False).async_main(queue_names, max_concurrency, stats_queue))
+
+
+class Supervisor:
+    def __init__(
+        self,
+        queue_names: List[str],
+        processes: int = WORKER_PROCESSES,
+        max_concurrency: int = MAX_CONCURRENT_QUEUES,
+        restart_delay: float = 10.0,
+        max_restarts: int = WORKER_MAX_RESTARTS,
+        stable_seconds: float = 600.0
+    ):
+        self.logger: logging.getLogger = get_logger("supervisor")
+        self.shards: List[List[str]] = shard_queues(queue_names, processes)
+        self.max_concurrency: int = max(math.ceil(max_concurrency / max(len(self.shards), 1)), 1)
+        self.restart_delay: float = restart_delay
+        self.max_restarts: int = max_restarts
+        self.stable_seconds: float = stable_seconds
+        self.stats_queue: multiprocessing.Queue = multiprocessing.Queue()
+        self.processes: Dict[int, BaseProcess] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.restarts: Dict[int, int] = {}
+        self.started_at: Dict[int, float] = {}
+        self.stats: Dict[str, int] = {}
+
+    def _start(self, index: int, now: float) -> None:
+        """
+        Starts the worker process of the shard.
+
+        :param index: The index of the shard.
+        :param now: The current monotonic time.
+        :return: None
+        """
+        name: str = f"receive-{index}"
+        process: BaseProcess = multiprocessing.Process(
+            target=run_shard,
+            args=(self.shards[index], self.max_concurrency, self.stats_queue, name),
+            name=name,
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = now
+        self.logger.info(f"Worker {process.name} (pid {process.pid}) started. Queues: {self.shards[index]}")
+
+    def _check_processes(self, now: float) -> None:
+        """
+        Checks the worker processes and restarts the crashed ones.
+
+        A process that exited with code 0 has no queues left to process and is not restarted.
+        The delay before a restart doubles with every crash in a row, starting from restart_delay,
+        as a crash that repeats is likely to be deterministic (e.g. a wrong config). The shard is
+        given up after max_restarts crashes in a row. A process that worked for stable_seconds
+        before it crashed starts the count over.
+
+        :param now: The current monotonic time.
+        :return: None
+        """
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            if process.exitcode == 0:
+                self.logger.info(f"Worker {process.name} finished. Queues: {self.shards[index]}")
+                del self.processes[index]
+            elif index not in self.restart_at:
+                if now - self.started_at[index] >= self.stable_seconds:
+                    self.restarts[index] = 0
+                restarts: int = self.restarts.get(index, 0) + 1
+                if restarts > self.max_restarts:
+                    self.logger.error(
+                        f"Worker {process.name} crashed with exit code {process.exitcode} {restarts} times in a row. "
+                        f"Giving up the queues: {self.shards[index]}"
+                    )
+                    del self.processes[index]
+                    continue
+                delay: float = self.restart_delay * 2 ** (restarts - 1)
+                self.logger.error(
+                    f"Worker {process.name} crashed with exit code {process.exitcode}. "
+                    f"Restart {restarts} of {self.max_restarts} in {delay} seconds"
+                )
+                self.restarts[index] = restarts
+                self.restart_at[index] = now + delay
+            elif self.restart_at[index] <= now:
+                del self.restart_at[index]
+                self._start(index, now)
+
+    def _collect_stats(self, timeout: float) -> None:
+        """
+        Collects the count of processed messages sent by the workers.
+
+        :param timeout: How long to wait for the statistics, in seconds.
+        :return: None
+        """
+        try:
+            _, counters = self.stats_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        for queue_name, count_message in counters.items():
+            self.stats[queue_name] = self.stats.get(queue_name, 0) + count_message
+
+    def _report_stats(self, report_interval: float) -> None:
+        """
+        Logs the count of messages processed by every queue since the previous report.
+
+        :param report_interval: How often the statistics are logged, in seconds.
+        :return: None
+        """
+        total: int = sum(self.stats.values())
+        busy: Dict[str, int] = {queue_name: count for queue_name, count in self.stats.items() if count}
+        self.logger.info(f"Processed {total} messages in {report_interval} seconds. By queue: {busy}")
+        self.stats = {}
+
+    def run(self, report_interval: float = STATS_REPORT_INTERVAL) -> None:
+        """
+        Starts a worker process per shard and supervises them until every worker is finished.
+
+        :param report_interval: How often to log the aggregated statistics, in seconds.
+        :return: None
+        """
+        report_at: float = time_.monotonic() + report_interval
+        for index in range(len(self.shards)):
+            self._start(index, time_.monotonic())
+        try:
+            while self.processes:
+                self._collect_stats(timeout=1.0)
+                now: float = time_.monotonic()
+                self._check_processes(now)
+                if now >= report_at:
+                    self._report_stats(report_interval)
+                    report_at = now + report_interval
+        finally:
+            for process in self.processes.values():
+                if process.is_alive():
+                    process.terminate()
@@ -1,28 +1,31 @@
 import re
+import zlib
 import pytz
 import json
-import contextlib
+import base64
+import threading
+import itertools
+import time as time_
+from operator import itemgetter
 from datetime import datetime, date, timedelta
-from scripts.__init__ import LOG_TABLE, BATCH_SIZE
+from scripts.__init__ import (
+    AUDIT_SAMPLE_ROWS, AUDIT_COMPRESSION, SCHEMA_CACHE_TTL, UPDATE_STATUS_MODE, UPDATE_STATUS_CHUNK_SIZE, UPDATE_STATUS_KEYS_TABLE_MIN
+)
+from scripts.writer import Batch
+from scripts.batching import BatchPolicy, get_batch_policy
+from scripts.date_parser import DATE_FORMATS, DateParser
+from clickhouse_connect.driver import Client
 from clickhouse_connect.driver.query import QueryResult
-from typing import TYPE_CHECKING, Tuple, Union, Optional, List, Any
+from typing import TYPE_CHECKING, Tuple, Union, Optional, List, Any, Callable, Dict, Set
 
 if TYPE_CHECKING:
     from scripts.receive import Receive
 
-DATE_FORMATS: tuple = (
-    "%Y-%m-%dT%H:%M:%SZ",
-    "%Y-%m-%dT%H:%M:%S",
-    "%Y-%m-%dT%H:%M:%S%z",
-    "%d.%m.%YT%H:%M:%SZ",
-    "%d.%m.%YT%H:%M:%S",
-    "%d.%m.%YT%H:%M:%S%z",
-    "%d.%m.%Y %H:%M:%S",
-    "%Y-%m-%d %H:%M:%S",
-    "%d.%m.%Y",
-    "%Y-%m-%d"
-)
 TZ: pytz.timezone = pytz.timezone("Europe/Moscow")
+MIN_DATE: date = date(1925, 1, 1)
+MIN_DATETIME: datetime = pytz.utc.localize(datetime(1925, 1, 1))
+DATE_PARSER: DateParser = DateParser()
+SPACES_BETWEEN_DIGITS: re.Pattern = re.compile(r'(?<=\d)\s+(?=\d)')
 
 
 def serialize_datetime(obj):
@@ -31,7 +34,342 @@ def serialize_datetime(obj):
     raise TypeError("Type not serializable")
 
 
+def to_float(value: Any, data: dict, data_core: "DataCoreClient") -> Optional[float]:
+    if not value:
+        return None
+    if type(value) is float or type(value) is int:
+        return float(value)
+    return float(SPACES_BETWEEN_DIGITS.sub('', str(value)).replace(",", "."))
+
+
+def to_int(value: Any, data: dict, data_core: "DataCoreClient") -> Optional[int]:
+    if not value:
+        return None
+    if type(value) is int:
+        return value
+    return int(SPACES_BETWEEN_DIGITS.sub('', str(value)))
+
+
+def get_date_converter(column: str, is_datetime: bool) -> Callable[[Any, dict, "DataCoreClient"], Any]:
+    def to_date(value: Any, data: dict, data_core: "DataCoreClient") -> Any:
+        return data_core.convert_format_date(value, data, column, is_datetime=is_datetime) if value else None
+    return to_date
+
+
+class ConversionPlan:
+    def __init__(self, converters: List[Tuple[str, Callable]], bool_columns: List[str], dropped_columns: List[str]):
+        self.converters: List[Tuple[str, Callable]] = converters
+        self.bool_columns: List[str] = bool_columns
+        self.dropped_columns: List[str] = dropped_columns
+
+    def apply(self, data: dict, data_core: "DataCoreClient") -> None:
+        """
+        Converts the columns of the row in place.
+
+        :param data: A dictionary with data to be processed.
+        :param data_core: The table the row belongs to, used to convert dates.
+        :return: None
+        """
+        get = data.get
+        for column, converter in self.converters:
+            data[column] = converter(get(column), data, data_core)
+        for column in self.bool_columns:
+            value: Any = get(column)
+            if isinstance(value, str):
+                data[column] = value.upper() == 'ДА'
+        for column in self.dropped_columns:
+            data.pop(column, None)
+
+    def apply_columns(self, rows: List[dict], data_core: "DataCoreClient") -> None:
+        """
+        Converts the columns of the rows in place, one column at a time.
+
+        Every distinct value of a column is converted once and the result is shared by all
+        the rows with this value, as the values of big messages repeat a lot (dates, sizes,
+        ports). The dates clamped to 1925-01-01 are annotated in every row they occur in.
+        The values that cannot be hashed are converted row by row.
+
+        :param rows: The rows of the message, with the same columns.
+        :param data_core: The table the rows belong to, used to convert dates.
+        :return: None
+        """
+        annotation_column: Optional[str] = data_core.original_date_string
+        for column, converter in self.converters:
+            converted: Dict[Tuple[type, Any], Tuple[Any, str]] = {}
+            for row in rows:
+                value: Any = row.get(column)
+                try:
+                    result, annotation = converted[value.__class__, value]
+                except KeyError:
+                    scratch: dict = {annotation_column: ''} if annotation_column else {}
+                    result = converter(value, scratch, data_core)
+                    annotation = scratch.get(annotation_column, '') if annotation_column else ''
+                    converted[value.__class__, value] = result, annotation
+                except TypeError:
+                    row[column] = converter(value, row, data_core)
+                    continue
+                row[column] = result
+                if annotation:
+                    row[annotation_column] += annotation
+        for column in self.bool_columns:
+            for row in rows:
+                value = row.get(column)
+                if isinstance(value, str):
+                    row[column] = value.upper() == 'ДА'
+        for column in self.dropped_columns:
+            for row in rows:
+                row.pop(column, None)
+
+
+class SchemaCache:
+    def __init__(self, ttl: float = SCHEMA_CACHE_TTL):
+        self.ttl: float = ttl
+        self.schemas: Dict[Tuple[str, str], Tuple[float, List[str], List[str]]] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def get(self, client: Client, database: str, table: str) -> Tuple[List[str], List[str]]:
+        """
+        Returns the columns of the table and their types, describing the table at most once per ttl seconds.
+
+        :param client: The ClickHouse client.
+        :param database: The name of the database.
+        :param table: The name of the table.
+        :return: The names of the columns and their types.
+        """
+        now: float = time_.monotonic()
+        schema: Optional[Tuple[float, List[str], List[str]]] = self.schemas.get((database, table))
+        if schema is None or now - schema[0] > self.ttl:
+            described_table: QueryResult = client.query(f"DESCRIBE TABLE {database}.{table}")
+            schema = now, list(described_table.result_columns[0]), list(described_table.result_columns[1])
+            with self.lock:
+                self.schemas[(database, table)] = schema
+        return schema[1], schema[2]
+
+    def invalidate(self, database: str, table: str) -> None:
+        """
+        Forgets the schema of the table, so it is described again on the next call.
+
+        :param database: The name of the database.
+        :param table: The name of the table.
+        :return: None
+        """
+        with self.lock:
+            self.schemas.pop((database, table), None)
+
+
+SCHEMA_CACHE: SchemaCache = SchemaCache()
+
+
+class KeyMapper:
+    def __init__(self, normalize: Callable[[str], str], cache_size: int = 1000):
+        self.normalize: Callable[[str], str] = normalize
+        self.cache_size: int = cache_size
+        self.layouts: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def get_keys(self, keys: Tuple[str, ...]) -> Tuple[str, ...]:
+        """
+        Returns the normalized keys of the layout, normalizing them once per distinct layout.
+
+        :param keys: The original keys of a row, in their order.
+        :return: The normalized keys, in the same order.
+        """
+        try:
+            return self.layouts[keys]
+        except KeyError:
+            if len(self.layouts) >= self.cache_size:
+                self.layouts.clear()
+            normalized: Tuple[str, ...] = tuple(map(self.normalize, keys))
+            self.layouts[keys] = normalized
+            return normalized
+
+    def map_row(self, row: dict) -> dict:
+        """
+        Returns a new row with the normalized keys.
+
+        If several keys are normalized to the same key, the value of the last of them is kept.
+
+        :param row: The row to be mapped.
+        :return: The row with the normalized keys.
+        """
+        return dict(zip(self.get_keys(tuple(row)), row.values()))
+
+    def map_rows(self, rows: List[dict]) -> List[dict]:
+        """
+        Maps the keys of the rows.
+
+        The rows whose keys are normalized already are kept as they are, without being copied.
+
+        :param rows: The rows to be mapped.
+        :return: The rows with the normalized keys.
+        """
+        mapped: List[dict] = []
+        for row in rows:
+            keys: Tuple[str, ...] = tuple(row)
+            normalized: Tuple[str, ...] = self.get_keys(keys)
+            mapped.append(row if normalized == keys else dict(zip(normalized, row.values())))
+        return mapped
+
+
+LOWERCASE_KEYS: KeyMapper = KeyMapper(str.lower)
+
+
+class LayoutCache:
+    def __init__(self):
+        self.fingerprints: Dict[type, Tuple[Any, frozenset]] = {}
+        self.accepted: Dict[type, Tuple[frozenset, Set[Tuple[str, ...]]]] = {}
+
+    def get_fingerprint(
+        self,
+        table_class: type,
+        version: Any,
+        get_columns: Callable[[], list],
+        removed_columns: list
+    ) -> frozenset:
+        """
+        Returns the set of the columns of the table the rows must have.
+
+        It is computed once per version of the columns of the table: the tables with the columns
+        listed in their class have one version (None), the version of the other tables is the list
+        of columns of the schema cache, which is replaced when the schema is described again.
+
+        :param table_class: The class of the table.
+        :param version: The version of the columns of the table, compared by identity.
+        :param get_columns: Returns the columns of the table, called only for a new version.
+        :param removed_columns: The columns of the table the rows do not have.
+        :return: The columns of the rows.
+        """
+        cached: Optional[Tuple[Any, frozenset]] = self.fingerprints.get(table_class)
+        if cached is None or cached[0] is not version:
+            cached = version, frozenset(get_columns()) - frozenset(removed_columns)
+            self.fingerprints[table_class] = cached
+        return cached[1]
+
+    def get_accepted(self, table_class: type, fingerprint: frozenset) -> Set[Tuple[str, ...]]:
+        """
+        Returns the layouts of the rows accepted for the table, i.e. the tuples of their keys.
+
+        The layouts are forgotten when the columns of the table change.
+
+        :param table_class: The class of the table.
+        :param fingerprint: The columns of the rows (see get_fingerprint).
+        :return: The accepted layouts.
+        """
+        cached: Optional[Tuple[frozenset, Set[Tuple[str, ...]]]] = self.accepted.get(table_class)
+        if cached is None or (cached[0] is not fingerprint and cached[0] != fingerprint):
+            cached = fingerprint, set()
+            self.accepted[table_class] = cached
+        return cached[1]
+
+
+LAYOUT_CACHE: LayoutCache = LayoutCache()
+
+
+class ColumnarBuffer:
+    def __init__(self, columns: List[str]):
+        self.columns: List[str] = list(columns)
+        self.data: List[list] = [[] for _ in self.columns]
+        self.size_bytes: int = 0
+        self.started_at: Optional[float] = None
+        # Наборы ключей строк, уже сверенные с колонками таблицы
+        self.layouts: Set[Tuple[str, ...]] = set()
+
+    def __len__(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    def check_layout(self, row: dict, constants: Dict[str, Any]) -> None:
+        """
+        Checks that the row and the constants have exactly the columns of the buffer.
+
+        The keys of every row are compared with the columns once per layout (the tuple of its keys).
+
+        :param row: The row to be checked.
+        :param constants: The values of the constant columns of the row.
+        :return: None
+        :raises ValueError: If a column of the buffer is missing or the row has a column the buffer does not have.
+        """
+        keys: Tuple[str, ...] = tuple(row)
+        if keys in self.layouts:
+            return
+        missing_columns: list = [column for column in self.columns if column not in row and column not in constants]
+        extra_columns: list = [column for column in keys if column not in self.columns]
+        if missing_columns or extra_columns:
+            raise ValueError(
+                f"The row does not match the columns of the buffer. "
+                f"Missing columns: {missing_columns}. Extra columns: {extra_columns}"
+            )
+        self.layouts.add(keys)
+
+    def append_rows(self, rows: List[dict], constants: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Appends the rows to the buffer, one list per column.
+
+        The buffer has the columns of the table in the order of its schema, the values of every row
+        are looked up by column name, and every row must have exactly these columns (see check_layout).
+        The constants are the columns with the same value in every row (see MessageContext),
+        they are repeated in their columns instead of being stored in every row.
+        The size of the rows is estimated from the first of them.
+
+        :param rows: The rows to be appended.
+        :param constants: The values of the constant columns of the rows.
+        :return: None
+        :raises ValueError: If a row does not have exactly the columns of the buffer.
+        """
+        if not rows:
+            return
+        constants = constants or {}
+        for row in rows:
+            self.check_layout(row, constants)
+        if self.started_at is None:
+            self.started_at = time_.monotonic()
+        row_size: int = sum(len(str(value)) for value in rows[0].values())
+        self.size_bytes += (row_size + sum(len(str(value)) for value in constants.values())) * len(rows)
+        row_columns: List[Tuple[str, list]] = []
+        for column, values in zip(self.columns, self.data):
+            if column in constants:
+                values.extend(itertools.repeat(constants[column], len(rows)))
+            else:
+                row_columns.append((column, values))
+        if len(row_columns) == 1:
+            column, values = row_columns[0]
+            values.extend(row[column] for row in rows)
+            return
+        if not row_columns:
+            return
+        get_values: itemgetter = itemgetter(*(column for column, _ in row_columns))
+        for (_, column), values in zip(row_columns, zip(*map(get_values, rows))):
+            column.extend(values)
+
+    def age(self) -> float:
+        """
+        Returns the seconds passed since the first row was appended to the buffer.
+
+        :return: The age of the buffer, 0 if it is empty.
+        """
+        return time_.monotonic() - self.started_at if self.started_at is not None else 0.0
+
+    def get_column(self, column: str) -> list:
+        """
+        Returns the values of the column.
+
+        :param column: The name of the column.
+        :return: The values of the column in the order the rows were appended.
+        """
+        return self.data[self.columns.index(column)]
+
+
+class MessageContext:
+    def __init__(self, table: str, sign: int = 1):
+        parsed_at: datetime = datetime.now(tz=TZ)
+        self.file_name: str = f"{table}_{parsed_at}.json"
+        self.timestamp: str = parsed_at.strftime("%Y-%m-%d %H:%M:%S")
+        self.sign: int = sign
+        # Колонки с одинаковым значением во всех строках сообщения, уже сконвертированные
+        self.columns: Dict[str, Any] = {}
+
+
 class DataCoreClient:
+    _conversion_plans: Dict[type, ConversionPlan] = {}
+
     def __init__(self, receive: "Receive"):
         self.receive: "Receive" = receive
         self.removed_columns_db: list = ['uuid']
@@ -57,15 +395,89 @@ class DataCoreClient:
     def original_date_string(self):
         return self._original_date_string
 
+    @property
+    def batch_policy(self) -> BatchPolicy:
+        return get_batch_policy(self.database, self.table)
+
     @original_date_string.setter
     def original_date_string(self, value):
         self._original_date_string: str = value
 
+    @property
+    def float_columns(self):
+        return []
+
+    @property
+    def int_columns(self):
+        return []
+
+    @property
+    def date_columns(self):
+        return []
+
+    @property
+    def bool_columns(self):
+        return []
+
+    @property
+    def is_datetime(self):
+        return False
+
+    @property
+    def dropped_columns(self):
+        return []
+
+    @property
+    def key_mapper(self) -> Optional[KeyMapper]:
+        """
+        Returns the mapper of the keys of the rows, if the columns of the table are renamed or normalized.
+
+        :return: The key mapper, or None if the keys are used as they are.
+        """
+        return None
+
+    def build_conversion_plan(self, **kwargs) -> ConversionPlan:
+        """
+        Builds the plan of converting the columns of the table.
+
+        The columns are taken from the kwargs if they are passed, otherwise from the
+        properties of the table: float_columns, int_columns, date_columns, bool_columns,
+        is_datetime and dropped_columns. The converters are applied in this order.
+
+        :param kwargs: parameters to control the conversion of columns
+        :return: The conversion plan.
+        """
+        is_datetime: bool = kwargs.get('is_datetime', self.is_datetime)
+        converters: List[Tuple[str, Callable]] = []
+        converters.extend((column, to_float) for column in kwargs.get('float_columns', self.float_columns))
+        converters.extend((column, to_int) for column in kwargs.get('int_columns', self.int_columns))
+        converters.extend(
+            (column, get_date_converter(column, is_datetime))
+            for column in kwargs.get('date_columns', self.date_columns)
+        )
+        return ConversionPlan(
+            converters=converters,
+            bool_columns=list(kwargs.get('bool_columns', self.bool_columns)),
+            dropped_columns=list(self.dropped_columns)
+        )
+
+    @property
+    def conversion_plan(self) -> ConversionPlan:
+        """
+        Returns the conversion plan of the table, it is built once per table class.
+
+        :return: The conversion plan.
+        """
+        plan: Optional[ConversionPlan] = self._conversion_plans.get(type(self))
+        if plan is None:
+            plan = self._conversion_plans[type(self)] = self.build_conversion_plan()
+        return plan
+
     def change_columns(self, data: dict, *args, **kwargs) -> None:
         """
-        Changes data types of columns in data dictionary according to given parameters.
+        Changes data types of columns in data dictionary according to the conversion plan of the table.
 
-        The following parameters can be passed in the kwargs:
+        The following parameters can be passed in the kwargs instead of the properties of the table:
 
         - float_columns: list of columns to be converted to float
         - int_columns: list of columns to be converted to int
@@ -74,45 +486,22 @@ class DataCoreClient:
         - is_datetime: boolean indicating whether date_columns should be converted to datetime or date
 
         The method processes all columns in the given lists and replaces the values in the data dictionary
-        with the converted values. If a value in the data dictionary is None, it is left unchanged.
+        with the converted values. If a value in the data dictionary is empty, it is replaced with None.
 
         :param data: dictionary to be modified
         :param args: not used
         :param kwargs: parameters to control the conversion of columns
         :return:
         """
-        float_columns: list = kwargs.get('float_columns', [])
-        int_columns: list = kwargs.get('int_columns', [])
-        date_columns: list = kwargs.get('date_columns', [])
-        bool_columns: list = kwargs.get('bool_columns', [])
-        is_datetime: bool = kwargs.get('is_datetime', False)
-
-        for column in float_columns:
-            data[column] = float(
-                re.sub(r'(?<=\d)\s+(?=\d)', '', str(data.get(column))).replace(",", ".")
-            ) if data.get(column) else None
-
-        for column in int_columns:
-            data[column] = int(
-                re.sub(r'(?<=\d)\s+(?=\d)', '', str(data.get(column)))
-            ) if data.get(column) else None
-
-        for column in date_columns:
-            data[column] = self.convert_format_date(
-                data.get(column), data, column, is_datetime=is_datetime
-            ) if data.get(column) else None
-
-        for column in bool_columns:
-            if isinstance(data.get(column), str):
-                data[column] = data.get(column).upper() == 'ДА'
+        plan: ConversionPlan = self.build_conversion_plan(**kwargs) if kwargs else self.conversion_plan
+        plan.apply(data, self)
 
     def convert_format_date(self, date_: str, data: dict, column, is_datetime: bool = False) -> Union[datetime, str]:
         """
         Converts a date string from a file to a datetime object.
 
-        The function loops over the list of date formats in the DATE_FORMATS constant,
-        and for each format, it tries to parse the date string using the datetime.strptime
-        function. If the parsing is successful, it checks if the parsed date is less than
+        The date string is parsed by DATE_PARSER as one of the formats in the DATE_FORMATS
+        constant. If the parsing is successful, it checks if the parsed date is less than
         the date of "1925-01-01". If it is, it adds the parsed date to the value of the
         original_date_string key in the data dictionary, and returns the date of
         "1925-01-01". If the parsed date is not less than "1925-01-01", it returns the
@@ -127,44 +516,64 @@ class DataCoreClient:
         :param is_datetime: A boolean indicating whether the date string represents a datetime or a date.
         :return: A datetime object or the original date string if it cannot be parsed.
         """
-        for date_format in DATE_FORMATS:
-            with contextlib.suppress(ValueError):
-                if not is_datetime:
-                    date_file: Union[datetime.date, datetime] = datetime.strptime(date_, date_format).date()
-                    date_db_access: Union[datetime.date, datetime] = datetime.strptime("1925-01-01", "%Y-%m-%d").date()
-                else:
-                    utc: pytz.timezone = pytz.utc
-                    date_file = utc.localize(datetime.strptime(date_, date_format))
-                    date_db_access = utc.localize(datetime.strptime("1925-01-01", "%Y-%m-%d"))
-
-                if date_file < date_db_access:
-                    data[self.original_date_string] += f"({column}: {date_file})\n"
-                    return date_db_access
-                return date_file
-        return date_
+        date_file: Optional[Union[date, datetime]] = DATE_PARSER.parse(date_, column, is_datetime)
+        if date_file is None:
+            return date_
+        date_db_access: Union[date, datetime] = MIN_DATETIME if is_datetime else MIN_DATE
+        if date_file < date_db_access:
+            data[self.original_date_string] += f"({column}: {date_file})\n"
+            return date_db_access
+        return date_file
+
+    def get_constant_columns(self, context: MessageContext) -> Dict[str, Any]:
+        """
+        Returns the columns with the same value in every row of the message.
 
-    @staticmethod
-    def add_new_columns(data: dict, file_name: str, original_date_string: str) -> None:
+        The column 'sign' is set to 1, 'original_file_parsed_on' to the file name of the
+        message and 'is_obsolete_date' to the time the message was parsed at in the
+        "Europe/Moscow" time zone. They are converted once, as the other columns of the rows,
+        and attached to the rows by the rows buffer.
+
+        :param context: The context of the message.
+        :return: The converted values of the constant columns.
+        """
+        constants: Dict[str, Any] = {
+            'sign': context.sign,
+            'original_file_parsed_on': context.file_name,
+            'is_obsolete_date': context.timestamp
+        }
+        converted: dict = dict(constants)
+        if self.original_date_string:
+            converted[self.original_date_string] = ''
+        self.conversion_plan.apply(converted, self)
+        return {column: converted[column] for column in constants if column in converted}
+
+    def convert_rows(self, rows: List[dict]) -> bool:
         """
-        Adds new columns to the data dictionary.
+        Converts all the rows of a message column by column.
 
-        The function adds three new columns to the data dictionary. The first column is
-        called 'sign' and is set to 1. The second column is called 'original_file_parsed_on'
-        and is set to the file name of the file being processed. The third column is called
-        'is_obsolete_date' and is set to the current date and time in the "Europe/Moscow"
-        time zone. If the original_date_string parameter is not empty, the function also
-        adds an empty string to the column with the name given by the parameter.
+        It is the columnar counterpart of calling change_columns for every row and stripping
+        the original_date_string column. Every distinct value of a column is converted once
+        (see ConversionPlan.apply_columns).
 
-        :param data: A dictionary with data to be processed.
-        :param file_name: The name of the file being processed.
-        :param original_date_string: The name of the column to be added with an empty string.
-        :return:
+        The rows must have the same columns. Otherwise nothing is changed and False is returned,
+        so the rows are converted one by one.
+
+        :param rows: The rows of the message.
+        :return: True if the rows were converted, False if their columns differ.
         """
-        data['sign'] = 1
-        data['original_file_parsed_on'] = file_name
-        data['is_obsolete_date'] = datetime.now(tz=TZ).strftime("%Y-%m-%d %H:%M:%S")
+        columns: set = set(rows[0]) if rows else set()
+        if any(row.keys() != columns for row in rows):
+            return False
+        original_date_string: Optional[str] = self.original_date_string
+        if original_date_string:
+            for row in rows:
+                row[original_date_string] = ''
+        self.conversion_plan.apply_columns(rows, self)
         if original_date_string:
-            data[original_date_string] = ''
+            for row in rows:
+                row[original_date_string] = row[original_date_string].strip() or None
+        return True
 
     @staticmethod
     def convert_to_lowercase(data: dict):
@@ -172,12 +581,13 @@ class DataCoreClient:
         Converts all keys in the given dictionary to lowercase.
 
         The function takes in a dictionary and returns a new dictionary where all the keys
-        are converted to lowercase using the str.lower() method.
+        are converted to lowercase using the str.lower() method. The lowercase keys are
+        computed once per distinct set of keys (see KeyMapper).
 
         :param data: A dictionary with keys to be converted to lowercase.
         :return: A new dictionary with lowercase keys.
         """
-        return {k.lower(): v for k, v in data.items()}
+        return LOWERCASE_KEYS.map_row(data)
 
     def check_difference_columns(
         self,
@@ -214,17 +624,95 @@ class DataCoreClient:
             return diff_db + diff_rabbit
         return []
 
+    def validate_layouts(
+        self,
+        all_data: dict,
+        rows: List[dict],
+        constants: Dict[str, Any],
+        key_deals: str,
+        message_count: int
+    ) -> list:
+        """
+        Checks the columns of every row of the message against the columns of the table.
+
+        The rows with a layout (the tuple of their keys) accepted before are passed with one
+        hash lookup. Every other layout is compared once with the columns of the table, and
+        the first one that differs is reported by check_difference_columns.
+
+        :param all_data: A dictionary with data to be processed.
+        :param rows: The converted rows of the message.
+        :param constants: The constant columns attached to the rows (see MessageContext).
+        :param key_deals: A string identifier for key deals.
+        :param message_count: The count of messages in the queue.
+        :return: The difference in columns of the first layout that differs, an empty list if there is none.
+        """
+        fingerprint: frozenset = self.layout_fingerprint
+        accepted: Set[Tuple[str, ...]] = LAYOUT_CACHE.get_accepted(type(self), fingerprint)
+        for row in rows:
+            keys: Tuple[str, ...] = tuple(row)
+            if keys in accepted:
+                continue
+            layout: frozenset = frozenset(keys).union(constants)
+            if layout != fingerprint:
+                return self.check_difference_columns(
+                    all_data, list(fingerprint), list(layout), key_deals, message_count
+                )
+            accepted.add(keys)
+        return []
+
+    @property
+    def layout_fingerprint(self) -> frozenset:
+        """
+        Returns the set of the columns the rows of the table must have (see LayoutCache).
+
+        The columns listed by the class of the table never change, so they are read once.
+        The columns of the schema cache are read on every call, it costs a dictionary lookup,
+        and the fingerprint is computed again only when the schema is described again.
+
+        :return: The columns of the rows.
+        """
+        if type(self).get_table_columns is not DataCoreClient.get_table_columns:
+            return LAYOUT_CACHE.get_fingerprint(type(self), None, self.get_table_columns, self.removed_columns_db)
+        columns: list = self.get_table_columns()
+        return LAYOUT_CACHE.get_fingerprint(type(self), columns, lambda: columns, self.removed_columns_db)
+
+    @property
+    def rows_buffer(self) -> ColumnarBuffer:
+        """
+        Returns the rows buffer of the table, one per table in the receiver.
+
+        The buffer is created with the columns of the table in the order of its schema,
+        without the columns the rows do not have.
+
+        :return: The rows buffer of the table.
+        """
+        rows_buffer: Optional[ColumnarBuffer] = self.receive.rows_buffers.get(self.table)
+        if rows_buffer is None:
+            columns: list = [
+                column for column in self.get_table_columns() if column not in self.removed_columns_db
+            ]
+            rows_buffer = self.receive.rows_buffers[self.table] = ColumnarBuffer(columns)
+        return rows_buffer
+
     def get_table_columns(self):
         """
         Retrieves the column names of the specified table in the database.
 
-        This method queries the database to describe the structure of the table
-        and extracts the list of column names from the result.
+        The structure of the table is described once and cached in SCHEMA_CACHE
+        for SCHEMA_CACHE_TTL seconds or until the columns of a message differ.
 
         :return: A list of column names in the specified table.
         """
-        described_table = self.receive.client.query(f"DESCRIBE TABLE {self.database}.{self.table}")
-        return described_table.result_columns[0]
+        return SCHEMA_CACHE.get(self.receive.client, self.database, self.table)[0]
+
+    def get_column_types(self) -> Dict[str, str]:
+        """
+        Retrieves the ClickHouse types of the columns of the specified table in the database.
+
+        :return: A dictionary of column names and their types.
+        """
+        columns, types = SCHEMA_CACHE.get(self.receive.client, self.database, self.table)
+        return dict(zip(columns, types))
 
     def insert_message(
         self,
@@ -247,8 +735,8 @@ class DataCoreClient:
         :param is_success_inserted: A boolean indicating whether the message was successfully inserted.
         :return None:
         """
-        len_data: int = 100
-        all_data["data"] = all_data["data"][:len_data] if len(all_data["data"]) >= len_data else all_data["data"]
+        sample: dict = dict(all_data)
+        sample["data"] = all_data["data"][:AUDIT_SAMPLE_ROWS]
         row = [
             self.database,
             self.table,
@@ -256,18 +744,33 @@ class DataCoreClient:
             key_deals,
             datetime.now(tz=TZ) + timedelta(hours=3),
             is_success_inserted,
-            json.dumps(all_data, default=serialize_datetime, ensure_ascii=False, indent=2)
+            self.encode_audit_message(sample)
         ]
-        self.receive.log_message_buffer.append(row)
-        if len(self.receive.rows_buffer) >= BATCH_SIZE or message_count == 0 or not is_success_inserted:
-            self.receive.client.insert(
-                table=LOG_TABLE,
-                database="DataCore",
-                data=self.receive.log_message_buffer,
-                column_names=["database", "table", "queue", "key_id", "datetime", "is_success", "message"]
-            )
-            self.receive.rows_buffer = []
-            self.receive.log_message_buffer = []
+        self.receive.audit_log.add(row, is_urgent=message_count == 0 or not is_success_inserted)
+
+    @staticmethod
+    def encode_audit_message(all_data: dict) -> str:
+        """
+        Encodes the message for the audit log as compact JSON.
+
+        With AUDIT_COMPRESSION "zlib" the JSON is compressed and encoded
+        in base64 with the "zlib:" prefix.
+
+        :param all_data: The message to be encoded.
+        :return: The encoded message.
+        """
+        message: str = json.dumps(all_data, default=serialize_datetime, ensure_ascii=False, separators=(",", ":"))
+        if AUDIT_COMPRESSION == "zlib":
+            return f"zlib:{base64.b64encode(zlib.compress(message.encode('utf-8'))).decode('ascii')}"
+        return message
+
+    def flush_log_messages(self) -> None:
+        """
+        Asks the audit log to write the collected log messages without waiting for its batch.
+
+        :return: None
+        """
+        self.receive.audit_log.flush()
 
     def handle_rows(
         self,
@@ -295,94 +798,221 @@ class DataCoreClient:
         :return: None
         """
         try:
-            self.receive.key_deals_buffer.append(key_deals)
-            for row in data:
-                self.receive.rows_buffer.append(row)
-            if len(self.receive.rows_buffer) >= BATCH_SIZE or message_count == 0:
-                self.update_status()
-                columns, deduped_buffer = self.dedupe_rows_buffer()
-                if columns and deduped_buffer:
-                    self.receive.client.insert(
-                        table=self.table,
-                        database=self.database,
-                        data=deduped_buffer,
-                        column_names=columns
-                    )
-                self.receive.rabbit_mq.channel.basic_ack(delivery_tag=self.receive.delivery_tags[-1], multiple=True)
-                self.receive.key_deals_buffer = []
-                self.receive.delivery_tags = []
-                self.receive.logger.info("The data has been uploaded to the database")
+            if not self.receive.is_key_deal_buffered:
+                self.receive.key_deals_buffer.append(key_deals)
+            rows_buffer: ColumnarBuffer = self.rows_buffer
+            context: Optional[MessageContext] = self.receive.message_context
+            rows_buffer.append_rows(data, context.columns if context is not None else None)
+            is_full: bool = self.batch_policy.is_full(len(rows_buffer), rows_buffer.size_bytes, rows_buffer.age())
+            if is_full or message_count == 0:
+                self.flush_rows()
             self.insert_message(all_data, key_deals, message_count, is_success_inserted=is_success_inserted)
         except Exception as ex:
             self.receive.logger.error(f"Exception is {ex}. Type of ex is {type(ex)}")
             self.insert_message(all_data, key_deals, message_count, is_success_inserted=False)
             raise ConnectionError(ex) from ex
 
+    def flush_rows(self) -> None:
+        """
+        Inserts the buffered rows into the ClickHouse database.
+
+        The previous versions of the buffered deals are cancelled, the deduplicated
+        rows are inserted and all the messages of the batch are acknowledged.
+
+        If the receiver has a writer (see BatchWriter), the batch is handed over to it
+        and the consumer goes on with the next messages. The messages are acknowledged
+        by the consumer once the writer has written the batch.
+
+        :return: None
+        """
+        batch: Batch = self.take_batch()
+        if self.receive.writer is not None:
+            self.receive.writer.submit(batch)
+            self.receive.ack_written()
+            return
+        self.write_batch(self.receive.client, batch)
+        if batch.delivery_tags:
+            self.receive.rabbit_mq.channel.basic_ack(delivery_tag=batch.delivery_tags[-1], multiple=True)
+
+    def flush_message_part(self) -> None:
+        """
+        Inserts the rows buffered so far while the rows of the current message are still being parsed.
+
+        The delivery tag of the current message is kept back for the batch of its last rows,
+        so the message is acknowledged only when all its rows are written.
+
+        :return: None
+        """
+        delivery_tags: list = self.receive.delivery_tags
+        delivery_tag: Optional[int] = delivery_tags.pop() if delivery_tags else None
+        self.flush_rows()
+        if delivery_tag is not None:
+            self.receive.delivery_tags.append(delivery_tag)
+
+    def take_batch(self) -> Batch:
+        """
+        Takes the buffered rows, deals and delivery tags out of the receiver as a batch.
+
+        :return: The batch to be written.
+        """
+        columns, deduped_buffer = self.dedupe_rows_buffer()
+        batch: Batch = Batch(
+            data_core=self,
+            key_deals=self.receive.key_deals_buffer,
+            columns=columns,
+            data=deduped_buffer,
+            delivery_tags=self.receive.delivery_tags
+        )
+        self.receive.rows_buffers.pop(self.table, None)
+        self.receive.key_deals_buffer = []
+        self.receive.delivery_tags = []
+        return batch
+
+    def write_batch(self, client: Client, batch: Batch) -> None:
+        """
+        Cancels the previous versions of the deals of the batch and inserts its rows.
+
+        :param client: The ClickHouse client to write with.
+        :param batch: The batch to be written.
+        :return: None
+        """
+        started_at: float = time_.monotonic()
+        self.update_status(batch.key_deals, client)
+        if batch.columns and batch.data:
+            client.insert(
+                table=self.table,
+                database=self.database,
+                data=batch.data,
+                column_names=batch.columns,
+                column_oriented=True
+            )
+            self.batch_policy.update(len(batch.data[0]), time_.monotonic() - started_at)
+        self.receive.metrics.add(self.receive.queue_name, self.table, insert_seconds=time_.monotonic() - started_at)
+        self.receive.logger.info("The data has been uploaded to the database")
+
     def dedupe_rows_buffer(self) -> Tuple[list, List[list]]:
         """
         Deduplicates the rows buffer using the key_id and original_file_parsed_on columns.
 
         We iterate over the buffer in reverse order, so the most recent rows are checked first.
         If a row's key_id is not in the seen_keys dictionary, we add it to the dictionary and
-        append the row to the deduped_buffer list. If the key_id is already in the dictionary,
-        we check if the parsed_on date matches the one in the dictionary. If it does, we append
-        the row to the deduped_buffer list as well. Finally, we reverse the deduped_buffer list
-        to maintain the original order of the rows.
+        keep the row. If the key_id is already in the dictionary, we check if the parsed_on
+        date matches the one in the dictionary. If it does, we keep the row as well.
+        The kept rows stay in the original order.
 
-        :return: A list of deduplicated rows and columns
+        :return: A list of columns and the deduplicated values of every column
         """
-        deduped_buffer: list = []
+        rows_buffer: Optional[ColumnarBuffer] = self.receive.rows_buffers.get(self.table)
+        if rows_buffer is None or not len(rows_buffer):
+            return [], []
         seen_keys: dict = {}
-        columns = list(self.receive.rows_buffer[0].keys()) if self.receive.rows_buffer else []
-        for row in reversed(self.receive.rows_buffer):  # Итерируемся с конца
-            key: str = row['key_id']
-            parsed_on: str = row['original_file_parsed_on']
+        kept_rows: list = []
+        keys: list = rows_buffer.get_column('key_id')
+        parsed_on_dates: list = rows_buffer.get_column('original_file_parsed_on')
+        for index in range(len(keys) - 1, -1, -1):  # Итерируемся с конца
+            key: str = keys[index]
+            parsed_on: str = parsed_on_dates[index]
 
             if key not in seen_keys:
                 seen_keys[key] = parsed_on
-                deduped_buffer.append(list(row.values()))
+                kept_rows.append(index)
             elif parsed_on == seen_keys[key]:
-                deduped_buffer.append(list(row.values()))  # Добавляем дубликат, если обе даты совпадают
+                kept_rows.append(index)  # Добавляем дубликат, если обе даты совпадают
 
-        return columns, list(reversed(deduped_buffer))
+        if len(kept_rows) == len(keys):
+            return rows_buffer.columns, rows_buffer.data
+        kept_rows.reverse()
+        return rows_buffer.columns, [[values[index] for index in kept_rows] for values in rows_buffer.data]
 
-    def update_status(self) -> None:
+    def update_status(self, key_deals: Optional[list] = None, client: Optional[Client] = None) -> None:
         """
         Updates the status of the records in the database.
 
-        If the key_deals_buffer is not empty, it will be chunked into smaller pieces
-        and the database will be queried for each chunk. The results of the query
-        will be inserted back into the database with the sign column set to -1.
+        If the key deals (the key_deals_buffer by default) are not empty, the previous versions
+        of the deals are cancelled, i.e. inserted back into the database with the sign column set to -1.
+
+        The keys are passed as a bound Array(String) parameter in chunks of
+        UPDATE_STATUS_CHUNK_SIZE keys. If there are at least UPDATE_STATUS_KEYS_TABLE_MIN
+        keys, they are loaded into the temporary table deal_keys chunk by chunk instead,
+        and the deals are cancelled by one statement joined against it.
 
+        :param key_deals: The key deals to be cancelled.
+        :param client: The ClickHouse client to write with, the client of the receiver by default.
         :return: None
         """
-        if not self.receive.key_deals_buffer:
+        key_deals = self.receive.key_deals_buffer if key_deals is None else key_deals
+        client = client or self.receive.client
+        # У сообщений на очистку таблицы нет ключа сделки, NULL в Array(String) ClickHouse не примет
+        keys: list = list(dict.fromkeys(key for key in key_deals if key))
+        if not keys:
             return
 
-        chunk_size: int = 1000
-        for i in range(0, len(self.receive.key_deals_buffer), chunk_size):
-            chunk: list = self.receive.key_deals_buffer[i:i + chunk_size]
-            placeholders: str = ', '.join([f"'{key}'" for key in chunk])
-            query: str = (
-                f"SELECT * FROM {self.database}.{self.table} WHERE uuid IN ("
-                f"SELECT uuid FROM {self.database}.{self.table} WHERE {self.deal} IN ({placeholders}) "
-                f"GROUP BY uuid HAVING SUM(sign) > 0"
-                f")"
-            )
-            selected_query: QueryResult = self.receive.client.query(query)
-            if rows_query := selected_query.result_rows:
-                rows_buffer: list = []
-                columns: tuple = selected_query.column_names
-                for row in rows_query:
-                    modified_row: dict = {col: -1 if col == 'sign' else val for val, col in zip(row, columns)}
-                    rows_buffer.append(list(modified_row.values()))
-                self.receive.client.insert(
-                    table=self.table,
-                    database=self.database,
-                    data=rows_buffer,
-                    column_names=columns
+        chunks: List[list] = [
+            keys[i:i + UPDATE_STATUS_CHUNK_SIZE] for i in range(0, len(keys), UPDATE_STATUS_CHUNK_SIZE)
+        ]
+        if UPDATE_STATUS_KEYS_TABLE_MIN and len(keys) >= UPDATE_STATUS_KEYS_TABLE_MIN:
+            client.command("CREATE TEMPORARY TABLE IF NOT EXISTS deal_keys (key String)")
+            client.command("TRUNCATE TABLE deal_keys")
+            for chunk in chunks:
+                client.command(
+                    "INSERT INTO deal_keys SELECT arrayJoin({keys:Array(String)})", parameters={"keys": chunk}
                 )
-            self.receive.logger.info("Data processing in the database is completed")
+            self._cancel_deals(client, "(SELECT key FROM deal_keys)", {})
+        else:
+            for chunk in chunks:
+                self._cancel_deals(client, "{keys:Array(String)}", {"keys": chunk})
+
+    def _cancel_deals(self, client: Client, keys: str, parameters: dict) -> None:
+        """
+        Cancels the previous versions of the deals.
+
+        With UPDATE_STATUS_MODE "server" the rows are cancelled by ClickHouse itself
+        with one INSERT ... SELECT statement. With "client" they are selected,
+        modified and inserted back by the script.
+
+        :param client: The ClickHouse client to write with.
+        :param keys: The expression of the keys of the deals, a parameter or a subquery.
+        :param parameters: The parameters of the query.
+        :return: None
+        """
+        condition: str = (
+            f"uuid IN ("
+            f"SELECT uuid FROM {self.database}.{self.table} WHERE {self.deal} IN {keys} "
+            f"GROUP BY uuid HAVING SUM(sign) > 0"
+            f")"
+        )
+        if UPDATE_STATUS_MODE == "server":
+            client.command(
+                f"INSERT INTO {self.database}.{self.table} "
+                f"SELECT * REPLACE (-1 AS sign) FROM {self.database}.{self.table} WHERE {condition}",
+                parameters=parameters
+            )
+        else:
+            self._cancel_rows(client, f"SELECT * FROM {self.database}.{self.table} WHERE {condition}", parameters)
+        self.receive.logger.info("Data processing in the database is completed")
+
+    def _cancel_rows(self, client: Client, query: str, parameters: dict) -> None:
+        """
+        Selects the rows of the previous versions of the deals and inserts them back with the sign column set to -1.
+
+        :param client: The ClickHouse client to write with.
+        :param query: The query selecting the rows to be cancelled.
+        :param parameters: The parameters of the query.
+        :return: None
+        """
+        selected_query: QueryResult = client.query(query, parameters=parameters)
+        if rows_query := selected_query.result_rows:
+            rows_buffer: list = []
+            columns: tuple = selected_query.column_names
+            for row in rows_query:
+                modified_row: dict = {col: -1 if col == 'sign' else val for val, col in zip(row, columns)}
+                rows_buffer.append(list(modified_row.values()))
+            client.insert(
+                table=self.table,
+                database=self.database,
+                data=rows_buffer,
+                column_names=columns
+            )
 
     def delete_old_deals(self, cond: str = "is_obsolete=true") -> None:
         """
@@ -428,18 +1058,18 @@ class DataCoreFreight(DataCoreClient):
     def original_date_string(self):
         return "original_voyage_month_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        data: dict = kwargs.get('data')
-        super().change_columns(
-            data=data,
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['container_count', 'container_size', 'operation_month'],
-            date_columns=['voyage_date', 'operation_date', 'voyage_month'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['container_count', 'container_size', 'operation_month']
+
+    @property
+    def date_columns(self):
+        return ['voyage_date', 'operation_date', 'voyage_month']
 
-        data['voyage_month'] = data['voyage_month'].month if data.get('voyage_month') else None
+    def build_conversion_plan(self, **kwargs) -> "ConversionPlan":
+        plan: ConversionPlan = super().build_conversion_plan(**kwargs)
+        plan.converters.append(('voyage_month', lambda value, data, data_core: value.month if value else None))
+        return plan
 
     def get_table_columns(self):
         return [
@@ -460,15 +1090,13 @@ class NaturalIndicatorsContractsSegments(DataCoreClient):
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['year', 'month'],
-            date_columns=['date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['year', 'month']
+
+    @property
+    def date_columns(self):
+        return ['date']
 
     def get_table_columns(self):
         return [
@@ -498,15 +1126,9 @@ class OrdersReport(DataCoreClient):
     def original_date_string(self):
         return "original_voyage_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=['voyage_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def date_columns(self):
+        return ['voyage_date']
 
     def get_table_columns(self):
         return [
@@ -524,23 +1146,25 @@ class AutoPickupGeneralReport(DataCoreClient):
     def original_date_string(self):
         return "original_date_delivery_plan_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=[
-                'overpayment', 'downtime_amount', 'agreed_rate',
-                'total_rate', 'carrier_rate', 'economy',
-                'overload_amount', 'add_expense_amount'
-            ],
-            int_columns=['container_size'],
-            date_columns=[
-                'date_delivery_empty_fact', 'date_delivery_empty_plan', 'date_loading_fact',
-                'date_delivery_fact', 'date_receiving_empty_fact', 'date_delivery_plan',
-                'date_loading_plan', 'date_receiving_empty_plan'
-            ],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return [
+            'overpayment', 'downtime_amount', 'agreed_rate',
+            'total_rate', 'carrier_rate', 'economy',
+            'overload_amount', 'add_expense_amount'
+        ]
+
+    @property
+    def int_columns(self):
+        return ['container_size']
+
+    @property
+    def date_columns(self):
+        return [
+            'date_delivery_empty_fact', 'date_delivery_empty_plan', 'date_loading_fact',
+            'date_delivery_fact', 'date_receiving_empty_fact', 'date_delivery_plan',
+            'date_loading_plan', 'date_receiving_empty_plan'
+        ]
 
     def get_table_columns(self):
         return [
@@ -574,15 +1198,13 @@ class Consignments(DataCoreClient):
     def original_date_string(self):
         return "original_voyage_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['container_size', 'teu', 'year'],
-            date_columns=['voyage_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['container_size', 'teu', 'year']
+
+    @property
+    def date_columns(self):
+        return ['voyage_date']
 
     def get_table_columns(self):
         return [
@@ -596,15 +1218,9 @@ class SalesPlan(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['teu', 'container_count', 'container_size', 'year', 'month'],
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['teu', 'container_count', 'container_size', 'year', 'month']
 
     def get_table_columns(self):
         return [
@@ -621,18 +1237,16 @@ class NaturalIndicatorsTransactionFactDate(DataCoreClient):
     def original_date_string(self):
         return "original_operation_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=[
-                'container_size', 'operation_month', 'container_count',
-                'teu', 'operation_year'
-            ],
-            date_columns=['operation_date', 'order_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return [
+            'container_size', 'operation_month', 'container_count',
+            'teu', 'operation_year'
+        ]
+
+    @property
+    def date_columns(self):
+        return ['operation_date', 'order_date']
 
     def get_table_columns(self):
         return [
@@ -647,15 +1261,9 @@ class DevelopmentCounterpartyDepartment(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['year'],
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['year']
 
     def get_table_columns(self):
         return [
@@ -672,15 +1280,13 @@ class ExportBookings(DataCoreClient):
     def original_date_string(self):
         return "original_booking_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['container_size', 'container_count', 'freight_rate', 'teu'],
-            date_columns=['cargo_readiness', 'etd', 'eta', 'booking_date', 'sob'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['container_size', 'container_count', 'freight_rate', 'teu']
+
+    @property
+    def date_columns(self):
+        return ['cargo_readiness', 'etd', 'eta', 'booking_date', 'sob']
 
     def get_table_columns(self):
         return [
@@ -701,15 +1307,17 @@ class ImportBookings(DataCoreClient):
     def original_date_string(self):
         return "original_booking_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=['freight_rate'],
-            int_columns=['container_size', 'container_count', 'teu'],
-            date_columns=['etd', 'eta', 'booking_date', 'sob'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return ['freight_rate']
+
+    @property
+    def int_columns(self):
+        return ['container_size', 'container_count', 'teu']
+
+    @property
+    def date_columns(self):
+        return ['etd', 'eta', 'booking_date', 'sob']
 
     def get_table_columns(self):
         return [
@@ -730,18 +1338,16 @@ class CompletedRepackagesReport(DataCoreClient):
     def original_date_string(self):
         return "original_repacking_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=[
-                'warehouse_wms_count', 'inspection_container_count', 'import_teu',
-                'import_container_count', 'export_teu', 'export_container_count'
-            ],
-            date_columns=['repacking_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return [
+            'warehouse_wms_count', 'inspection_container_count', 'import_teu',
+            'import_container_count', 'export_teu', 'export_container_count'
+        ]
+
+    @property
+    def date_columns(self):
+        return ['repacking_date']
 
     def get_table_columns(self):
         return [
@@ -761,15 +1367,17 @@ class AutoVisits(DataCoreClient):
     def original_date_string(self):
         return "original_entry_datetime_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['processing_time', 'waiting_time'],
-            date_columns=['exit_datetime', 'entry_datetime', 'registration_datetime'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=True
-        )
+    @property
+    def int_columns(self):
+        return ['processing_time', 'waiting_time']
+
+    @property
+    def date_columns(self):
+        return ['exit_datetime', 'entry_datetime', 'registration_datetime']
+
+    @property
+    def is_datetime(self):
+        return True
 
     def get_table_columns(self):
         return [
@@ -789,15 +1397,13 @@ class AccountingDocumentsRequests(DataCoreClient):
     def original_date_string(self):
         return "original_request_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=['start_date', 'end_date', 'request_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=True
-        )
+    @property
+    def date_columns(self):
+        return ['start_date', 'end_date', 'request_date']
+
+    @property
+    def is_datetime(self):
+        return True
 
     def get_table_columns(self):
         return [
@@ -817,15 +1423,21 @@ class DailySummary(DataCoreClient):
     def original_date_string(self):
         return "original_motion_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=['tonnage', 'cargo_weight', 'tare_weight'],
-            int_columns=['container_size'],
-            date_columns=['motion_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=True
-        )
+    @property
+    def float_columns(self):
+        return ['tonnage', 'cargo_weight', 'tare_weight']
+
+    @property
+    def int_columns(self):
+        return ['container_size']
+
+    @property
+    def date_columns(self):
+        return ['motion_date']
+
+    @property
+    def is_datetime(self):
+        return True
 
     def get_table_columns(self):
         return [
@@ -848,18 +1460,16 @@ class RZHDOperationsReport(DataCoreClient):
     def original_date_string(self):
         return "original_operation_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['container_size', 'operation_month', 'operation_year'],
-            date_columns=[
-                'operation_date', 'departure_date', 'arrival_date', 'planned_start_date',
-                'planned_end_date', 'fact_start_date', 'fact_end_date'
-            ],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['container_size', 'operation_month', 'operation_year']
+
+    @property
+    def date_columns(self):
+        return [
+            'operation_date', 'departure_date', 'arrival_date', 'planned_start_date',
+            'planned_end_date', 'fact_start_date', 'fact_end_date'
+        ]
 
     def get_table_columns(self):
         return [
@@ -883,19 +1493,17 @@ class OrdersMarginalityReport(DataCoreClient):
     def original_date_string(self):
         return "original_order_creation_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=[
-                'expenses_rental_without_vat_fact', 'income_without_vat_fact', 'profit_plan',
-                'income_without_vat_plan', 'expenses_without_vat_plan', 'expenses_without_vat_fact',
-                'profit_fact'
-            ],
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=['order_creation_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return [
+            'expenses_rental_without_vat_fact', 'income_without_vat_fact', 'profit_plan',
+            'income_without_vat_plan', 'expenses_without_vat_plan', 'expenses_without_vat_fact',
+            'profit_fact'
+        ]
+
+    @property
+    def date_columns(self):
+        return ['order_creation_date']
 
     def get_table_columns(self):
         return [
@@ -915,15 +1523,13 @@ class NaturalIndicatorsRailwayReceptionDispatch(DataCoreClient):
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['container_size', 'container_count', 'teu', 'internal_customs_transit'],
-            date_columns=['date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['container_size', 'container_count', 'teu', 'internal_customs_transit']
+
+    @property
+    def date_columns(self):
+        return ['date']
 
     def get_table_columns(self):
         return [
@@ -942,15 +1548,13 @@ class Accounts(DataCoreClient):
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=['profit_account_rub', 'profit_account'],
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=['date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return ['profit_account_rub', 'profit_account']
+
+    @property
+    def date_columns(self):
+        return ['date']
 
     def get_table_columns(self):
         return [
@@ -964,19 +1568,29 @@ class FreightRates(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
+    @property
+    def key_mapper(self) -> Optional[KeyMapper]:
+        return LOWERCASE_KEYS
+
     @property
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=['rate'],
-            int_columns=['oversized_width', 'oversized_height', 'oversized_length'],
-            date_columns=['expiration_date', 'start_date'],
-            bool_columns=['priority', 'oversized', 'dangerous', 'special_rate', 'guideline'],
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return ['rate']
+
+    @property
+    def int_columns(self):
+        return ['oversized_width', 'oversized_height', 'oversized_length']
+
+    @property
+    def date_columns(self):
+        return ['expiration_date', 'start_date']
+
+    @property
+    def bool_columns(self):
+        return ['priority', 'oversized', 'dangerous', 'special_rate', 'guideline']
 
     def get_table_columns(self):
         return [
@@ -996,19 +1610,21 @@ class MarginalityOrdersActDate(DataCoreClient):
     def original_date_string(self):
         return "original_act_creation_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=[
-                'profit_plan', 'variable_costs_plan', 'margin_plan',
-                'profit_fact', 'variable_costs_fact', 'margin_fact',
-                'margin_fact_percent', 'margin_fact_per_unit'
-            ],
-            int_columns=['count_ktk_by_order', 'count_ktk_by_operation'],
-            date_columns=['act_creation_date', 'act_creation_date_max'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return [
+            'profit_plan', 'variable_costs_plan', 'margin_plan',
+            'profit_fact', 'variable_costs_fact', 'margin_fact',
+            'margin_fact_percent', 'margin_fact_per_unit'
+        ]
+
+    @property
+    def int_columns(self):
+        return ['count_ktk_by_order', 'count_ktk_by_operation']
+
+    @property
+    def date_columns(self):
+        return ['act_creation_date', 'act_creation_date_max']
 
     def get_table_columns(self):
         return [
@@ -1028,18 +1644,24 @@ class RusconProducts(DataCoreClient):
     def original_date_string(self):
         return "original_kp_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=[
-                'kp_amount', 'kp_margin', 'kp_margin_amount', 'kp_margin_container',
-                'kp_amount_cost', 'kp_revenue_rate_container', 'kp_cost_container'
-            ],
-            int_columns=['container_count_40', 'container_count_20', 'container_count'],
-            date_columns=['kp_date'],
-            bool_columns=['dangerous'],
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return [
+            'kp_amount', 'kp_margin', 'kp_margin_amount', 'kp_margin_container',
+            'kp_amount_cost', 'kp_revenue_rate_container', 'kp_cost_container'
+        ]
+
+    @property
+    def int_columns(self):
+        return ['container_count_40', 'container_count_20', 'container_count']
+
+    @property
+    def date_columns(self):
+        return ['kp_date']
+
+    @property
+    def bool_columns(self):
+        return ['dangerous']
 
     def get_table_columns(self):
         return [
@@ -1056,15 +1678,13 @@ class ReferenceLocations(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=['lat_port', 'long_port'],
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=['is_border_crossing'],
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return ['lat_port', 'long_port']
+
+    @property
+    def bool_columns(self):
+        return ['is_border_crossing']
 
     def get_table_columns(self):
         return [
@@ -1082,15 +1702,13 @@ class TerminalsCapacity(DataCoreClient):
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['container_size', 'teu', 'container_count'],
-            date_columns=['date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['container_size', 'teu', 'container_count']
+
+    @property
+    def date_columns(self):
+        return ['date']
 
     def get_table_columns(self):
         return [
@@ -1107,15 +1725,17 @@ class RegisterOrders(DataCoreClient):
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['transport_units_plan', 'container_dc_plan', 'container_hc_plan'],
-            date_columns=['order_date', 'last_update_order', 'sales_start_date', 'sales_end_date'],
-            bool_columns=['is_multimodality'],
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['transport_units_plan', 'container_dc_plan', 'container_hc_plan']
+
+    @property
+    def date_columns(self):
+        return ['order_date', 'last_update_order', 'sales_start_date', 'sales_end_date']
+
+    @property
+    def bool_columns(self):
+        return ['is_multimodality']
 
     def get_table_columns(self):
         return [
@@ -1131,16 +1751,6 @@ class RegisterOrdersContainer(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
-
     def get_table_columns(self):
         return [
             "key_id", "uuid", "order_number", "container_number", "container_type", "consignment", "container_owner",
@@ -1156,15 +1766,9 @@ class RegisterOrdersSegment(DataCoreClient):
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=['planned_start_date', 'planned_end_date', 'fact_start_date', 'fact_end_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def date_columns(self):
+        return ['planned_start_date', 'planned_end_date', 'fact_start_date', 'fact_end_date']
 
     def get_table_columns(self):
         return [
@@ -1178,16 +1782,6 @@ class RegisterOrdersTransportUnits(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
-
     def get_table_columns(self):
         return [
             "key_id", "uuid", "order_number", "transport_units_number", "transport_units_type", "transport_units_owner",
@@ -1200,15 +1794,9 @@ class RegisterOrdersFinancialSpending(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=["amount", "amount_excluding_vat"],
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return ["amount", "amount_excluding_vat"]
 
     def get_table_columns(self):
         return [
@@ -1221,18 +1809,12 @@ class RegisterOrdersMarginalIncome(DataCoreClient):
     def __init__(self, receive: "Receive"):
         super().__init__(receive=receive)
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=[
-                "income_plan", "income_fact", "spending_plan", "spending_fact",
-                "md_plan", "md_fact", "md_plan_percentage", "md_fact_percentage"
-            ],
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def float_columns(self):
+        return [
+            "income_plan", "income_fact", "spending_plan", "spending_fact",
+            "md_plan", "md_fact", "md_plan_percentage", "md_fact_percentage"
+        ]
 
     def get_table_columns(self):
         return [
@@ -1254,15 +1836,13 @@ class ManagerEvaluation(DataCoreClient):
     def original_date_string(self):
         return "original_date_string"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=['evaluation'],
-            date_columns=['evaluation_date'],
-            bool_columns=kwargs.get('bool_columns', []),
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def int_columns(self):
+        return ['evaluation']
+
+    @property
+    def date_columns(self):
+        return ['evaluation_date']
 
     def get_table_columns(self):
         return [
@@ -1281,15 +1861,9 @@ class ReferenceCounterparties(DataCoreClient):
     def database(self):
         return "DO"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=kwargs.get('date_columns', []),
-            bool_columns=['is_control', 'is_foreign_company'],
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def bool_columns(self):
+        return ['is_control', 'is_foreign_company']
 
     def get_table_columns(self):
         return [
@@ -1310,18 +1884,16 @@ class ReferenceContracts(DataCoreClient):
     def database(self):
         return "DO"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        super().change_columns(
-            data=kwargs.get('data'),
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=[
-                'date_of_creation', 'approvals_date', 'signing_date',
-                'returned_archive_date', 'date_tripartite_agreement'
-            ],
-            bool_columns=['returned_archive', 'additional_agreement'],
-            is_datetime=kwargs.get('is_datetime', False)
-        )
+    @property
+    def date_columns(self):
+        return [
+            'date_of_creation', 'approvals_date', 'signing_date',
+            'returned_archive_date', 'date_tripartite_agreement'
+        ]
+
+    @property
+    def bool_columns(self):
+        return ['returned_archive', 'additional_agreement']
 
     def get_table_columns(self):
         return [
@@ -1343,17 +1915,17 @@ class Staff(DataCoreClient):
     def database(self):
         return "DO"
 
-    def change_columns(self, *args, **kwargs) -> None:
-        data: dict = kwargs.get('data')
-        super().change_columns(
-            data=data,
-            float_columns=kwargs.get('float_columns', []),
-            int_columns=kwargs.get('int_columns', []),
-            date_columns=['employment_date', 'dismissal_date'],
-            bool_columns=['pluralist', 'is_main_jobtitle'],
-            is_datetime=kwargs.get('is_datetime', False)
-        )
-        data.pop('uuid', None)
+    @property
+    def date_columns(self):
+        return ['employment_date', 'dismissal_date']
+
+    @property
+    def bool_columns(self):
+        return ['pluralist', 'is_main_jobtitle']
+
+    @property
+    def dropped_columns(self):
+        return ['uuid']
 
     def get_table_columns(self):
         return [
@@ -0,0 +1,139 @@
+import queue
+import threading
+from clickhouse_connect.driver import Client
+from scripts.__init__ import WRITER_QUEUE_SIZE
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+if TYPE_CHECKING:
+    from scripts.tables import DataCoreClient
+
+RESET: object = object()
+
+
+class Batch:
+    def __init__(
+        self,
+        data_core: "DataCoreClient",
+        key_deals: list,
+        columns: list,
+        data: List[list],
+        delivery_tags: list
+    ):
+        self.data_core: "DataCoreClient" = data_core
+        self.key_deals: list = key_deals
+        self.columns: list = columns
+        self.data: List[list] = data
+        self.delivery_tags: list = delivery_tags
+
+
+class BatchWriter:
+    def __init__(self, get_client: Callable[[], Client], max_batches: int = WRITER_QUEUE_SIZE):
+        self.get_client: Callable[[], Client] = get_client
+        self.client: Optional[Client] = None
+        self.batches: queue.Queue = queue.Queue(maxsize=max_batches)
+        self.written: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.in_flight: int = 0
+        self.unacked_messages: int = 0
+        self.last_delivery_tag: Optional[int] = None
+        self.error: Optional[Exception] = None
+
+    def submit(self, batch: Batch) -> None:
+        """
+        Hands the batch over to the writer thread.
+
+        Blocks while max_batches batches are waiting to be written, so the consumer
+        cannot get ahead of ClickHouse by more than that.
+
+        :param batch: The batch to be written.
+        :return: None
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+            self.thread.start()
+        self.in_flight += 1
+        self.unacked_messages += len(batch.delivery_tags)
+        if batch.delivery_tags:
+            self.last_delivery_tag = batch.delivery_tags[-1]
+        self.batches.put(batch)
+
+    def _run(self) -> None:
+        """
+        Writes the batches one by one in the order they were submitted.
+
+        After a failed batch the next ones are skipped until the writer is reset,
+        as their messages are returned to the queue anyway.
+
+        :return: None
+        """
+        is_failed: bool = False
+        while True:
+            batch: Optional[Batch] = self.batches.get()
+            if batch is None:
+                return
+            if batch is RESET:
+                is_failed = False
+                continue
+            error: Optional[Exception] = None
+            if is_failed:
+                error = ConnectionError("The previous batch was not written")
+            else:
+                try:
+                    if self.client is None:
+                        self.client = self.get_client()
+                    batch.data_core.write_batch(self.client, batch)
+                except Exception as ex:
+                    error, is_failed, self.client = ex, True, None
+            self.written.put((batch, error))
+
+    def pop_written(self, wait: bool = False) -> Optional[int]:
+        """
+        Collects the batches written since the previous call.
+
+        If a batch failed, its error is kept in the error attribute, and neither
+        it nor the batches after it are reported as written.
+
+        :param wait: Whether to wait until every submitted batch is written.
+        :return: The delivery tag of the last message written, or None if there is none.
+        """
+        delivery_tag: Optional[int] = None
+        while self.in_flight:
+            try:
+                batch, error = self.written.get(block=wait)
+            except queue.Empty:
+                break
+            self.in_flight -= 1
+            if error is not None and self.error is None:
+                self.error = error
+            if self.error is None:
+                self.unacked_messages -= len(batch.delivery_tags)
+                if batch.delivery_tags:
+                    delivery_tag = batch.delivery_tags[-1]
+        return delivery_tag
+
+    def reset(self) -> Optional[int]:
+        """
+        Waits for the submitted batches and forgets the failure, if any.
+
+        :return: The delivery tag of the last message written, or None if there is none.
+        """
+        delivery_tag: Optional[int] = self.pop_written(wait=True)
+        if self.error is not None:
+            self.batches.put(RESET)
+        self.error = None
+        self.unacked_messages = 0
+        self.last_delivery_tag = None
+        return delivery_tag
+
+    def close(self) -> None:
+        """
+        Stops the writer thread after the submitted batches are written.
+
+        :return: None
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.batches.put(None)
+            self.thread.join()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import zlib
+import base64
+from unittest.mock import MagicMock
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.audit import AuditLog, AUDIT_COLUMNS
+from scripts.tables import DataCoreClient
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline: float = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_audit_log() -> None:
+    """
+    Tests that the records are written in the background in batches,
+    right away when urgent, and that the records left are written on close.
+
+    :return: None
+    """
+    client: MagicMock = MagicMock()
+    audit_log: AuditLog = AuditLog(lambda: client, MagicMock(), batch_size=2, flush_interval=60)
+
+    audit_log.add(["record_1"])
+    audit_log.add(["record_2"])
+    assert wait_for(lambda: client.insert.call_count == 1)
+    assert client.insert.call_args.kwargs["data"] == [["record_1"], ["record_2"]]
+    assert client.insert.call_args.kwargs["column_names"] == AUDIT_COLUMNS
+
+    audit_log.add(["record_3"], is_urgent=True)
+    assert wait_for(lambda: client.insert.call_count == 2)
+
+    audit_log.add(["record_4"])
+    audit_log.close()
+    assert client.insert.call_args.kwargs["data"] == [["record_4"]]
+
+
+def test_audit_log_logger_rotation() -> None:
+    """
+    Tests that the errors of the audit log are logged by the logger current at the time of the error,
+    not by the one of the day the shared audit log was created.
+
+    :return: None
+    """
+    client: MagicMock = MagicMock()
+    client.insert.side_effect = ConnectionError("Connection refused")
+    loggers: list = [MagicMock(name="day_1")]
+    audit_log: AuditLog = AuditLog(lambda: client, lambda: loggers[-1], batch_size=1, flush_interval=60)
+
+    audit_log.add(["record_1"])
+    assert wait_for(lambda: loggers[0].error.call_count == 1)
+
+    loggers.append(MagicMock(name="day_2"))
+    audit_log.add(["record_2"])
+    assert wait_for(lambda: loggers[1].error.call_count == 1)
+    assert loggers[0].error.call_count == 1
+    audit_log.close()
+
+
+def test_encode_audit_message(mocker: MagicMock) -> None:
+    """
+    Tests that the audit message is compact JSON, compressed if configured.
+
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    message: dict = {"header": {"report": "Отчет"}, "data": [{"a": 1}]}
+    assert DataCoreClient.encode_audit_message(message) == '{"header":{"report":"Отчет"},"data":[{"a":1}]}'
+
+    mocker.patch("scripts.tables.AUDIT_COMPRESSION", "zlib")
+    encoded: str = DataCoreClient.encode_audit_message(message)
+    assert encoded.startswith("zlib:")
+    assert json.loads(zlib.decompress(base64.b64decode(encoded[5:]))) == message
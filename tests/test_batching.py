@@ -0,0 +1,43 @@
+import os
+import pytest
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.batching import BatchPolicy
+
+
+@pytest.mark.parametrize("rows, size_bytes, age, expected", [
+    (100, 1000, 1.0, False),
+    (5000, 1000, 1.0, True),
+    (100, 64 * 1024 * 1024, 1.0, True),
+    (100, 1000, 10.0, True),
+])
+def test_batch_policy_is_full(rows: int, size_bytes: int, age: float, expected: bool) -> None:
+    """
+    Tests that a batch is flushed by the count of rows, the size or the age, whatever comes first.
+
+    :param rows: The count of rows in the batch
+    :param size_bytes: The size of the batch
+    :param age: The age of the batch
+    :param expected: Whether the batch must be flushed
+    :return: None
+    """
+    policy: BatchPolicy = BatchPolicy(target_rows=5000, max_bytes=64 * 1024 * 1024, max_latency=10.0)
+    assert policy.is_full(rows, size_bytes, age) is expected
+
+
+def test_batch_policy_update() -> None:
+    """
+    Tests that the target count of rows follows the observed insert speed within the limits.
+
+    :return: None
+    """
+    policy: BatchPolicy = BatchPolicy(target_rows=5000, min_rows=500, max_rows=50000, target_seconds=2.0)
+    policy.update(5000, 0.5)  # 20000 строк за 2 секунды
+    assert policy.target_rows == 12500
+    policy.update(100, 10.0)  # маленькая пачка не учитывается
+    assert policy.target_rows == 12500
+    for _ in range(10):
+        policy.update(10000, 100.0)
+    assert policy.target_rows == 500
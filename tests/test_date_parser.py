@@ -0,0 +1,34 @@
+import os
+import pytz
+import pytest
+from typing import Union
+from datetime import date, datetime
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.date_parser import DateParser
+
+
+@pytest.mark.parametrize("date_, is_datetime, expected", [
+    ("2024-05-17", False, date(2024, 5, 17)),
+    ("17.05.2024", False, date(2024, 5, 17)),
+    ("17.05.2024 10:11:12", False, date(2024, 5, 17)),
+    ("2024-05-17T10:11:12Z", True, pytz.utc.localize(datetime(2024, 5, 17, 10, 11, 12))),
+    ("2024-5-7", False, date(2024, 5, 7)),  # не по форме, разбирается через strptime
+    ("2024-05-17T10:11:12+03:00", True, None),  # дата с часовым поясом не локализуется
+    ("2024-02-30", False, None),
+    ("17.05.24", False, None),
+])
+def test_date_parser(date_: str, is_datetime: bool, expected: Union[date, datetime, None]) -> None:
+    """
+    Tests that the dates are parsed by shape or by DATE_FORMATS and the unknown ones are rejected.
+
+    :param date_: The date string
+    :param is_datetime: Whether the date string represents a datetime
+    :param expected: The expected result
+    :return: None
+    """
+    date_parser: DateParser = DateParser()
+    assert date_parser.parse(date_, "date", is_datetime) == expected
+    assert date_parser.parse(date_, "date", is_datetime) == expected
@@ -0,0 +1,132 @@
+import os
+import json
+import pytest
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.decoder import JsonDecoder
+
+MESSAGE: dict = {
+    "data": [{"id": 1, "price": 1.5, "name": "Контейнер"}, {"id": 2, "price": 2.0, "name": None}],
+    "header": {"report": "Отчет", "key_id": "key"}
+}
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+@pytest.mark.parametrize("body", [
+    json.dumps(MESSAGE, ensure_ascii=False),
+    json.dumps(MESSAGE, ensure_ascii=False).encode("utf-8"),
+    json.dumps(MESSAGE, ensure_ascii=False).encode("utf-8-sig"),
+    bytearray(json.dumps(MESSAGE, ensure_ascii=False).encode("utf-8-sig")),
+])
+def test_json_decoder_loads(backend: str, body) -> None:
+    """
+    Tests that the message is parsed the same by both backends, with and without the BOM.
+
+    :param backend: The JSON backend.
+    :param body: The message.
+    :return: None
+    """
+    if backend == "orjson":
+        pytest.importorskip("orjson")
+    assert JsonDecoder(backend=backend).loads(body) == MESSAGE
+
+
+def test_json_decoder_loads_fallback() -> None:
+    """
+    Tests that the documents orjson rejects are parsed as json parses them.
+
+    :return: None
+    """
+    body: bytes = b'{"value": NaN, "big": 123456789012345678901234567890}'
+    result: dict = JsonDecoder(backend="auto").loads(body)
+    assert result["value"] != result["value"]
+    assert result["big"] == 123456789012345678901234567890
+
+
+def test_json_decoder_stream() -> None:
+    """
+    Tests that the header and the rows are parsed separately from a message with the header at the end.
+
+    :return: None
+    """
+    pytest.importorskip("ijson")
+    decoder: JsonDecoder = JsonDecoder(stream_min_bytes=10)
+    body: bytes = json.dumps(MESSAGE, ensure_ascii=False).encode("utf-8-sig")
+
+    assert decoder.is_streamable(body)
+    assert not decoder.is_streamable(body[:5])
+    assert not decoder.is_streamable(MESSAGE)
+    assert decoder.load_header(body) == MESSAGE["header"]
+    rows: list = list(decoder.iter_rows(body))
+    assert rows == MESSAGE["data"]
+    assert [type(value) for value in rows[1].values()] == [int, float, type(None)]
+    assert decoder.load_header(b'{"data": []}') == {}
+
+
+def test_json_decoder_scan_prefix() -> None:
+    """
+    Tests that the top-level items are parsed from the prefix of the message
+    only as long as they fit in it.
+
+    :return: None
+    """
+    header_first: bytes = json.dumps(
+        {"header": MESSAGE["header"], "data": MESSAGE["data"] * 100}, ensure_ascii=False
+    ).encode("utf-8-sig")
+    header_last: bytes = json.dumps(MESSAGE, ensure_ascii=False).encode("utf-8")
+
+    assert JsonDecoder.scan_prefix(header_first, max_bytes=60) == {"header": MESSAGE["header"]}
+    assert JsonDecoder.scan_prefix(header_first, max_bytes=40) == {}
+    assert JsonDecoder.scan_prefix(header_last) == {"header": MESSAGE["header"]}
+    assert JsonDecoder.scan_prefix(header_last, max_bytes=100) == {}
+    assert JsonDecoder.scan_prefix(header_last, keys=("data", "header")) == MESSAGE
+    assert JsonDecoder.scan_prefix('{"data": []}', keys=("header",)) == {}
+    assert JsonDecoder.scan_prefix(b'[{"header": {}}]') == {}
+
+
+def test_json_decoder_scan_prefix_skips_values(mocker) -> None:
+    """
+    Tests that the values of the other keys are skipped without being decoded,
+    so the rows of a message with the header at the end are not parsed twice.
+
+    :return: None
+    """
+    raw_decode = mocker.spy(json.JSONDecoder, "raw_decode")
+    body: bytes = json.dumps(
+        {"data": MESSAGE["data"] + [{"text": 'a "quoted" [text] {x}\\', "list": [[], {}]}], "count": -1.5e3,
+         "flag": True, "empty": None, "header": MESSAGE["header"]},
+        ensure_ascii=False
+    ).encode("utf-8")
+
+    assert JsonDecoder.scan_prefix(body) == {"header": MESSAGE["header"]}
+    assert [value for value, _ in raw_decode.spy_return_list] == ["data", "count", "flag", "empty", "header"] \
+        + [MESSAGE["header"]]
+    assert JsonDecoder.scan_prefix(body[:body.index(b'"quoted')]) == {}
+    assert JsonDecoder.scan_prefix(body, keys=("flag", "empty", "count")) == \
+        {"count": -1500.0, "flag": True, "empty": None}
+
+
+def test_json_decoder_scan_suffix() -> None:
+    """
+    Tests that the header is parsed from the end of the message only if it is its last top-level item.
+
+    :return: None
+    """
+    header_last: bytes = json.dumps(
+        {"data": MESSAGE["data"] * 100 + [{"header": {"report": "Строка"}}], "header": MESSAGE["header"]},
+        ensure_ascii=False
+    ).encode("utf-8")
+    header_first: bytes = json.dumps(
+        {"header": MESSAGE["header"], "data": [{"header": {"report": "Строка"}}]}, ensure_ascii=False
+    ).encode("utf-8")
+    nested: bytes = json.dumps({"data": [], "meta": {"header": MESSAGE["header"]}}).encode("utf-8")
+
+    assert JsonDecoder.scan_suffix(header_last) == {"header": MESSAGE["header"]}
+    assert JsonDecoder.scan_suffix(header_last, max_bytes=75) == {"header": MESSAGE["header"]}
+    assert JsonDecoder.scan_suffix(header_last, max_bytes=40) == {}
+    assert JsonDecoder.scan_suffix(header_last.decode("utf-8") + "\n") == {"header": MESSAGE["header"]}
+    assert JsonDecoder.scan_suffix(header_first) == {}
+    assert JsonDecoder.scan_suffix(nested) == {}
+    assert JsonDecoder.scan_suffix(b'{"data": [') == {}
@@ -0,0 +1,47 @@
+import os
+import threading
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.stats import StatsStore
+from scripts.metrics import MetricsRegistry
+
+
+def test_metrics_registry(tmp_path) -> None:
+    """
+    Tests that the counters of several threads are summed up by queue and table
+    and that every flush adds them to the metrics table.
+
+    :return: None
+    """
+    stats_store: StatsStore = StatsStore(str(tmp_path / "stats.db"), flush_interval=60)
+    metrics: MetricsRegistry = MetricsRegistry(stats_store, flush_interval=60)
+
+    def add() -> None:
+        for _ in range(100):
+            metrics.add("queue_1", "table_1", count_message=1, count_rows=10, size_bytes=100, parse_seconds=0.5)
+
+    threads: list = [threading.Thread(target=add) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.add("queue_1", "table_1", insert_seconds=2.0)
+    metrics.add("queue_2", None, count_errors=1)
+
+    assert metrics.collect() == {
+        ("queue_1", "table_1"): [400, 4000, 40000, 200.0, 2.0, 0],
+        ("queue_2", ""): [0, 0, 0, 0, 0, 1]
+    }
+    assert metrics.collect() == {}
+
+    metrics.add("queue_2", None, count_errors=1)
+    metrics.flush()
+    metrics.add("queue_2", None, count_message=1, count_errors=1)
+    metrics.close()
+    rows: list = stats_store.conn.execute(
+        "SELECT queue_name, table_name, count_message, count_errors FROM metrics"
+    ).fetchall()
+    assert rows == [("queue_2", "", 1, 2)]
+    stats_store.close()
@@ -0,0 +1,293 @@
+import os
+import pika
+import pytest
+import asyncio
+import threading
+from typing import Callable, Optional
+from unittest.mock import ANY, MagicMock
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.rabbit_mq import RabbitMQConnectionPool, AsyncRabbitMQ
+
+
+def test_connection_pool_reuses_channel_of_queue(mocker: MagicMock) -> None:
+    """
+    Tests that a queue gets the same channel on every lease, that a channel closed
+    by the broker is reopened, and that a lost connection is re-established.
+
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    connection_class: MagicMock = mocker.patch("scripts.rabbit_mq.pika.BlockingConnection")
+    connection_class.return_value.channel.side_effect = lambda: MagicMock()
+    pool: RabbitMQConnectionPool = RabbitMQConnectionPool(size=2)
+
+    with pool.lease("queue_1") as (connection, channel):
+        first_channel: MagicMock = channel
+    with pool.lease("queue_1") as (connection, channel):
+        assert channel is first_channel
+
+    first_channel.is_open = False
+    with pool.lease("queue_1") as (connection, channel):
+        assert channel is not first_channel
+    assert connection_class.call_count == 1
+
+    connection.is_open = False
+    with pool.lease("queue_1") as (connection, channel):
+        pass
+    assert connection_class.call_count == 2
+
+
+def test_connection_pool_hands_out_free_connections(mocker: MagicMock) -> None:
+    """
+    Tests that a connection is leased by one queue at a time.
+
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    mocker.patch("scripts.rabbit_mq.pika.BlockingConnection", side_effect=lambda *args: MagicMock())
+    pool: RabbitMQConnectionPool = RabbitMQConnectionPool(size=2)
+
+    with pool.lease("queue_1") as (connection_1, _), pool.lease("queue_2") as (connection_2, _):
+        assert connection_1 is not connection_2
+        assert pool.free == []
+    assert sorted(pool.free) == [0, 1]
+
+
+def test_connection_pool_concurrent_leases(mocker: MagicMock) -> None:
+    """
+    Tests that the workers leasing connections at the same time never share one,
+    while the channels of lost connections are dropped and reopened.
+
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    def new_connection(*args) -> MagicMock:
+        connection: MagicMock = MagicMock()
+        connection.channel.side_effect = lambda: MagicMock()
+        return connection
+
+    mocker.patch("scripts.rabbit_mq.pika.BlockingConnection", side_effect=new_connection)
+    pool: RabbitMQConnectionPool = RabbitMQConnectionPool(size=3)
+    leased: set = set()
+    leased_lock: threading.Lock = threading.Lock()
+    errors: list = []
+
+    def work(worker: int) -> None:
+        try:
+            for turn in range(200):
+                with pool.lease(f"queue_{(worker + turn) % 5}") as (connection, channel):
+                    with leased_lock:
+                        assert id(connection) not in leased
+                        leased.add(id(connection))
+                    if turn % 7 == 0:
+                        connection.is_open = False  # соединение потеряно, каналы пересоздаются
+                    with leased_lock:
+                        leased.remove(id(connection))
+        except Exception as e:
+            errors.append(e)
+
+    threads: list = [threading.Thread(target=work, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(pool.free) == [0, 1, 2]
+    assert all(index in pool.connections for index, _ in pool.channels)
+    pool.close()
+    assert pool.connections == {} and pool.channels == {}
+
+
+class FakeChannel:
+    def __init__(self, connection: "FakeConnection", channel_number: int):
+        self.connection: FakeConnection = connection
+        self.channel_number: int = channel_number
+        self.is_open: bool = True
+        self.close_callbacks: list = []
+        self.on_message_callback: Optional[Callable] = None
+        self.basic_ack: MagicMock = MagicMock()
+        self.basic_nack: MagicMock = MagicMock()
+        self.basic_publish: MagicMock = MagicMock()
+        self.basic_cancel: MagicMock = MagicMock()
+        self.queue_bind: MagicMock = MagicMock(side_effect=self._answer)
+
+    def _answer(self, *args, callback: Callable, **kwargs) -> None:
+        self.connection.loop.call_soon(callback, MagicMock())
+
+    def add_on_close_callback(self, callback: Callable) -> None:
+        self.close_callbacks.append(callback)
+
+    def close_by_broker(self, reason: str) -> None:
+        self.is_open = False
+        for callback in self.close_callbacks:
+            callback(self, pika.exceptions.ChannelClosedByBroker(404, reason))
+
+    def queue_declare(self, queue: str, callback: Callable, passive: bool = False, durable: bool = False) -> None:
+        if queue in self.connection.missing_queues:
+            # Брокер не отвечает на запрос, а закрывает канал
+            self.connection.loop.call_soon(self.close_by_broker, f"NOT_FOUND - no queue '{queue}'")
+            return
+        frame: MagicMock = MagicMock()
+        frame.method.message_count = 7
+        self.connection.loop.call_soon(callback, frame)
+
+    def basic_qos(self, prefetch_count: int, callback: Callable) -> None:
+        self._answer(callback=callback)
+
+    def basic_consume(self, queue: str, on_message_callback: Callable, auto_ack: bool, callback: Callable) -> str:
+        self.on_message_callback = on_message_callback
+        self._answer(callback=callback)
+        return "consumer_tag"
+
+    def deliver(self, delivery_tag: int, body: bytes) -> None:
+        method: pika.spec.Basic.Deliver = pika.spec.Basic.Deliver(delivery_tag=delivery_tag)
+        self.on_message_callback(self, method, pika.BasicProperties(), body)
+
+
+class FakeConnection:
+    instances: list = []
+
+    def __init__(self, parameters, on_open_callback: Callable, on_open_error_callback: Callable, custom_ioloop):
+        self.loop: asyncio.AbstractEventLoop = custom_ioloop
+        self.is_open: bool = True
+        self.missing_queues: set = set()
+        self.channels: list = []
+        self.close_callbacks: list = []
+        FakeConnection.instances.append(self)
+        self.loop.call_soon(on_open_callback, self)
+
+    def channel(self, on_open_callback: Callable) -> None:
+        channel: FakeChannel = FakeChannel(self, len(self.channels) + 1)
+        self.channels.append(channel)
+        self.loop.call_soon(on_open_callback, channel)
+
+    def add_on_close_callback(self, callback: Callable) -> None:
+        self.close_callbacks.append(callback)
+
+    def close(self) -> None:
+        self.is_open = False
+        for callback in self.close_callbacks:
+            self.loop.call_soon(callback, self, None)
+
+
+@pytest.fixture
+def fake_connection(mocker: MagicMock) -> type:
+    """
+    Replaces the asyncio connection of pika with a fake one that answers on the event loop.
+
+    :param mocker: Mocker fixture
+    :return: The class of the fake connection.
+    """
+    FakeConnection.instances = []
+    mocker.patch("scripts.rabbit_mq.AsyncioConnection", FakeConnection)
+    return FakeConnection
+
+
+def test_async_rabbit_mq_declare_and_publish(fake_connection: type) -> None:
+    """
+    Tests that the queue is declared and bound on its own channel of the shared connection,
+    and that the message is published to the exchange.
+
+    :param fake_connection: The class of the fake connection
+    :return: None
+    """
+    async def main() -> None:
+        rabbit_mq: AsyncRabbitMQ = AsyncRabbitMQ()
+        await rabbit_mq.declare_and_bind_queue("queue_1", "key_1")
+        await rabbit_mq.publish("queue_2", "key_2", b"message")
+        assert await rabbit_mq.message_count("queue_1") == 7
+
+        connection: FakeConnection = fake_connection.instances[0]
+        assert len(fake_connection.instances) == 1
+        assert [channel.channel_number for channel in connection.channels] == [1, 2]
+        channel_1, channel_2 = connection.channels
+        channel_1.queue_bind.assert_called_once_with(
+            queue="queue_1", exchange=rabbit_mq.exchange_name, routing_key="key_1", callback=ANY
+        )
+        channel_2.basic_publish.assert_called_once_with(
+            exchange=rabbit_mq.exchange_name, routing_key="key_2", body=b"message"
+        )
+        await rabbit_mq.close()
+        assert not rabbit_mq.is_connected()
+        await rabbit_mq.close()
+
+    asyncio.run(main())
+
+
+def test_async_rabbit_mq_consume(fake_connection: type) -> None:
+    """
+    Tests that the pushed messages are yielded in order, acknowledged on the channel of the queue,
+    and that the consumer is cancelled when the iteration stops.
+
+    :param fake_connection: The class of the fake connection
+    :return: None
+    """
+    async def main() -> None:
+        rabbit_mq: AsyncRabbitMQ = AsyncRabbitMQ()
+        messages: list = []
+        consumer = rabbit_mq.consume("queue_1", prefetch_count=10)
+        async for channel, method, properties, body in consumer:
+            if not messages:
+                channel.deliver(2, b"second")
+                channel.deliver(3, b"third")
+            messages.append(body)
+            if method.delivery_tag == 2:
+                rabbit_mq.ack(channel, method.delivery_tag)
+            elif method.delivery_tag == 3:
+                rabbit_mq.nack(channel, method.delivery_tag, requeue=False)
+                break
+        await consumer.aclose()
+
+        channel: FakeChannel = fake_connection.instances[0].channels[0]
+        assert messages == [b"first", b"second", b"third"]
+        channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=False)
+        channel.basic_nack.assert_called_once_with(delivery_tag=3, multiple=False, requeue=False)
+        channel.basic_cancel.assert_called_once_with("consumer_tag")
+        assert rabbit_mq._consumers == {}
+
+    def basic_consume(self, *args, **kwargs) -> str:
+        consumer_tag: str = original_basic_consume(self, *args, **kwargs)
+        self.connection.loop.call_soon(self.deliver, 1, b"first")
+        return consumer_tag
+
+    original_basic_consume: Callable = FakeChannel.basic_consume
+    FakeChannel.basic_consume = basic_consume
+    try:
+        asyncio.run(main())
+    finally:
+        FakeChannel.basic_consume = original_basic_consume
+
+
+def test_async_rabbit_mq_channel_closed(fake_connection: type) -> None:
+    """
+    Tests that the requests waiting for an answer fail when the broker closes the channel
+    instead of hanging, and that the channel is reopened for the next request.
+
+    :param fake_connection: The class of the fake connection
+    :return: None
+    """
+    async def main() -> None:
+        rabbit_mq: AsyncRabbitMQ = AsyncRabbitMQ()
+        await rabbit_mq.get_channel("queue_1")
+        connection: FakeConnection = fake_connection.instances[0]
+        connection.missing_queues.add("queue_1")
+        with pytest.raises(pika.exceptions.ChannelClosed):
+            await asyncio.wait_for(rabbit_mq.message_count("queue_1"), timeout=5)
+        assert rabbit_mq._pending.get(1, []) == []
+
+        connection.missing_queues.clear()
+        assert await rabbit_mq.message_count("queue_1") == 7
+        assert len(connection.channels) == 2
+
+        consumer = rabbit_mq.consume("queue_1")
+        consume_task: asyncio.Task = asyncio.ensure_future(consumer.__anext__())
+        await asyncio.sleep(0.01)
+        connection.channels[1].close_by_broker("CONNECTION_FORCED")
+        with pytest.raises(pika.exceptions.ChannelClosed):
+            await asyncio.wait_for(consume_task, timeout=5)
+
+    asyncio.run(main())
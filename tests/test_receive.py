@@ -6,14 +6,18 @@ import pytest
 import tempfile
 from typing import Union, Any
 from pathlib import PosixPath
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from datetime import date, datetime, time
 
 os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
 os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
 
-from scripts.receive import Receive
-from scripts.tables import RZHDOperationsReport, DataCoreClient
+from pika.exceptions import AMQPError
+from scripts.receive import Receive, PREFETCH_COUNT, PREFETCH_MAX_COUNT, AUDIT_SAMPLE_ROWS
+from scripts.batching import BatchPolicy
+from scripts.decoder import JSON_DECODER
+from scripts.tables import RZHDOperationsReport, DataCoreClient, SchemaCache, ColumnarBuffer, MessageContext, KeyMapper, \
+    LAYOUT_CACHE
 
 # Пример тела сообщения RabbitMQ
 MESSAGE_BODY: dict = {
@@ -94,6 +98,11 @@ MESSAGE_BODY: dict = {
         }
     ]
 }
+# Строки MESSAGE_BODY со всеми колонками таблицы rzhd_by_operations_report
+TABLE_ROWS: list = [
+    dict(row, destination_border_crossing=None, departure_border_crossing=None, wagon_number=None, wagon_owner=None)
+    for row in MESSAGE_BODY["data"]
+]
 LIST_COLUMNS: list = [
     'uuid', 'is_border_crossing_point', 'key_id', 'operation_name', 'operation_year',
     'document_number', 'direction', 'client_inn', 'service', 'container_type',
@@ -322,6 +331,406 @@ def test_receive_parse_data(
     assert data[0]["container_size"] == expected
 
 
+def test_data_core_convert_rows(receive_instance: Receive) -> None:
+    """
+    Tests that converting the rows of a message by columns gives the same rows as converting them one by one,
+    that the rows with different columns are left to the row path, and that the constant columns
+    of the message are converted once and attached by the rows buffer.
+
+    :param receive_instance: An instance of the Receive class
+    :return:
+    """
+    data_core: RZHDOperationsReport = RZHDOperationsReport(receive_instance)
+    rows: list = [copy.deepcopy(row) for row in MESSAGE_BODY["data"] * 3]
+    expected: list = copy.deepcopy(rows)
+    for row in expected:
+        if data_core.original_date_string:
+            row[data_core.original_date_string] = ''
+        data_core.change_columns(data=row)
+        if data_core.original_date_string:
+            row[data_core.original_date_string] = row[data_core.original_date_string].strip() or None
+
+    assert data_core.convert_rows(rows)
+    assert rows == expected
+    assert "sign" not in rows[0]
+
+    context: MessageContext = MessageContext("rzhd_by_operations_report")
+    context.columns = data_core.get_constant_columns(context)
+    assert context.columns == {
+        "sign": 1,
+        "original_file_parsed_on": context.file_name,
+        "is_obsolete_date": context.timestamp
+    }
+    rows_buffer: ColumnarBuffer = ColumnarBuffer(list(context.columns) + list(rows[0]))
+    rows_buffer.append_rows(rows, context.columns)
+    assert rows_buffer.get_column("sign") == [1] * len(rows)
+    assert rows_buffer.get_column("key_id") == [row["key_id"] for row in rows]
+
+    rows = [copy.deepcopy(row) for row in MESSAGE_BODY["data"] * 2]
+    rows[1].pop("service")
+    assert not data_core.convert_rows(rows)
+
+
+def test_receive_handle_streamed_json(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that a big message is parsed part by part, header after the data included,
+    and that its rows are buffered the same as the rows of a message parsed at once.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return:
+    """
+    pytest.importorskip("ijson")
+    mocker.patch("scripts.receive.RZHDOperationsReport.check_difference_columns", return_value=False)
+    mocker.patch("scripts.receive.JSON_DECODER.stream_min_bytes", 1)
+    mocker.patch("scripts.receive.JSON_STREAM_CHUNK_ROWS", 2)
+    mocker.patch("scripts.receive.ROUTE_PREFIX_BYTES", 0)
+    message: dict = {"data": TABLE_ROWS * 3, "header": MESSAGE_BODY["header"]}
+    body: bytes = json.dumps(message, ensure_ascii=False).encode("utf-8-sig")
+
+    all_data, data, data_core, key_deals = receive_instance.handle_incoming_json(body)
+    streamed_buffer: ColumnarBuffer = data_core.rows_buffer
+
+    assert isinstance(data_core, RZHDOperationsReport)
+    assert key_deals == MESSAGE_BODY["header"]["key_id"]
+    assert all_data["header"] == MESSAGE_BODY["header"]
+    assert len(all_data["data"]) == 2
+    assert data == []
+    assert receive_instance.message_rows == len(streamed_buffer) == 6
+
+    assert streamed_buffer.columns == [column for column in data_core.get_table_columns() if column != "uuid"]
+
+    receive_instance.rows_buffers = {}
+    mocker.patch("scripts.receive.JSON_DECODER.stream_min_bytes", 0)
+    _, data, _, _ = receive_instance.handle_incoming_json(body)
+    rows_buffer: ColumnarBuffer = data_core.rows_buffer
+    rows_buffer.append_rows(data, receive_instance.message_context.columns)
+    assert streamed_buffer.columns == rows_buffer.columns
+    assert len(set(streamed_buffer.get_column("is_obsolete_date"))) == 1
+    for column in streamed_buffer.columns:
+        if column not in ("original_file_parsed_on", "is_obsolete_date"):
+            assert streamed_buffer.get_column(column) == rows_buffer.get_column(column)
+
+
+def test_receive_handle_streamed_json_flushes_parts(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that the rows of a big message are flushed as soon as the batch is full, that the previous
+    versions of the deal are cancelled with the first batch only, and that the message is acknowledged
+    with the batch of its last rows.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return:
+    """
+    pytest.importorskip("ijson")
+    mocker.patch("scripts.receive.RZHDOperationsReport.check_difference_columns", return_value=False)
+    mocker.patch("scripts.receive.JSON_DECODER.stream_min_bytes", 1)
+    mocker.patch("scripts.receive.JSON_STREAM_CHUNK_ROWS", 2)
+    mocker.patch("scripts.receive.ROUTE_PREFIX_BYTES", 0)
+    mocker.patch.object(RZHDOperationsReport, "batch_policy", BatchPolicy(target_rows=3))
+    batches: list = []
+    mocker.patch.object(
+        RZHDOperationsReport, "flush_rows",
+        lambda self: batches.append((len(self.rows_buffer), self.take_batch()))
+    )
+    load_header: MagicMock = mocker.spy(JSON_DECODER, "load_header")
+    message: dict = {"data": TABLE_ROWS * 4, "header": MESSAGE_BODY["header"]}
+    body: bytes = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    receive_instance.delivery_tags = [1, 2]
+
+    all_data, data, data_core, key_deals = receive_instance.handle_incoming_json(body)
+    assert data == [] and receive_instance.delivery_tags == [2]
+    data_core.flush_rows()  # handle_rows (patched in mock_main) flushes the last rows of the message
+
+    assert [rows for rows, _ in batches] == [4, 4, 0]
+    assert [batch.key_deals for _, batch in batches] == [[key_deals], [], []]
+    assert [batch.delivery_tags for _, batch in batches] == [[1], [], [2]]
+    load_header.assert_not_called()
+
+
+def test_receive_route_message(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that the small messages and the truncate-only messages are parsed once, while their header
+    is routed, that the rows of the messages of unknown reports are kept for the audit log,
+    and that only the first of them are parsed if the message is big.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return:
+    """
+    loads: MagicMock = mocker.patch("scripts.receive.JSON_DECODER.loads")
+    mocker.patch("scripts.receive.RZHDOperationsReport.check_difference_columns", return_value=False)
+    unknown: dict = {"header": {"report": "НеизвестныйОтчет", "key_id": "key"}, "data": MESSAGE_BODY["data"]}
+    body: bytes = json.dumps(unknown, ensure_ascii=False).encode("utf-8-sig")
+
+    all_data, data, data_core, key_deals = receive_instance.handle_incoming_json(body)
+    assert all_data == unknown
+    assert (data, data_core, key_deals) == (MESSAGE_BODY["data"], None, "key")
+
+    body = json.dumps({"header": MESSAGE_BODY["header"], "data": TABLE_ROWS}, ensure_ascii=False).encode("utf-8")
+    all_data, data, data_core, key_deals = receive_instance.handle_incoming_json(body)
+    assert isinstance(data_core, RZHDOperationsReport) and key_deals == MESSAGE_BODY["header"]["key_id"]
+    assert len(data) == len(TABLE_ROWS)
+
+    body = json.dumps({"data": [], "header": {"key_id": "key"}}).encode()
+    headers: dict = {"report": MESSAGE_BODY["header"]["report"], "key_id": "key", "is_truncate": True}
+    all_data, data, data_core, key_deals = receive_instance.handle_incoming_json(body, headers=headers)
+    assert all_data["header"] == headers
+    assert isinstance(data_core, RZHDOperationsReport) and key_deals is None
+    data_core.delete_old_deals.assert_called_once()
+    loads.assert_not_called()
+
+    assert receive_instance.route_message(MESSAGE_BODY) is None
+    assert receive_instance.route_message(b'{"data": [], "header": {}}', {"key_id": "key"}) == {
+        "header": {}, "data": []
+    }
+    assert receive_instance.route_message(b'{"data": [1], "header": {"is_truncate": true}}') == {
+        "header": {"is_truncate": True}, "data": [1]
+    }
+
+    pytest.importorskip("ijson")
+    mocker.patch("scripts.receive.JSON_DECODER.stream_min_bytes", 1)
+    mocker.patch("scripts.receive.ROUTE_PREFIX_BYTES", 0)
+    unknown["data"] = MESSAGE_BODY["data"] * AUDIT_SAMPLE_ROWS
+    body = json.dumps(unknown, ensure_ascii=False).encode("utf-8")
+    all_data, data, data_core, key_deals = receive_instance.handle_incoming_json(body)
+    assert all_data == {"header": unknown["header"], "data": unknown["data"][:AUDIT_SAMPLE_ROWS]}
+    assert data_core is None
+    loads.assert_not_called()
+
+
+def test_data_core_validate_layouts(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that every distinct layout of the rows is checked against the columns of the table,
+    not only the first row, and that the accepted layouts are remembered.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return:
+    """
+    data_core: RZHDOperationsReport = RZHDOperationsReport(receive_instance)
+    constants: dict = {"sign": 1, "original_file_parsed_on": "file.json", "is_obsolete_date": "2024-01-01 00:00:00"}
+    columns: list = data_core.get_table_columns()
+    row: dict = {column: None for column in columns if column not in constants and column != "uuid"}
+    check_difference_columns: MagicMock = mocker.spy(data_core, "check_difference_columns")
+    LAYOUT_CACHE.accepted.pop(RZHDOperationsReport, None)
+
+    assert data_core.validate_layouts({}, [dict(row), dict(row)], constants, "key", 1) == []
+    assert LAYOUT_CACHE.get_accepted(RZHDOperationsReport, data_core.layout_fingerprint) == {tuple(row)}
+
+    other_row: dict = dict(row, extra_column=None)
+    del other_row["client"]
+    assert sorted(data_core.validate_layouts({}, [dict(row), other_row], constants, "key", 1)) == [
+        "client", "extra_column"
+    ]
+    check_difference_columns.assert_called_once()
+
+
+def test_data_core_layout_fingerprint(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that the columns the rows must have are computed once for a table with the columns
+    listed in its class, and not for every message.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return:
+    """
+    data_core: RZHDOperationsReport = RZHDOperationsReport(receive_instance)
+    context: MessageContext = MessageContext("rzhd_by_operations_report")
+    context.columns = data_core.get_constant_columns(context)
+    row: dict = {
+        column: None for column in data_core.get_table_columns() if column not in context.columns and column != "uuid"
+    }
+    LAYOUT_CACHE.fingerprints.pop(RZHDOperationsReport, None)
+    get_table_columns: MagicMock = mocker.spy(RZHDOperationsReport, "get_table_columns")
+
+    receive_instance.process_data({}, [dict(row)], data_core, "rzhd_by_operations_report", "key", 1, context)
+    fingerprint: frozenset = data_core.layout_fingerprint
+    receive_instance.process_data({}, [dict(row)], data_core, "rzhd_by_operations_report", "key", 1, context)
+
+    assert get_table_columns.call_count == 1
+    assert data_core.layout_fingerprint is fingerprint
+
+
+def test_schema_cache() -> None:
+    """
+    Tests that the table is described once until the ttl expires or the schema is invalidated.
+
+    :return:
+    """
+    client: MagicMock = MagicMock()
+    client.query.return_value.result_columns = [("key_id", "sign"), ("String", "Int8")]
+    schema_cache: SchemaCache = SchemaCache(ttl=60)
+
+    assert schema_cache.get(client, "DataCore", "table") == (["key_id", "sign"], ["String", "Int8"])
+    assert schema_cache.get(client, "DataCore", "table") == (["key_id", "sign"], ["String", "Int8"])
+    assert client.query.call_count == 1
+
+    schema_cache.invalidate("DataCore", "table")
+    schema_cache.get(client, "DataCore", "table")
+    assert client.query.call_count == 2
+
+    schema_cache.ttl = 0
+    schema_cache.get(client, "DataCore", "table")
+    assert client.query.call_count == 3
+
+
+def test_data_core_dedupe_rows_buffer(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that the rows are buffered by columns whatever the order of their keys is,
+    and that only the latest version of a deal is kept.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return:
+    """
+    mocker.patch.object(DataCoreClient, "table", "table")
+    data_core: DataCoreClient = DataCoreClient(receive_instance)
+    rows_buffer: ColumnarBuffer = ColumnarBuffer(["key_id", "original_file_parsed_on", "value"])
+    receive_instance.rows_buffers[data_core.table] = rows_buffer
+    rows_buffer.append_rows([
+        {"key_id": "1", "original_file_parsed_on": "a", "value": 1},
+        {"key_id": "2", "original_file_parsed_on": "a", "value": 2},
+    ])
+    rows_buffer.append_rows([
+        {"value": 3, "original_file_parsed_on": "b", "key_id": "1"},
+        {"value": 4, "original_file_parsed_on": "b", "key_id": "1"},
+    ])
+    assert len(rows_buffer) == 4
+
+    columns, data = data_core.dedupe_rows_buffer()
+    assert columns == ["key_id", "original_file_parsed_on", "value"]
+    assert data == [["2", "1", "1"], ["a", "b", "b"], [2, 3, 4]]
+
+
+def test_columnar_buffer_check_layout() -> None:
+    """
+    Tests that the rows with a missing or an extra column are rejected by the rows buffer,
+    and that the constant columns are not looked for in the rows.
+
+    :return: None
+    """
+    rows_buffer: ColumnarBuffer = ColumnarBuffer(["key_id", "value", "sign"])
+    rows_buffer.append_rows([{"value": 1, "key_id": "1"}], {"sign": 1})
+    assert rows_buffer.data == [["1"], [1], [1]]
+
+    with pytest.raises(ValueError, match=r"Missing columns: \['value'\]. Extra columns: \[\]"):
+        rows_buffer.append_rows([{"key_id": "2"}], {"sign": 1})
+    with pytest.raises(ValueError, match=r"Missing columns: \[\]. Extra columns: \['other'\]"):
+        rows_buffer.append_rows([{"key_id": "2", "value": 2, "other": 2}], {"sign": 1})
+    with pytest.raises(ValueError, match=r"Missing columns: \['sign'\]"):
+        rows_buffer.append_rows([{"key_id": "2", "value": 2}])
+    assert len(rows_buffer) == 1
+
+
+def test_receive_switch_table(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that the rows buffered for the previous table are flushed when a message of another table comes.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    mocker.patch.object(RZHDOperationsReport, "table", "rzhd_by_operations_report")
+    previous: MagicMock = MagicMock(table="previous_table")
+    receive_instance.data_core = previous
+    receive_instance.rows_buffers["previous_table"] = ColumnarBuffer(["key_id"])
+    data_core: DataCoreClient = RZHDOperationsReport(receive_instance)
+
+    receive_instance.switch_table(previous)
+    previous.flush_message_part.assert_not_called()
+
+    receive_instance.switch_table(data_core)
+    previous.flush_message_part.assert_not_called()
+    assert receive_instance.data_core is data_core
+
+    receive_instance.data_core = previous
+    receive_instance.rows_buffers["previous_table"].append_rows([{"key_id": "key_1"}])
+    receive_instance.switch_table(data_core)
+    previous.flush_message_part.assert_called_once()
+
+
+@pytest.mark.parametrize("mode", ["server", "client"])
+def test_data_core_update_status(mocker: MagicMock, mode: str) -> None:
+    """
+    Tests that the previous versions of the deals are cancelled by one INSERT ... SELECT in the server mode
+    and are selected and inserted back with sign -1 in the client mode, with the keys bound as a parameter.
+
+    :param mocker: Mocker fixture
+    :param mode: The mode of cancelling the deals
+    :return:
+    """
+    mocker.patch("scripts.tables.UPDATE_STATUS_MODE", mode)
+    mocker.patch.object(RZHDOperationsReport, "table", "rzhd_by_operations_report")
+    receive: MagicMock = MagicMock()
+    receive.client.query.return_value.result_rows = [("1", 1)]
+    receive.client.query.return_value.column_names = ("key_id", "sign")
+    receive.key_deals_buffer = ["1", "2", "1"]
+
+    RZHDOperationsReport(receive).update_status()
+    if mode == "server":
+        query: str = receive.client.command.call_args.args[0]
+        assert query.startswith("INSERT INTO DataCore.rzhd_by_operations_report SELECT * REPLACE (-1 AS sign)")
+        assert "key_id IN {keys:Array(String)}" in query
+        assert receive.client.command.call_args.kwargs["parameters"] == {"keys": ["1", "2"]}
+        receive.client.query.assert_not_called()
+    else:
+        receive.client.command.assert_not_called()
+        assert receive.client.query.call_args.kwargs["parameters"] == {"keys": ["1", "2"]}
+        assert receive.client.insert.call_args.kwargs["data"] == [["1", -1]]
+
+
+def test_data_core_update_status_keys_table(mocker: MagicMock) -> None:
+    """
+    Tests that many keys are loaded into a temporary table in chunks and the deals are cancelled by one statement.
+
+    :param mocker: Mocker fixture
+    :return:
+    """
+    mocker.patch("scripts.tables.UPDATE_STATUS_MODE", "server")
+    mocker.patch("scripts.tables.UPDATE_STATUS_CHUNK_SIZE", 2)
+    mocker.patch("scripts.tables.UPDATE_STATUS_KEYS_TABLE_MIN", 3)
+    mocker.patch.object(RZHDOperationsReport, "table", "rzhd_by_operations_report")
+    receive: MagicMock = MagicMock()
+    receive.key_deals_buffer = ["1", "2", "3"]
+
+    RZHDOperationsReport(receive).update_status()
+    queries: list = [call.args[0] for call in receive.client.command.call_args_list]
+    assert queries[:2] == ["CREATE TEMPORARY TABLE IF NOT EXISTS deal_keys (key String)", "TRUNCATE TABLE deal_keys"]
+    assert queries[2:4] == ["INSERT INTO deal_keys SELECT arrayJoin({keys:Array(String)})"] * 2
+    assert "key_id IN (SELECT key FROM deal_keys)" in queries[4]
+    assert len(queries) == 5
+
+
+@pytest.mark.parametrize("keys_table_min", [0, 2])
+def test_data_core_update_status_truncate(mocker: MagicMock, keys_table_min: int) -> None:
+    """
+    Tests that the empty key of a truncate message in the buffer is not bound as a key,
+    neither as a parameter nor in the temporary table, and that nothing is cancelled without keys.
+
+    :param mocker: Mocker fixture
+    :param keys_table_min: The count of keys from which they are loaded into the temporary table
+    :return:
+    """
+    mocker.patch("scripts.tables.UPDATE_STATUS_MODE", "server")
+    mocker.patch("scripts.tables.UPDATE_STATUS_KEYS_TABLE_MIN", keys_table_min)
+    mocker.patch.object(RZHDOperationsReport, "table", "rzhd_by_operations_report")
+    receive: MagicMock = MagicMock()
+    receive.key_deals_buffer = ["1", None, "", "2"]
+
+    RZHDOperationsReport(receive).update_status()
+    bound_keys: list = [
+        call.kwargs["parameters"]["keys"] for call in receive.client.command.call_args_list
+        if call.kwargs.get("parameters")
+    ]
+    assert bound_keys == [["1", "2"]]
+
+    receive.client.command.reset_mock()
+    receive.key_deals_buffer = [None]
+    RZHDOperationsReport(receive).update_status()
+    receive.client.command.assert_not_called()
+
+
 def test_receive_write_to_json(receive_instance: Receive, tmp_path: PosixPath) -> None:
     """
     Tests the write_to_json method of the Receive class.
@@ -367,6 +776,27 @@ def test_datacore_convert_to_lowercase(datacore_client_instance: DataCoreClient,
     assert datacore_client_instance.convert_to_lowercase(data) == expected
 
 
+def test_key_mapper() -> None:
+    """
+    Tests that the keys are normalized once per layout, as the dict comprehension
+    of convert_to_lowercase did, and that the rows with normalized keys are not copied.
+
+    :return: None
+    """
+    normalize: MagicMock = MagicMock(side_effect=str.lower)
+    key_mapper: KeyMapper = KeyMapper(normalize)
+    rows: list = [{"Rate": 1, "PORT": "a"}, {"Rate": 2, "PORT": "b"}, {"rate": 3, "port": "c"}]
+
+    mapped: list = key_mapper.map_rows(rows)
+    assert mapped == [{"rate": 1, "port": "a"}, {"rate": 2, "port": "b"}, {"rate": 3, "port": "c"}]
+    assert mapped[2] is rows[2] and mapped[0] is not rows[0]
+    assert normalize.call_count == 4
+
+    row: dict = {"Key": 1, "KEY": 2, "other": 3}
+    assert key_mapper.map_row(row) == {k.lower(): v for k, v in row.items()}
+    assert list(key_mapper.map_row(row)) == list({k.lower(): v for k, v in row.items()})
+
+
 @pytest.mark.parametrize("data, columns, expected", [
     (
             {"price": "1 234,56", "price2": "1234.56"},
@@ -492,3 +922,148 @@ def test_datacore_convert_format_date(
         date_string, data, "test_column", is_datetime
     )
     assert result == expected
+
+
+def test_receive_consume_queue(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests the push consumer mode of the Receive class.
+
+    Messages pushed by the broker are passed to the callback with the count of messages
+    left for the consumer, also when the prefetch window is full, as the batch policy decides
+    when the batch is flushed. The consumer is cancelled when the queue is drained.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    frames: list = [
+        (MagicMock(delivery_tag=1), MagicMock(), b"{}"),
+        (MagicMock(delivery_tag=2), MagicMock(), b"{}"),
+        (None, None, None)
+    ]
+    receive_instance.rabbit_mq = MagicMock()
+    receive_instance.rabbit_mq.consume.return_value = iter(frames)
+    receive_instance.rabbit_mq.message_count.return_value = 5
+    receive_instance.rabbit_mq.waiting_message_count.return_value = 1
+    callback: MagicMock = mocker.patch.object(receive_instance, "callback")
+
+    receive_instance._consume_queue("test_queue", prefetch_count=2)
+
+    assert [call.args[-1] for call in callback.call_args_list] == [6, 6]
+    assert receive_instance.delivery_tags == [1, 2]
+    receive_instance.rabbit_mq.consume.assert_called_once_with("test_queue", 2)
+    receive_instance.rabbit_mq.message_count.assert_called_once_with("test_queue")
+    receive_instance.rabbit_mq.cancel.assert_called_once()
+
+
+@pytest.mark.parametrize("rows, size_bytes, expected", [
+    (None, None, PREFETCH_COUNT),  # размер сообщений еще неизвестен
+    (1, 100, PREFETCH_MAX_COUNT),  # маленькие сообщения, окно ограничено сверху
+    (20, 2000, 5000 // 20 * 3 + 1),  # окно вмещает пачку и пачки, ждущие записи
+    (20, 1024 * 1024, 64 * 3 + 1),  # большие сообщения, окно ограничено размером пачки
+    (10000, 1024, PREFETCH_COUNT),
+])
+def test_receive_get_prefetch_count(receive_instance: Receive, rows: int, size_bytes: int, expected: int) -> None:
+    """
+    Tests that the prefetch window holds the batches the batch policy of the table builds.
+
+    :param receive_instance: An instance of the Receive class
+    :param rows: The count of rows of the messages
+    :param size_bytes: The size of the messages
+    :param expected: The expected prefetch count
+    :return: None
+    """
+    receive_instance.data_core = MagicMock()
+    receive_instance.data_core.batch_policy = BatchPolicy(target_rows=5000, max_bytes=64 * 1024 * 1024)
+    if rows is not None:
+        receive_instance._update_message_size(rows, size_bytes)
+        receive_instance._update_message_size(rows, size_bytes)
+    with patch("scripts.receive.WRITER_QUEUE_SIZE", 2):
+        assert receive_instance._get_prefetch_count() == expected
+
+
+def test_receive_consume_queue_flushes_when_idle(receive_instance: Receive) -> None:
+    """
+    Tests that the rows left in the buffer are flushed when the consumer stays idle.
+
+    :param receive_instance: An instance of the Receive class
+    :return: None
+    """
+    receive_instance.rabbit_mq = MagicMock()
+    receive_instance.rabbit_mq.consume.return_value = iter([(None, None, None)])
+    receive_instance.data_core = MagicMock()
+    receive_instance.delivery_tags = [1]
+
+    receive_instance._consume_queue("test_queue")
+
+    receive_instance.data_core.flush_rows.assert_called_once()
+    receive_instance.data_core.flush_log_messages.assert_called_once()
+
+
+def test_receive_coordinator_opens_no_connections(temp_log_file: str, mocker: MagicMock) -> None:
+    """
+    Tests that the coordinator of the queues (async_main) is created without the connections
+    to RabbitMQ and ClickHouse and without the writer thread, which only the workers use.
+
+    :param temp_log_file: The path to a temporary log file
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    rabbit_mq: MagicMock = mocker.patch("scripts.receive.RabbitMQ")
+    connect_to_db: MagicMock = mocker.patch("scripts.receive.Receive.connect_to_db")
+    writer: MagicMock = mocker.patch("scripts.receive.BatchWriter")
+
+    coordinator: Receive = Receive(log_file=temp_log_file, is_worker=False)
+
+    assert coordinator.rabbit_mq is None and coordinator.client is None and coordinator.writer is None
+    rabbit_mq.assert_not_called()
+    connect_to_db.assert_not_called()
+    writer.assert_not_called()
+
+
+def test_receive_run_worker(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that a queue is processed by the same long-lived worker on every cycle
+    and that the worker reconnects after a connection error.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    worker: MagicMock = MagicMock()
+    worker_class: MagicMock = mocker.patch("scripts.receive.Receive", return_value=worker)
+    workers: dict = {}
+
+    receive_instance.run_worker(workers, "test_queue")
+    worker.process_queue.side_effect = AMQPError("Connection lost")
+    receive_instance.run_worker(workers, "test_queue")
+
+    worker_class.assert_called_once()
+    assert workers == {"test_queue": worker}
+    assert worker.process_queue.call_count == 2
+    worker.reconnect.assert_called_once()
+
+
+def test_receive_reconnect_resets_buffers(receive_instance: Receive, mocker: MagicMock) -> None:
+    """
+    Tests that the buffered rows, deals and delivery tags are dropped when the worker reconnects,
+    so the messages redelivered on the new channel are not buffered twice.
+
+    :param receive_instance: An instance of the Receive class
+    :param mocker: Mocker fixture
+    :return: None
+    """
+    mocker.patch.object(receive_instance.rabbit_mq, "reconnect")
+    receive_instance.delivery_tags = [1, 2]
+    receive_instance.key_deals_buffer = ["key_1", "key_2"]
+    receive_instance.rows_buffers["table"] = ColumnarBuffer(["key_id"])
+    receive_instance.rows_buffers["table"].append_rows([{"key_id": "key_1"}, {"key_id": "key_2"}])
+    receive_instance.message_context = MessageContext("table")
+
+    receive_instance.reconnect()
+
+    assert receive_instance.delivery_tags == []
+    assert receive_instance.key_deals_buffer == []
+    assert receive_instance.rows_buffers == {}
+    assert receive_instance.message_context is None
+    receive_instance.rabbit_mq.reconnect.assert_called_once()
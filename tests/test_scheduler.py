@@ -0,0 +1,139 @@
+import os
+import asyncio
+import pytest
+from typing import Tuple
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.scheduler import QueueState, QueueScheduler, POLL_MIN_DELAY, POLL_MAX_DELAY
+from scripts.supervisor import shard_queues
+
+
+@pytest.mark.parametrize("count_message, depth, delay, expected_ready_at, expected_delay", [
+    (10, 5, 8.0, 100.0, POLL_MIN_DELAY),  # бюджет хода закончился, очередь снова готова
+    (10, 0, 8.0, 100.0 + POLL_MIN_DELAY, POLL_MIN_DELAY),  # очередь вычитана
+    (0, 0, 8.0, 116.0, 16.0),  # пустая очередь, пауза удваивается
+    (0, 0, POLL_MAX_DELAY, 100.0 + POLL_MAX_DELAY, POLL_MAX_DELAY),
+])
+def test_queue_state_update(
+    count_message: int,
+    depth: int,
+    delay: float,
+    expected_ready_at: float,
+    expected_delay: float
+) -> None:
+    """
+    Tests that a queue is ready again right away while it has a backlog
+    and is polled with an adaptive delay once it is drained.
+
+    :param count_message: The count of messages processed during the turn
+    :param depth: The count of messages left in the queue
+    :param delay: The delay before the turn
+    :param expected_ready_at: The expected time of the next turn
+    :param expected_delay: The expected delay after the turn
+    :return: None
+    """
+    state: QueueState = QueueState("test_queue")
+    state.delay = delay
+    state.update(count_message, depth, now=100.0)
+    assert state.ready_at == expected_ready_at
+    assert state.delay == expected_delay
+
+
+def test_queue_scheduler_priority() -> None:
+    """
+    Tests that the queue waiting the longest gets the turn first
+    and that a deeper backlog raises the priority.
+
+    :return: None
+    """
+    scheduler: QueueScheduler = QueueScheduler(["small", "large", "idle", "failed"], lambda _: (0, 0), ["failed"])
+    scheduler.states["small"].ready_at = 90.0
+    scheduler.states["large"].ready_at = 95.0
+    scheduler.states["large"].depth = 100000
+    scheduler.states["idle"].ready_at = 120.0
+
+    due: list = scheduler.get_due_queues(now=100.0)
+    assert [state.queue_name for state in due] == ["large", "small"]
+
+    scheduler.states["large"].ready_at = 99.0
+    due = scheduler.get_due_queues(now=100.0)
+    assert [state.queue_name for state in due] == ["small", "large"]
+
+
+def test_queue_scheduler_run() -> None:
+    """
+    Tests that the scheduler keeps giving turns to a queue with a backlog
+    and stops when every queue is in the error list.
+
+    :return: None
+    """
+    queue_name_errors: list = []
+    turns: list = []
+
+    def run_turn(queue_name: str) -> Tuple[int, int]:
+        turns.append(queue_name)
+        if len(turns) == 3:
+            queue_name_errors.append(queue_name)
+        return 1, 5
+
+    asyncio.run(QueueScheduler(["test_queue"], run_turn, queue_name_errors).run())
+    assert turns == ["test_queue"] * 3
+
+
+def test_queue_scheduler_skips_empty_queue() -> None:
+    """
+    Tests that an idle queue is probed on the event loop
+    and its turn is skipped while it stays empty.
+
+    :return: None
+    """
+    queue_name_errors: list = []
+    probes: list = []
+    turns: list = []
+
+    async def probe_depth(queue_name: str) -> int:
+        probes.append(queue_name)
+        if len(probes) == 2:
+            queue_name_errors.append(queue_name)
+        return 0
+
+    def run_turn(queue_name: str) -> Tuple[int, int]:
+        turns.append(queue_name)
+        return 0, 0
+
+    scheduler: QueueScheduler = QueueScheduler(["test_queue"], run_turn, queue_name_errors, probe_depth=probe_depth)
+    scheduler.states["test_queue"].delay = 0.0
+    asyncio.run(scheduler.run())
+    assert probes == ["test_queue"] * 2
+    assert turns == []
+
+
+def test_queue_scheduler_pop_counters() -> None:
+    """
+    Tests that the processed messages are counted by queue and reset after they are reported.
+
+    :return: None
+    """
+    scheduler: QueueScheduler = QueueScheduler(["queue_1", "queue_2"], lambda _: (0, 0), [])
+    scheduler.states["queue_1"].update(10, 0, now=100.0)
+    scheduler.states["queue_1"].update(5, 0, now=101.0)
+    assert scheduler.pop_counters() == {"queue_1": 15, "queue_2": 0}
+    assert scheduler.pop_counters() == {"queue_1": 0, "queue_2": 0}
+
+
+@pytest.mark.parametrize("processes, expected", [
+    (1, [["q1", "q2", "q3", "q4", "q5"]]),
+    (2, [["q1", "q3", "q5"], ["q2", "q4"]]),
+    (8, [["q1"], ["q2"], ["q3"], ["q4"], ["q5"]]),
+])
+def test_shard_queues(processes: int, expected: list) -> None:
+    """
+    Tests that the queues are dealt round-robin across the worker processes without empty shards.
+
+    :param processes: The count of worker processes
+    :param expected: The expected shards
+    :return: None
+    """
+    assert shard_queues(["q1", "q2", "q3", "q4", "q5"], processes) == expected
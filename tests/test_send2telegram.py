@@ -0,0 +1,92 @@
+import os
+import pytest
+import requests
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from unittest.mock import MagicMock
+from scripts import send2telegram
+from scripts.stats import StatsStore
+
+
+@pytest.fixture
+def stats_file(tmp_path, monkeypatch) -> str:
+    """
+    Creates the stats file with the metrics of many queues and mocks the environment of the bot.
+
+    :return: The path of the stats file.
+    """
+    for var_name in ("CHAT_ID", "TOPIC", "MESSAGE_ID", "TOKEN_TELEGRAM", "HOST_HOSTNAME"):
+        monkeypatch.setenv(var_name, var_name.lower())
+    log_file: str = str(tmp_path / "stats.db")
+    monkeypatch.setattr(send2telegram, "LOG_FILE", log_file)
+    monkeypatch.setattr(send2telegram, "send_email_notifiers", MagicMock())
+    stats_store: StatsStore = StatsStore(log_file, flush_interval=60)
+    stats_store.increment("queue_1", 1, "table_1", "2024-01-01 00:00:00")
+    stats_store.add_metrics({
+        (f"queue_{i}", f"table_{i}"): [1, 10, 100, 0.5, 0.25, 0] for i in range(100)
+    })
+    stats_store.close()
+    return log_file
+
+
+def count_metrics(log_file: str) -> int:
+    """
+    Counts the rows of the metrics table.
+
+    :param log_file: The path of the stats file.
+    :return: The count of rows.
+    """
+    stats_store: StatsStore = StatsStore(log_file, flush_interval=60)
+    count: int = stats_store.conn.execute("SELECT COUNT(*) FROM metrics").fetchone()[0]
+    stats_store.close()
+    return count
+
+
+def test_send_message_splits_metrics(stats_file: str, monkeypatch) -> None:
+    """
+    Tests that the metrics summary is split into messages Telegram accepts
+    and that the metrics are deleted after all of them are sent.
+
+    :return: None
+    """
+    get: MagicMock = MagicMock()
+    monkeypatch.setattr(send2telegram.requests, "get", get)
+    send2telegram.send_message()
+
+    texts: list = [call.kwargs["params"]["text"] for call in get.call_args_list]
+    assert len(texts) > 2
+    assert all(len(text) <= 4096 for text in texts)
+    assert sum(text.count("📥 Очередь:") for text in texts[1:]) == 100
+    assert count_metrics(stats_file) == 0
+
+
+def test_send_message_keeps_metrics_on_error(stats_file: str, monkeypatch) -> None:
+    """
+    Tests that the metrics are kept for the next summary if Telegram rejects a message.
+
+    :return: None
+    """
+    response: MagicMock = MagicMock()
+    response.raise_for_status.side_effect = [None, requests.HTTPError("400 Bad Request")]
+    monkeypatch.setattr(send2telegram.requests, "get", MagicMock(return_value=response))
+    with pytest.raises(requests.HTTPError):
+        send2telegram.send_message()
+    assert count_metrics(stats_file) == 100
+
+
+def test_delete_sent_metrics_keeps_new_values(stats_file: str) -> None:
+    """
+    Tests that the values added to the metrics while the summary was sent are kept.
+
+    :return: None
+    """
+    stats_store: StatsStore = StatsStore(stats_file, flush_interval=60)
+    rows: list = stats_store.conn.execute("SELECT * FROM metrics").fetchall()
+    stats_store.add_metrics({("queue_1", "table_1"): [2, 20, 200, 1.0, 0.5, 1]})
+    send2telegram.delete_sent_metrics(stats_store.conn, rows)
+    assert stats_store.conn.execute(
+        "SELECT queue_name, count_message, count_rows, size_bytes, count_errors FROM metrics"
+    ).fetchall() == [("queue_1", 2, 20, 200, 1)]
+    stats_store.close()
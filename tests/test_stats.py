@@ -0,0 +1,42 @@
+import os
+import threading
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.stats import StatsStore
+
+
+def test_stats_store(tmp_path) -> None:
+    """
+    Tests that the increments of several threads are summed up by queue
+    and that the statistics saved are replaced.
+
+    :return: None
+    """
+    stats_store: StatsStore = StatsStore(str(tmp_path / "stats.db"), flush_interval=60)
+
+    def increment() -> None:
+        for _ in range(100):
+            stats_store.increment("queue_1", 1, "table_1", "2024-01-01 00:00:00")
+
+    threads: list = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats_store.increment("queue_2", 5, None, "2024-01-01 00:00:00")
+    stats_store.flush()
+    stats_store.increment("queue_2", 3, "table_2", "2024-01-02 00:00:00")
+
+    stats: dict = stats_store.load()
+    assert stats["queue_1"]["count_message"] == 400
+    assert stats["queue_2"] == {
+        "timestamp": "2024-01-02 00:00:00",
+        "count_message": 8,
+        "processed_table": "table_2"
+    }
+
+    stats_store.save({"queue_1": {"timestamp": "2024-01-03 00:00:00", "count_message": 1, "processed_table": None}})
+    assert stats_store.load()["queue_1"]["count_message"] == 1
+    stats_store.close()
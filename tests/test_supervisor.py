@@ -0,0 +1,163 @@
+import os
+import logging
+import multiprocessing
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+import scripts.__init__ as settings
+from scripts import supervisor
+from scripts.supervisor import Supervisor, run_shard
+
+
+class FakeProcess:
+    def __init__(self, target=None, args=(), name=None, daemon=None):
+        self.args: tuple = args
+        self.name: str = name
+        self.pid: int = 1000
+        self.exitcode = None
+
+    def start(self) -> None:
+        pass
+
+    def is_alive(self) -> bool:
+        return self.exitcode is None
+
+    def terminate(self) -> None:
+        self.exitcode = -15
+
+
+def crash_once(queue_names: list, max_concurrency: int, stats_queue: multiprocessing.Queue, process_name: str) -> None:
+    """
+    Crashes the first run of the shard, the second run reports the queues as processed.
+
+    :return: None
+    """
+    marker: str = os.path.join(os.environ["SUPERVISOR_TEST_DIR"], process_name)
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    stats_queue.put((os.getpid(), {queue_name: 1 for queue_name in queue_names}))
+
+
+def test_supervisor_check_processes(monkeypatch) -> None:
+    """
+    Tests that a crashed shard is restarted with its queues after restart_delay seconds
+    and that a shard which finished with exit code 0 is not.
+
+    :return: None
+    """
+    monkeypatch.setattr(supervisor.multiprocessing, "Process", FakeProcess)
+    sup: Supervisor = Supervisor(["q1", "q2", "q3"], processes=2, restart_delay=5.0)
+    for index in range(len(sup.shards)):
+        sup._start(index, 0.0)
+    crashed: FakeProcess = sup.processes[0]
+    crashed.exitcode = 1
+    sup.processes[1].exitcode = 0
+
+    sup._check_processes(now=100.0)
+    assert sup.restart_at == {0: 105.0}
+    assert list(sup.processes) == [0]
+    sup._check_processes(now=104.0)
+    assert sup.processes[0] is crashed
+
+    sup._check_processes(now=105.0)
+    assert sup.restart_at == {}
+    assert sup.processes[0] is not crashed
+    assert sup.processes[0].args[0] == ["q1", "q3"]
+    assert sup.processes[0].args[3] == "receive-0"
+
+
+def test_supervisor_restart_backoff(monkeypatch) -> None:
+    """
+    Tests that the delay before a restart doubles with every crash in a row, that the shard is
+    given up after max_restarts crashes in a row, and that a stable run starts the count over.
+
+    :return: None
+    """
+    monkeypatch.setattr(supervisor.multiprocessing, "Process", FakeProcess)
+    sup: Supervisor = Supervisor(["q1"], processes=1, restart_delay=5.0, max_restarts=2, stable_seconds=600.0)
+    sup._start(0, 0.0)
+
+    sup.processes[0].exitcode = 1
+    sup._check_processes(now=100.0)
+    sup._check_processes(now=105.0)
+    sup.processes[0].exitcode = 1
+    sup._check_processes(now=110.0)
+    assert sup.restart_at == {0: 120.0}
+    sup._check_processes(now=120.0)
+
+    sup.processes[0].exitcode = 1
+    sup._check_processes(now=1000.0)  # процесс проработал дольше stable_seconds
+    assert sup.restart_at == {0: 1005.0}
+    sup._check_processes(now=1005.0)
+    sup.processes[0].exitcode = 1
+    sup._check_processes(now=1010.0)
+    sup._check_processes(now=1020.0)
+    assert sup.restarts == {0: 2}
+    assert sup.processes[0].is_alive()
+
+    sup.processes[0].exitcode = 1
+    sup._check_processes(now=1030.0)
+    assert sup.processes == {}
+    assert sup.restart_at == {}
+
+
+def test_supervisor_stats() -> None:
+    """
+    Tests that the statistics of the workers are summed up by queue until they are reported.
+
+    :return: None
+    """
+    sup: Supervisor = Supervisor(["q1", "q2"], processes=2)
+    sup.stats_queue.put((1, {"q1": 2, "q2": 0}))
+    sup.stats_queue.put((2, {"q1": 3}))
+    sup._collect_stats(timeout=5.0)
+    sup._collect_stats(timeout=5.0)
+    sup._collect_stats(timeout=0.1)
+    assert sup.stats == {"q1": 5, "q2": 0}
+    sup._report_stats(60)
+    assert sup.stats == {}
+
+
+def test_supervisor_run(tmp_path, monkeypatch, caplog) -> None:
+    """
+    Tests that the supervisor restarts the worker processes that crashed
+    and stops once every worker is finished.
+
+    :return: None
+    """
+    monkeypatch.setenv("SUPERVISOR_TEST_DIR", str(tmp_path))
+    monkeypatch.setattr(supervisor, "run_shard", crash_once)
+    sup: Supervisor = Supervisor(["q1", "q2", "q3"], processes=2, restart_delay=0.0)
+    with caplog.at_level(logging.INFO, logger="supervisor"):
+        sup.run(report_interval=600)
+    for _ in range(2):
+        sup._collect_stats(timeout=1.0)
+
+    assert sorted(os.listdir(tmp_path)) == ["receive-0", "receive-1"]
+    assert caplog.text.count("crashed with exit code 1") == 2
+    assert sup.processes == {}
+    assert sup.stats == {"q1": 1, "q2": 1, "q3": 1}
+
+
+def test_run_shard_log_files(monkeypatch) -> None:
+    """
+    Tests that a worker process writes its logs to its own files.
+
+    :return: None
+    """
+    class FakeReceive:
+        def __init__(self, is_worker: bool = True):
+            assert not is_worker
+
+        async def async_main(self, queue_names: list, max_concurrency: int, stats_queue) -> None:
+            pass
+
+    import scripts.receive
+    monkeypatch.setattr(scripts.receive, "Receive", FakeReceive)
+    monkeypatch.setattr(settings, "LOG_NAME_SUFFIX", "")
+    run_shard(["q1"], 1, None, "receive-3")
+    handler: logging.FileHandler = settings.get_file_handler("receive_test")
+    handler.close()
+    assert handler.baseFilename.endswith("receive_test_receive-3.log")
@@ -0,0 +1,251 @@
+import os
+import re
+import copy
+import pytest
+from typing import Any
+from unittest.mock import MagicMock
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.receive import CLASSES
+from scripts.tables import DataCoreClient
+
+# Колонки, которые конвертировали методы change_columns таблиц до перехода на ConversionPlan
+LEGACY_CONVERSIONS: dict = {
+    "DataCoreFreight": {
+        "int_columns": ["container_count", "container_size", "operation_month"],
+        "date_columns": ["voyage_date", "operation_date", "voyage_month"]
+    },
+    "NaturalIndicatorsContractsSegments": {
+        "int_columns": ["year", "month"],
+        "date_columns": ["date"]
+    },
+    "OrdersReport": {
+        "date_columns": ["voyage_date"]
+    },
+    "AutoPickupGeneralReport": {
+        "float_columns": [
+            "overpayment", "downtime_amount", "agreed_rate", "total_rate", "carrier_rate", "economy", "overload_amount",
+            "add_expense_amount"
+        ],
+        "int_columns": ["container_size"],
+        "date_columns": [
+            "date_delivery_empty_fact", "date_delivery_empty_plan", "date_loading_fact", "date_delivery_fact",
+            "date_receiving_empty_fact", "date_delivery_plan", "date_loading_plan", "date_receiving_empty_plan"
+        ]
+    },
+    "Consignments": {
+        "int_columns": ["container_size", "teu", "year"],
+        "date_columns": ["voyage_date"]
+    },
+    "SalesPlan": {
+        "int_columns": ["teu", "container_count", "container_size", "year", "month"]
+    },
+    "NaturalIndicatorsTransactionFactDate": {
+        "int_columns": ["container_size", "operation_month", "container_count", "teu", "operation_year"],
+        "date_columns": ["operation_date", "order_date"]
+    },
+    "DevelopmentCounterpartyDepartment": {
+        "int_columns": ["year"]
+    },
+    "ExportBookings": {
+        "int_columns": ["container_size", "container_count", "freight_rate", "teu"],
+        "date_columns": ["cargo_readiness", "etd", "eta", "booking_date", "sob"]
+    },
+    "ImportBookings": {
+        "float_columns": ["freight_rate"],
+        "int_columns": ["container_size", "container_count", "teu"],
+        "date_columns": ["etd", "eta", "booking_date", "sob"]
+    },
+    "CompletedRepackagesReport": {
+        "int_columns": [
+            "warehouse_wms_count", "inspection_container_count", "import_teu", "import_container_count", "export_teu",
+            "export_container_count"
+        ],
+        "date_columns": ["repacking_date"]
+    },
+    "AutoVisits": {
+        "int_columns": ["processing_time", "waiting_time"],
+        "date_columns": ["exit_datetime", "entry_datetime", "registration_datetime"],
+        "is_datetime": True
+    },
+    "AccountingDocumentsRequests": {
+        "date_columns": ["start_date", "end_date", "request_date"],
+        "is_datetime": True
+    },
+    "DailySummary": {
+        "float_columns": ["tonnage", "cargo_weight", "tare_weight"],
+        "int_columns": ["container_size"],
+        "date_columns": ["motion_date"],
+        "is_datetime": True
+    },
+    "RZHDOperationsReport": {
+        "int_columns": ["container_size", "operation_month", "operation_year"],
+        "date_columns": [
+            "operation_date", "departure_date", "arrival_date", "planned_start_date", "planned_end_date",
+            "fact_start_date", "fact_end_date"
+        ]
+    },
+    "OrdersMarginalityReport": {
+        "float_columns": [
+            "expenses_rental_without_vat_fact", "income_without_vat_fact", "profit_plan", "income_without_vat_plan",
+            "expenses_without_vat_plan", "expenses_without_vat_fact", "profit_fact"
+        ],
+        "date_columns": ["order_creation_date"]
+    },
+    "NaturalIndicatorsRailwayReceptionDispatch": {
+        "int_columns": ["container_size", "container_count", "teu", "internal_customs_transit"],
+        "date_columns": ["date"]
+    },
+    "Accounts": {
+        "float_columns": ["profit_account_rub", "profit_account"],
+        "date_columns": ["date"]
+    },
+    "FreightRates": {
+        "float_columns": ["rate"],
+        "int_columns": ["oversized_width", "oversized_height", "oversized_length"],
+        "date_columns": ["expiration_date", "start_date"],
+        "bool_columns": ["priority", "oversized", "dangerous", "special_rate", "guideline"]
+    },
+    "MarginalityOrdersActDate": {
+        "float_columns": [
+            "profit_plan", "variable_costs_plan", "margin_plan", "profit_fact", "variable_costs_fact", "margin_fact",
+            "margin_fact_percent", "margin_fact_per_unit"
+        ],
+        "int_columns": ["count_ktk_by_order", "count_ktk_by_operation"],
+        "date_columns": ["act_creation_date", "act_creation_date_max"]
+    },
+    "RusconProducts": {
+        "float_columns": [
+            "kp_amount", "kp_margin", "kp_margin_amount", "kp_margin_container", "kp_amount_cost",
+            "kp_revenue_rate_container", "kp_cost_container"
+        ],
+        "int_columns": ["container_count_40", "container_count_20", "container_count"],
+        "date_columns": ["kp_date"],
+        "bool_columns": ["dangerous"]
+    },
+    "ReferenceLocations": {
+        "float_columns": ["lat_port", "long_port"],
+        "bool_columns": ["is_border_crossing"]
+    },
+    "TerminalsCapacity": {
+        "int_columns": ["container_size", "teu", "container_count"],
+        "date_columns": ["date"]
+    },
+    "RegisterOrders": {
+        "int_columns": ["transport_units_plan", "container_dc_plan", "container_hc_plan"],
+        "date_columns": ["order_date", "last_update_order", "sales_start_date", "sales_end_date"],
+        "bool_columns": ["is_multimodality"]
+    },
+    "RegisterOrdersSegment": {
+        "date_columns": ["planned_start_date", "planned_end_date", "fact_start_date", "fact_end_date"]
+    },
+    "RegisterOrdersFinancialSpending": {
+        "float_columns": ["amount", "amount_excluding_vat"]
+    },
+    "RegisterOrdersMarginalIncome": {
+        "float_columns": [
+            "income_plan", "income_fact", "spending_plan", "spending_fact", "md_plan", "md_fact", "md_plan_percentage",
+            "md_fact_percentage"
+        ]
+    },
+    "ManagerEvaluation": {
+        "int_columns": ["evaluation"],
+        "date_columns": ["evaluation_date"]
+    },
+    "ReferenceCounterparties": {
+        "bool_columns": ["is_control", "is_foreign_company"]
+    },
+    "ReferenceContracts": {
+        "date_columns": [
+            "date_of_creation", "approvals_date", "signing_date", "returned_archive_date", "date_tripartite_agreement"
+        ],
+        "bool_columns": ["returned_archive", "additional_agreement"]
+    },
+    "Staff": {
+        "date_columns": ["employment_date", "dismissal_date"],
+        "bool_columns": ["pluralist", "is_main_jobtitle"]
+    }
+}
+
+VALUES: list = [
+    None, "", "Да", "нет", "ДА", "1 234,5", "12", " 12 ", 7, 0, 2.5, True, False, "abc", "1,2,3",
+    "2024-05-27T07:33:31", "27.05.2024", "01.02.1900", "01.02.1900 10:00:00"
+]
+
+
+def change_columns_legacy(data_core: DataCoreClient, data: dict) -> None:
+    """
+    Converts the row as change_columns of the table converted it row by row.
+
+    :param data_core: The table.
+    :param data: The row.
+    :return: None
+    """
+    columns: dict = LEGACY_CONVERSIONS.get(type(data_core).__name__, {})
+    for column in columns.get("float_columns", []):
+        data[column] = float(
+            re.sub(r'(?<=\d)\s+(?=\d)', '', str(data.get(column))).replace(",", ".")
+        ) if data.get(column) else None
+    for column in columns.get("int_columns", []):
+        data[column] = int(re.sub(r'(?<=\d)\s+(?=\d)', '', str(data.get(column)))) if data.get(column) else None
+    for column in columns.get("date_columns", []):
+        data[column] = data_core.convert_format_date(
+            data.get(column), data, column, is_datetime=columns.get("is_datetime", False)
+        ) if data.get(column) else None
+    for column in columns.get("bool_columns", []):
+        if isinstance(data.get(column), str):
+            data[column] = data.get(column).upper() == 'ДА'
+    if type(data_core).__name__ == "DataCoreFreight":
+        data['voyage_month'] = data['voyage_month'].month if data.get('voyage_month') else None
+    if type(data_core).__name__ == "Staff":
+        data.pop('uuid', None)
+
+
+def convert(function: Any, *args: Any) -> Any:
+    """
+    Calls the conversion and returns the type of the exception instead of raising it.
+
+    :return: None or the type of the exception.
+    """
+    try:
+        function(*args)
+    except Exception as e:
+        return type(e)
+    return None
+
+
+@pytest.mark.parametrize("table_class", CLASSES, ids=lambda table_class: table_class.__name__)
+def test_conversion_plan_matches_change_columns(table_class: type) -> None:
+    """
+    Tests that the conversion plan of the table converts every column as change_columns
+    of the table converted it row by row: the empty values, the bool strings, the numbers
+    with spaces and commas, the bad numbers and the dates before 1925.
+
+    :param table_class: The class of the table.
+    :return: None
+    """
+    data_core: DataCoreClient = table_class(MagicMock())
+    legacy: dict = LEGACY_CONVERSIONS.get(table_class.__name__, {})
+    columns: list = [column for key in ("float_columns", "int_columns", "date_columns", "bool_columns")
+                     for column in legacy.get(key, [])]
+    empty_row: dict = dict.fromkeys(columns + ["uuid", "key_id"])
+    if data_core.original_date_string:
+        empty_row[data_core.original_date_string] = ""
+
+    expected_rows: list = []
+    for column in columns or ["key_id"]:
+        for value in VALUES:
+            row: dict = dict(empty_row, **{column: value})
+            expected: dict = copy.deepcopy(row)
+            actual: dict = copy.deepcopy(row)
+            error: Any = convert(change_columns_legacy, data_core, expected)
+            assert convert(data_core.conversion_plan.apply, actual, data_core) is error, (column, value)
+            if error is None:
+                assert actual == expected, (column, value)
+                expected_rows.append((row, expected))
+
+    rows: list = [copy.deepcopy(row) for row, _ in expected_rows]
+    data_core.conversion_plan.apply_columns(rows, data_core)
+    assert rows == [expected for _, expected in expected_rows]
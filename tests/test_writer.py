@@ -0,0 +1,57 @@
+import os
+from unittest.mock import MagicMock
+
+os.environ['XL_IDP_PATH_RABBITMQ'] = '../.'
+os.environ['XL_IDP_ROOT_RABBITMQ'] = '../.'
+
+from scripts.writer import Batch, BatchWriter
+
+
+def get_batch(data_core: MagicMock, delivery_tags: list) -> Batch:
+    return Batch(data_core, ["key"], ["key_id"], [["key"]], delivery_tags)
+
+
+def test_batch_writer() -> None:
+    """
+    Tests that the batches are written in the background in order
+    and the last written delivery tag is reported to the consumer.
+
+    :return: None
+    """
+    data_core: MagicMock = MagicMock()
+    client: MagicMock = MagicMock()
+    writer: BatchWriter = BatchWriter(lambda: client, max_batches=1)
+
+    writer.submit(get_batch(data_core, [1, 2]))
+    writer.submit(get_batch(data_core, [3]))
+    assert writer.unacked_messages == 3
+    assert writer.pop_written(wait=True) == 3
+    assert writer.unacked_messages == 0
+    assert writer.error is None
+    assert all(call.args[0] is client for call in data_core.write_batch.call_args_list)
+    assert [call.args[1].delivery_tags for call in data_core.write_batch.call_args_list] == [[1, 2], [3]]
+    writer.close()
+
+
+def test_batch_writer_failure() -> None:
+    """
+    Tests that the batches after a failed one are not written until the writer is reset,
+    and that only the batches written before the failure are reported.
+
+    :return: None
+    """
+    data_core: MagicMock = MagicMock()
+    data_core.write_batch.side_effect = [None, ConnectionError("ClickHouse is down"), None, None]
+    writer: BatchWriter = BatchWriter(MagicMock)
+
+    writer.submit(get_batch(data_core, [1]))
+    writer.submit(get_batch(data_core, [2]))
+    writer.submit(get_batch(data_core, [3]))
+    assert writer.last_delivery_tag == 3
+    assert writer.reset() == 1
+    assert data_core.write_batch.call_count == 2
+    assert writer.error is None
+
+    writer.submit(get_batch(data_core, [4]))
+    assert writer.pop_written(wait=True) == 4
+    writer.close()